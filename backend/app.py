@@ -1,66 +1,115 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Blueprint, Request, current_app, request, jsonify, send_from_directory
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_jwt_extended import (JWTManager, create_access_token, jwt_required, get_jwt_identity, get_jwt,
+                                get_jwt_request_location)
 from werkzeug.utils import secure_filename
 import os
 from datetime import datetime, timedelta
 import sqlite3
 import json
-from PIL import Image, ImageDraw, ImageFont
-import requests
+import importlib
+import shutil
+import multiprocessing
+import threading
 import uuid
-import base64
-from io import BytesIO
-import requests
+import time
 from dotenv import load_dotenv
 
+try:
+    import fcntl
+except ImportError:  # Windows: a single dev server, nothing to lock against
+    fcntl = None
+
 load_dotenv()
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
-app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'jwt-secret-key')
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
 
 DATA_DIR = os.getenv('DATA_DIR', '.')
 # Configure upload settings
 UPLOAD_FOLDER = os.path.join(DATA_DIR, 'uploads')
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'tif', 'tiff'}
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
+# Flight videos (POST /api/videos) are spooled to disk while they upload
+MAX_VIDEO_SIZE = int(os.getenv('MAX_VIDEO_SIZE_MB', '1024')) * 1024 * 1024
+VIDEO_FRAME_QUALITY = 92
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
-    
-# Initialize extensions
-# CORS: always allow browser access to API routes from any origin.
-# This avoids preflight failures when calling the backend from the hosted frontend.
-CORS(
-    app,
-    resources={r"/api/*": {"origins": "*"}},
-    allow_headers=['Content-Type', 'Authorization'],
-    methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
-    supports_credentials=False,
-)
-jwt = JWTManager(app)
-
-# Create upload directory if it doesn't exist
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
-# Roboflow API configuration  
-ROBOFLOW_API_URL = "https://serverless.roboflow.com"
-ROBOFLOW_API_KEY = os.getenv('ROBOFLOW_API_KEY')
-ROBOFLOW_MODEL_ID = "agridroneinsightdetection-zcptl/4"  # Always use v4 model for consistent results
-ROBOFLOW_CONFIDENCE = int(os.getenv('ROBOFLOW_CONFIDENCE', '50'))
-ROBOFLOW_OVERLAP = int(os.getenv('ROBOFLOW_OVERLAP', '30'))
-ROBOFLOW_IMAGE_SIZE = int(os.getenv('ROBOFLOW_IMAGE_SIZE', '2048'))
+# Server-Sent Events: streams per worker, and how long one lasts before the browser reconnects
+SSE_MAX_STREAMS = int(os.getenv('SSE_MAX_STREAMS', '6'))
+SSE_STREAM_SECONDS = int(os.getenv('SSE_STREAM_SECONDS', '300'))
+SSE_KEEPALIVE_SECONDS = 15
+SSE_RETRY_MS = 3000
+# EventSource cannot send headers, so streams are opened with a short-lived token in the URL
+SSE_TOKEN_SECONDS = int(os.getenv('SSE_TOKEN_SECONDS', '60'))
+
+# Bump whenever init_db() changes; databases at this version skip it on startup
+SCHEMA_VERSION = 8
+
+# Only light modules are imported here.  numpy, Pillow, requests and the worker
+# pools (inference_backends, image_pool, geometry, metadata, ground_area, stats,
+# maintenance) are imported where they are used, so a new worker answers
+# /api/health before any of them has loaded.
+from passwords import hash_password, verify_password, HashingBusy
+from rate_limit import check_auth_rate
+from events import (init_events, ensure_event_tables, publish, subscribe, subscriber_count,
+                    events_since, format_sse)
+from storage import upload_path, resolve_upload
+from health import readiness
+from compression import init_compression, negotiate_encoding, compress_stream
+from fast_json import json_response
+from user_cache import init_user_cache, get_user, invalidate_user, is_token_revoked, revoke_token, revoke_all_tokens
 
 DB_PATH = os.path.join(DATA_DIR, 'agridrone.db')
 
+api = Blueprint('api', __name__)
+jwt = JWTManager()
+
+# Helpers that scripts still import from app; loaded on first use
+_LAZY_EXPORTS = {
+    'ROBOFLOW_API_KEY': 'inference_backends',
+    'ROBOFLOW_MODEL_ID': 'inference_backends',
+    'ROBOFLOW_CONFIDENCE': 'inference_backends',
+    'ROBOFLOW_OVERLAP': 'inference_backends',
+    'ROBOFLOW_IMAGE_SIZE': 'inference_backends',
+    'call_roboflow_inference': 'inference_backends',
+    'resize_image_for_api': 'image_processing',
+    'draw_predictions_on_image': 'image_processing',
+}
+
+def __getattr__(name):
+    if name in _LAZY_EXPORTS:
+        return getattr(importlib.import_module(_LAZY_EXPORTS[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Resolve every JWT to a (cached) user record and reject revoked tokens
+@jwt.user_lookup_loader
+def load_jwt_user(jwt_header, jwt_data):
+    return get_user(jwt_data['sub'])
+
+@jwt.token_in_blocklist_loader
+def check_token_revoked(jwt_header, jwt_data):
+    return is_token_revoked(jwt_data)
+
+# Stream tokens (POST /api/events/token) open /api/events and nothing else
+@jwt.token_verification_loader
+def check_token_scope(jwt_header, jwt_data):
+    return jwt_data.get('scope') != 'events' or request.endpoint == 'api.stream_events'
+
 def init_db():
     """Initialize the database with required tables"""
+    from geometry import ensure_spatial_tables, backfill_field_index
+    from ground_area import ensure_area_tables
+    from stats import ensure_stats_tables, rebuild_stats
+    from maintenance import ensure_maintenance_tables
+    from video_ingest import ensure_video_tables
+    from perceptual_hash import ensure_hash_tables
+    from multiframe import ensure_frame_tables
+    from raster_ingest import ensure_raster_tables
+
     os.makedirs(DATA_DIR, exist_ok=True)
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
+    # New databases can give freed pages back incrementally (see maintenance.py)
+    cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    
     # Users table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -90,9 +139,117 @@ def init_db():
         )
     ''')
     
+    # Revoked JWTs (logout); rows can be dropped once expires_at has passed
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS revoked_tokens (
+            jti TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            expires_at INTEGER,
+            revoked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    ensure_maintenance_tables(cursor)
+    ensure_event_tables(cursor)
+    
+    # Field geometries + R*Tree of their bounding boxes (see geometry.py)
+    if ensure_spatial_tables(cursor):
+        backfill_field_index(cursor)
+    
+    # Per-class detected area of each analysis (see ground_area.py)
+    ensure_area_tables(cursor)
+    
+    # Flight videos split into analyzed frames (see video_ingest.py)
+    ensure_video_tables(cursor)
+    
+    # Multi-index of upload hashes for near-duplicate search (see perceptual_hash.py)
+    ensure_hash_tables(cursor)
+    
+    # Per-frame predictions of animated GIFs and multi-page TIFFs (see multiframe.py)
+    ensure_frame_tables(cursor)
+    
+    # Chunked raster uploads and their per-tile predictions (see raster_ingest.py)
+    ensure_raster_tables(cursor)
+    
+    # Daily rollups behind /api/stats (see stats.py)
+    if ensure_stats_tables(cursor):
+        rebuild_stats(cursor, analysis_date)
+    
+    # Columns added after the first release; existing databases get them in place
+    add_missing_columns(cursor, 'users', {
+        'tokens_valid_after': 'INTEGER',
+    })
+    add_missing_columns(cursor, 'analysis_records', {
+        'inference_size': 'INTEGER',
+        'latitude': 'REAL',
+        'longitude': 'REAL',
+        # Extracted from EXIF/XMP at upload (see metadata.py)
+        'captured_at': 'TEXT',
+        'altitude_m': 'REAL',
+        'relative_altitude_m': 'REAL',
+        'camera_model': 'TEXT',
+        'focal_length_mm': 'REAL',
+        'image_metadata': 'TEXT',
+        'gsd_cm': 'REAL',
+        # Encoding of the annotated image (see image_processing.save_annotation)
+        'annotation_format': 'TEXT',
+        'annotation_bytes': 'INTEGER',
+        'annotation_encode_ms': 'REAL',
+        # Frames of a flight video (see video_ingest.py)
+        'video_id': 'INTEGER',
+        'video_time_s': 'REAL',
+        # Near-duplicate detection (see perceptual_hash.py)
+        'phash': 'INTEGER',
+        'duplicate_of': 'INTEGER',
+        # Frames/pages in the upload (see multiframe.py)
+        'frame_count': 'INTEGER',
+    })
+    # Worker that owns an ingest, for recovery after a restart (see recover_interrupted_work)
+    add_missing_columns(cursor, 'raster_ingests', {
+        'worker': 'INTEGER',
+        'attempts': 'INTEGER NOT NULL DEFAULT 0',
+    })
+    add_missing_columns(cursor, 'video_ingests', {
+        'source_file': 'TEXT',
+        'worker': 'INTEGER',
+    })
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_analysis_records_user_captured ON analysis_records (user_id, captured_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_analysis_records_camera ON analysis_records (camera_model)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_analysis_records_video ON analysis_records (video_id, video_time_s)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_analysis_records_user_phash ON analysis_records (user_id, phash)')
+    
+    cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
     conn.commit()
     conn.close()
 
+def init_schema():
+    """Run init_db() once per database rather than in every worker.
+
+    The first worker to start takes a file lock and migrates; the others wait
+    for it and then find PRAGMA user_version already at SCHEMA_VERSION.
+    """
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    with open(os.path.join(DATA_DIR, '.schema.lock'), 'a') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)  # released when the file is closed
+        conn = sqlite3.connect(DB_PATH)
+        try:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+        finally:
+            conn.close()
+        if version < SCHEMA_VERSION:
+            started = time.perf_counter()
+            init_db()
+            print(f"✅ Database schema initialized in {time.perf_counter() - started:.2f}s")
+
+def add_missing_columns(cursor, table, columns):
+    """ALTER TABLE ADD COLUMN for every column in ``columns`` the table lacks"""
+    existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    for name, definition in columns.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+            print(f"✅ Added {table}.{name} column")
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -101,335 +258,7 @@ def get_db_connection():
     conn.row_factory = sqlite3.Row
     return conn
 
-def resize_image_for_api(input_path, max_size=1024):
-    """Resize image to be under the API limit while maintaining aspect ratio"""
-    try:
-        with Image.open(input_path) as img:
-            print(f"📐 Original size: {img.size}")
-            
-            # Calculate new size maintaining aspect ratio
-            width, height = img.size
-            
-            if width > max_size or height > max_size:
-                if width > height:
-                    new_width = max_size
-                    new_height = int((height * max_size) / width)
-                else:
-                    new_height = max_size
-                    new_width = int((width * max_size) / height)
-                
-                # Resize image
-                resized_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                
-                # Save resized image
-                base_name = os.path.splitext(input_path)[0]
-                output_path = f"{base_name}_resized.jpg"
-                resized_img.save(output_path, "JPEG", quality=85)
-                
-                print(f"📐 Resized to: {new_width}x{new_height}")
-                return output_path
-            else:
-                print("📐 Image size is good, no resizing needed")
-                return input_path
-                
-    except Exception as e:
-        print(f"❌ Resize error: {str(e)}")
-        return input_path  # Return original if resize fails
-
-def call_roboflow_inference(image_path, model_id, confidence=None, overlap=None, image_size=None):
-    """Call Roboflow API using correct endpoint and image sizing"""
-    try:
-        print(f"Making inference call for model: {model_id}")
-        print(f"Image path: {image_path}")
-        
-        # Resize image for API if needed
-        target_size = int(image_size or ROBOFLOW_IMAGE_SIZE)
-        resized_path = resize_image_for_api(image_path, max_size=target_size)
-        print(f"Using resized image: {resized_path}")
-        
-        # Use correct endpoint - detect.roboflow.com works!
-        api_endpoint = f"https://detect.roboflow.com/{model_id}"
-        
-        # Prepare the request with correct file parameter
-        with open(resized_path, 'rb') as image_file:
-            files = {'file': ('image.jpg', image_file, 'image/jpeg')}  # Changed from 'image' to 'file'
-            params = {
-                'api_key': ROBOFLOW_API_KEY,
-                'confidence': str(int(confidence or ROBOFLOW_CONFIDENCE)),
-                'overlap': str(int(overlap or ROBOFLOW_OVERLAP)),
-                'image_size': str(target_size),
-                'format': 'json'
-            }
-            
-            print(f"Making request to: {api_endpoint}")
-            print(f"API Key (first 10 chars): {ROBOFLOW_API_KEY[:10]}...")
-            
-            # Make the API call with extended timeout for processing
-            print(f"🚀 Starting API request... (this may take 30-60 seconds)")
-            response = requests.post(
-                api_endpoint,
-                files=files,
-                params=params,
-                timeout=120  # Increased to 2 minutes for processing time
-            )
-            
-        print(f"Response status code: {response.status_code}")
-        print(f"Response headers: {dict(response.headers)}")
-        
-        if response.status_code == 200:
-            result = response.json()
-            print(f"Inference successful!")
-            print(f"Result keys: {list(result.keys()) if isinstance(result, dict) else 'Not a dict'}")
-            return result
-        else:
-            print(f"API Error: {response.status_code}")
-            print(f"Response text: {response.text}")
-            
-            # Try alternative format with base64 encoding
-            return call_roboflow_inference_base64(image_path, model_id, confidence=confidence, overlap=overlap, image_size=image_size)
-            
-    except Exception as e:
-        print(f"Multipart inference call failed: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        
-        # Try alternative format with base64 encoding
-        return call_roboflow_inference_base64(image_path, model_id)
-
-def call_roboflow_inference_base64(image_path, model_id, confidence=None, overlap=None, image_size=None):
-    """Alternative Roboflow API call using base64 encoding"""
-    try:
-        print(f"Trying base64 inference for model: {model_id}")
-        
-        # Read and encode image as base64
-        with open(image_path, 'rb') as image_file:
-            image_data = image_file.read()
-            image_b64 = base64.b64encode(image_data).decode('utf-8')
-        
-        # Use correct endpoint for base64 as well
-        api_endpoint = f"https://detect.roboflow.com/{model_id}"
-        
-        # Prepare headers and data
-        headers = {
-            'Content-Type': 'application/x-www-form-urlencoded'
-        }
-        
-        target_size = int(image_size or ROBOFLOW_IMAGE_SIZE)
-        params = {
-            'api_key': ROBOFLOW_API_KEY,
-            'confidence': str(int(confidence or ROBOFLOW_CONFIDENCE)),
-            'overlap': str(int(overlap or ROBOFLOW_OVERLAP)),
-            'image_size': str(target_size),
-            'format': 'json'
-        }
-        
-        print(f"Making base64 request to: {api_endpoint}")
-        
-        # Make the API call with extended timeout
-        print(f"🚀 Starting base64 API request... (this may take 30-60 seconds)")
-        response = requests.post(
-            api_endpoint,
-            data=image_b64,
-            headers=headers,
-            params=params,
-            timeout=120  # Increased timeout
-        )
-        
-        print(f"Base64 response status code: {response.status_code}")
-        
-        if response.status_code == 200:
-            result = response.json()
-            print(f"Base64 inference successful!")
-            print(f"Result keys: {list(result.keys()) if isinstance(result, dict) else 'Not a dict'}")
-            return result
-        else:
-            print(f"Base64 API Error: {response.status_code}")
-            print(f"Response text: {response.text}")
-            return None
-            
-    except Exception as e:
-        print(f"Base64 inference call failed: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return None
-
-def draw_predictions_on_image(image_path, predictions, output_path):
-    """Draw instance segmentation polygons and labels exactly like Roboflow interface"""
-    try:
-        # Open the original image
-        image = Image.open(image_path).convert('RGB')
-        draw = ImageDraw.Draw(image)
-        
-        # Get image dimensions
-        img_width, img_height = image.size
-        
-        # EXACT Roboflow class colors from your screenshots
-        colors = {
-            'healthy corn field area': (0, 255, 0),           # Green - for healthy areas
-            'disease corn field area': (255, 255, 0),         # Yellow - for disease areas  
-            'damage-pest corn field area': (255, 0, 0),       # Red - for damage/pest areas
-            'damage pest corn field area': (255, 0, 0),       # Red - alternative naming
-            'downy mildew disease': (255, 171, 0),
-            'northern corn leaf blight disease': (0, 128, 255),
-            'southern corn leaf blight disease': (255, 128, 0),
-            'default': (0, 255, 255)  # Cyan for unknown
-        }
-        
-        # Outline colors (darker for visibility)
-        outline_colors = {
-            'healthy corn field area': (0, 180, 0),           # Dark green outline
-            'disease corn field area': (200, 200, 0),         # Dark yellow outline
-            'damage-pest corn field area': (180, 0, 0),       # Dark red outline
-            'damage pest corn field area': (180, 0, 0),       # Dark red outline
-            'downy mildew disease': (200, 134, 0),
-            'northern corn leaf blight disease': (0, 90, 180),
-            'southern corn leaf blight disease': (180, 90, 0),
-            'default': (0, 180, 180)  # Dark cyan outline
-        }
-        
-        # Try to load a font
-        try:
-            font_size = max(16, min(32, img_width // 50))
-            font = ImageFont.truetype("arial.ttf", font_size)
-        except:
-            try:
-                font = ImageFont.load_default()
-            except:
-                font = None
-        
-        print(f"Drawing {len(predictions)} segmentation masks on image {img_width}x{img_height}")
-        
-        # Draw each prediction
-        for i, prediction in enumerate(predictions):
-            class_name = prediction.get('class', 'Unknown')
-            confidence = prediction.get('confidence', 0)
-            
-            print(f"Processing prediction {i+1}: {class_name} with confidence {confidence:.3f}")
-            
-            # Check if this is instance segmentation (has points)
-            if 'points' in prediction and prediction['points']:
-                points = prediction['points']
-                print(f"Found {len(points)} polygon points for segmentation")
-                
-                # Convert points to PIL format
-                polygon_points = []
-                for point in points:
-                    x = max(0, min(point['x'], img_width - 1))
-                    y = max(0, min(point['y'], img_height - 1))
-                    polygon_points.append((x, y))
-                
-                if len(polygon_points) >= 3:  # Need at least 3 points for a polygon
-                    # Get colors
-                    class_key = class_name.lower()
-                    fill_color = colors.get(class_key, colors['default'])
-                    outline_color = outline_colors.get(class_key, outline_colors['default'])
-                    
-                    # Create transparent overlay for filled polygon like Roboflow
-                    polygon_overlay = Image.new('RGBA', image.size, (0, 0, 0, 0))
-                    poly_draw = ImageDraw.Draw(polygon_overlay)
-                    
-                    # Draw semi-transparent filled polygon
-                    transparent_fill = fill_color + (80,)  # Add transparency
-                    poly_draw.polygon(polygon_points, fill=transparent_fill)
-                    
-                    # Composite the overlay onto the main image
-                    image = Image.alpha_composite(image.convert('RGBA'), polygon_overlay).convert('RGB')
-                    draw = ImageDraw.Draw(image)  # Refresh draw object
-                    
-                    # Draw thick outline polygon like Roboflow
-                    draw.polygon(polygon_points, outline=outline_color, width=4)
-                    
-                    # Calculate label position (centroid of polygon)
-                    if polygon_points:
-                        center_x = sum(p[0] for p in polygon_points) // len(polygon_points)
-                        center_y = sum(p[1] for p in polygon_points) // len(polygon_points)
-                        
-                        # Create label
-                        label = f"{class_name} {confidence:.0%}"
-                        
-                        # Enhanced label drawing like Roboflow
-                        if font:
-                            bbox = draw.textbbox((0, 0), label, font=font)
-                            label_width = bbox[2] - bbox[0] 
-                            label_height = bbox[3] - bbox[1]
-                        else:
-                            label_width = len(label) * 10  # Bigger default size
-                            label_height = 16
-                        
-                        # Position label around polygon centroid and clamp to image bounds
-                        label_x = center_x - label_width // 2
-                        label_y = center_y - label_height // 2
-                        label_x = max(5, min(label_x, img_width - label_width - 5))
-                        label_y = max(5, min(label_y, img_height - label_height - 5))
-                        
-                        # Draw prominent label background like Roboflow
-                        padding = 6
-                        bg_rect = [
-                            label_x - padding, 
-                            label_y - padding,
-                            label_x + label_width + padding, 
-                            label_y + label_height + padding
-                        ]
-                        
-                        # Class-colored background with black border
-                        draw.rectangle(bg_rect, fill=fill_color, outline=(0, 0, 0), width=2)
-                        
-                        # Draw bold black text like Roboflow
-                        if font:
-                            draw.text((label_x, label_y), label, fill=(0, 0, 0), font=font)
-                        else:
-                            draw.text((label_x, label_y), label, fill=(0, 0, 0))
-                    
-                    print(f"Drew segmentation mask with {len(polygon_points)} points")
-                else:
-                    print(f"Not enough points ({len(polygon_points)}) to draw polygon")
-            
-            else:
-                # Fallback to bounding box if no segmentation points
-                print("No segmentation points found, drawing bounding box instead")
-                x = prediction.get('x', 0)
-                y = prediction.get('y', 0)
-                width = prediction.get('width', 0)
-                height = prediction.get('height', 0)
-                
-                if width > 0 and height > 0:
-                    left = x - width / 2
-                    top = y - height / 2
-                    right = x + width / 2
-                    bottom = y + height / 2
-                    
-                    # Clamp to image bounds
-                    left = max(0, min(left, img_width))
-                    top = max(0, min(top, img_height))
-                    right = max(0, min(right, img_width))
-                    bottom = max(0, min(bottom, img_height))
-                    
-                    class_key = class_name.lower()
-                    outline_color = outline_colors.get(class_key, outline_colors['default'])
-                    
-                    # Draw bounding box
-                    draw.rectangle([left, top, right, bottom], outline=outline_color, width=3)
-        
-        # Save the annotated image
-        image.save(output_path, quality=95, format='JPEG')
-        print(f"✅ Annotated image saved to: {output_path}")
-        
-        # Verify file was created
-        if os.path.exists(output_path):
-            file_size = os.path.getsize(output_path)
-            print(f"📁 File size: {file_size} bytes")
-            return True
-        else:
-            print("❌ File was not created!")
-            return False
-        
-    except Exception as e:
-        print(f"Error drawing segmentation: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return False
-
-@app.route('/api/register', methods=['POST'])
+@api.route('/api/register', methods=['POST'])
 def register():
     try:
         data = request.get_json()
@@ -440,7 +269,11 @@ def register():
         if not all([username, email, password]):
             return jsonify({'error': 'All fields are required'}), 400
         
-        password_hash = generate_password_hash(password)
+        wait = check_auth_rate(request)
+        if wait:
+            return too_many_attempts(wait)
+        
+        password_hash = hash_password(password)
         
         conn = get_db_connection()
         try:
@@ -450,6 +283,7 @@ def register():
                 (username, email, password_hash)
             )
             conn.commit()
+            invalidate_user(cursor.lastrowid)
             
             access_token = create_access_token(identity=str(cursor.lastrowid))
             return jsonify({
@@ -472,10 +306,12 @@ def register():
         finally:
             conn.close()
             
+    except HashingBusy:
+        return server_busy()
     except Exception as e:
         return jsonify({'error': 'Registration failed'}), 500
 
-@app.route('/api/login', methods=['POST'])
+@api.route('/api/login', methods=['POST'])
 def login():
     try:
         data = request.get_json()
@@ -485,13 +321,27 @@ def login():
         if not all([username, password]):
             return jsonify({'error': 'Username and password are required'}), 400
         
+        wait = check_auth_rate(request, account=username)
+        if wait:
+            return too_many_attempts(wait)
+        
         conn = get_db_connection()
         user = conn.execute(
             'SELECT * FROM users WHERE username = ?', (username,)
         ).fetchone()
         conn.close()
         
-        if user and check_password_hash(user['password_hash'], password):
+        valid, new_hash = verify_password(user['password_hash'], password) if user else (False, None)
+        
+        if valid:
+            if new_hash:
+                # KDF parameters changed since this hash was made; upgrade it transparently
+                conn = get_db_connection()
+                conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', (new_hash, user['id']))
+                conn.commit()
+                conn.close()
+                invalidate_user(user['id'])
+            
             access_token = create_access_token(identity=str(user['id']))
             return jsonify({
                 'message': 'Login successful',
@@ -505,192 +355,1311 @@ def login():
         else:
             return jsonify({'error': 'Invalid credentials'}), 401
             
+    except HashingBusy:
+        return server_busy()
     except Exception as e:
         return jsonify({'error': 'Login failed'}), 500
 
-@app.route('/api/analyze', methods=['POST'])
+@api.route('/api/logout', methods=['POST'])
+@jwt_required()
+def logout():
+    try:
+        data = request.get_json(silent=True) or {}
+        if data.get('all'):
+            revoke_all_tokens(get_jwt_identity())
+        else:
+            revoke_token(get_jwt())
+        return jsonify({'message': 'Logged out'}), 200
+    except Exception as e:
+        return jsonify({'error': 'Logout failed'}), 500
+
+def too_many_attempts(wait):
+    response = jsonify({'error': 'Too many attempts. Please try again shortly.'})
+    response.headers['Retry-After'] = str(max(1, int(wait + 0.999)))
+    return response, 429
+
+def server_busy():
+    response = jsonify({'error': 'Server is busy. Please try again shortly.'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+class AnalysisRejected(Exception):
+    """An upload that fails validation (reported to the client as-is)"""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+# The analysis pipeline is split into stages so that the WSGI route below and
+# the ASGI entry point (asgi.py) share everything but the inference call:
+#   begin_analysis -> prepare_analysis -> backend inference -> finish_analysis
+# with fail_analysis/release_analysis for cleanup.
+
+def begin_analysis(user_id, form, files):
+    """Validate the upload, fill in metadata and save the original image"""
+    from metadata import read_metadata
+    from multiframe import frame_count
+
+    print(f"📊 Request analysis:")
+    print(f"   Files keys: {list(files.keys())}")
+    print(f"   Form keys: {list(form.keys())}")
+
+    # Check if image file is present (flexible key checking)
+    image_file = None
+    for key in ['image', 'file', 'drone_image']:
+        if key in files:
+            image_file = files[key]
+            print(f"   Found image with key: {key}")
+            break
+
+    if image_file is None:
+        raise AnalysisRejected('No image file provided. Available keys: ' + str(list(files.keys())), 422)
+
+    if image_file.filename == '':
+        raise AnalysisRejected('No file selected')
+
+    if not allowed_file(image_file.filename):
+        raise AnalysisRejected('Invalid file type. Only PNG, JPG, JPEG, GIF, TIFF allowed')
+
+    # EXIF/XMP from the upload's header bytes; fills in whatever the form left out
+    image_metadata = read_metadata(image_file.stream)
+    job = analysis_job(user_id, form, image_metadata)
+
+    # Save original image
+    filename = secure_filename(image_file.filename)
+    unique_filename = f"{uuid.uuid4()}_{filename}"
+    file_path = upload_path(UPLOAD_FOLDER, unique_filename)
+    image_file.save(file_path)
+
+    print(f"💾 Saved image to: {file_path}")
+    print(f"📏 File size: {os.path.getsize(file_path)} bytes")
+    publish(user_id, 'analysis.queued', job_id=job['job_id'], filename=filename)
+
+    job.update(unique_filename=unique_filename, file_path=file_path, frame_count=frame_count(file_path))
+    if job['frame_count'] > 1:
+        print(f"🎞️  {job['frame_count']} frames")
+    return job
+
+def analysis_job(user_id, form, image_metadata):
+    """Validate the analysis form fields; returns a job without a file yet
+
+    Fields the form leaves out are filled in from ``image_metadata`` (and
+    the user's fields containing the capture position).
+    """
+    from image_processing import INFERENCE_BUDGETS, ANNOTATION_FORMATS
+    from geometry import fields_containing
+    from perceptual_hash import DUPLICATE_REUSE_PREDICTIONS
+
+    # Get form data
+    drone_name = form.get('drone_name')
+    date_time = form.get('date_time')
+    location = form.get('location')
+    field_size = form.get('field_size')
+    flight_time = form.get('flight_time')
+
+    # Optional quality/latency trade-off for the inference resolution
+    inference_budget = form.get('inference_budget') or None
+    if inference_budget and inference_budget not in INFERENCE_BUDGETS and not inference_budget.isdigit():
+        raise AnalysisRejected(f"inference_budget must be one of {', '.join(INFERENCE_BUDGETS)} or a pixel size")
+
+    # Optional encoding of the annotated image; defaults to ANNOTATION_FORMAT/ANNOTATION_QUALITY
+    annotation_format = form.get('annotation_format') or None
+    if annotation_format and annotation_format not in ANNOTATION_FORMATS:
+        raise AnalysisRejected(f"annotation_format must be one of {', '.join(ANNOTATION_FORMATS)}")
+    annotation_quality = None
+    if form.get('annotation_quality'):
+        try:
+            annotation_quality = int(form.get('annotation_quality'))
+        except ValueError:
+            raise AnalysisRejected('annotation_quality must be a whole number from 1 to 100')
+        if not 1 <= annotation_quality <= 100:
+            raise AnalysisRejected('annotation_quality must be a whole number from 1 to 100')
+
+    # Near-duplicates of a recent upload can take its predictions instead of running inference
+    reuse_predictions = DUPLICATE_REUSE_PREDICTIONS
+    if form.get('reuse_predictions'):
+        reuse_predictions = str(form.get('reuse_predictions')).lower() in ('1', 'true', 'yes')
+
+    # Multi-frame uploads: analyze every n-th frame (default: spread over MULTIFRAME_MAX_FRAMES)
+    frame_step = None
+    if form.get('frame_step'):
+        try:
+            frame_step = int(form.get('frame_step'))
+        except ValueError:
+            raise AnalysisRejected('frame_step must be a positive whole number')
+        if not frame_step > 0:
+            raise AnalysisRejected('frame_step must be a positive whole number')
+
+    # Optional capture position; falls back to the image's GPS tags
+    coordinates = None
+    if form.get('latitude') or form.get('longitude'):
+        try:
+            coordinates = (float(form.get('latitude')), float(form.get('longitude')))
+        except (TypeError, ValueError):
+            raise AnalysisRejected('latitude and longitude must both be numbers')
+        if not (-90 <= coordinates[0] <= 90 and -180 <= coordinates[1] <= 180):
+            raise AnalysisRejected('latitude/longitude out of range')
+
+    # Optional ground sample distance (cm per pixel) for real-world areas
+    gsd_cm = None
+    if form.get('gsd_cm'):
+        try:
+            gsd_cm = float(form.get('gsd_cm'))
+        except ValueError:
+            raise AnalysisRejected('gsd_cm must be a positive number')
+        if not gsd_cm > 0:
+            raise AnalysisRejected('gsd_cm must be a positive number')
+
+    # Capture metadata fills in whatever the form left out
+    if coordinates is None and 'latitude' in image_metadata:
+        coordinates = (image_metadata['latitude'], image_metadata['longitude'])
+    if not drone_name and image_metadata.get('camera_model'):
+        drone_name = ' '.join(filter(None, [image_metadata.get('camera_make'), image_metadata['camera_model']]))
+    if not date_time and image_metadata.get('captured_at'):
+        date_time = image_metadata['captured_at']
+    if coordinates and not (location and field_size):
+        conn = get_db_connection()
+        containing = fields_containing(conn.cursor(), int(user_id), *coordinates)
+        conn.close()
+        if not location:
+            location = containing[0][1] if containing else f"{coordinates[0]:.6f}, {coordinates[1]:.6f}"
+        if not field_size and containing and containing[0][2]:
+            field_size = containing[0][2] / 4046.8564224
+
+    missing = [name for name, value in [('drone_name', drone_name), ('date_time', date_time),
+                                        ('location', location), ('field_size', field_size),
+                                        ('flight_time', flight_time)] if not value]
+    if missing:
+        raise AnalysisRejected(f"All form fields are required (missing: {', '.join(missing)})")
+
+    # Progress events go to the user's /api/events streams; clients may pick the job id
+    job_id = (form.get('job_id') or str(uuid.uuid4()))[:64]
+
+    return {
+        'user_id': user_id,
+        'job_id': job_id,
+        'drone_name': drone_name,
+        'date_time': date_time,
+        'location': location,
+        'field_size': field_size,
+        'flight_time': flight_time,
+        'coordinates': coordinates,
+        'gsd_cm': gsd_cm,
+        'inference_budget': inference_budget,
+        'annotation_format': annotation_format,
+        'annotation_quality': annotation_quality,
+        'reuse_predictions': reuse_predictions,
+        'image_metadata': image_metadata,
+        'unique_filename': None,
+        'file_path': None,
+        'video_id': None,
+        'video_time_s': None,
+        'duplicate_of': None,
+        'frame_count': 1,
+        'frame_step': frame_step,
+        'frames': None,
+        'backend': None,
+        'prepared': None,
+    }
+
+def prepare_analysis(job):
+    """Resize the saved image for the inference backend (in the image pool)"""
+    from inference_backends import ROBOFLOW_IMAGE_SIZE, get_inference_backend
+    from image_pool import prepare_upload
+
+    inference_backend = get_inference_backend()
+    job['backend'] = inference_backend
+    file_path = job['file_path']
+    print(f"Processing image: {file_path}")
+    print(f"Inference backend: {inference_backend.name} ({inference_backend.model_id})")
+
+    # Check if file exists
+    if not os.path.exists(file_path):
+        raise Exception(f"Image file not found: {file_path}")
+
+    # Prepare image to Roboflow UI image size (in the image pool) and call inference with explicit params
+    prepared = prepare_upload(file_path, ROBOFLOW_IMAGE_SIZE, native_size=inference_backend.native_size,
+                              budget=job['inference_budget'])
+    job['prepared'] = prepared
+    publish(job['user_id'], 'analysis.resized', job_id=job['job_id'], width=prepared.width,
+            height=prepared.height, inference_size=prepared.inference_size)
+    return prepared
+
+def match_duplicate(job):
+    """Look for a near-duplicate among the user's recent uploads
+
+    Records it in job['duplicate_of'].  Returns that analysis's predictions,
+    rescaled to this image, when the job asked to reuse them; otherwise None
+    and inference runs as usual.
+    """
+    from perceptual_hash import find_near_duplicate, scale_result
+
+    prepared = job['prepared']
+    if prepared.dhash is None:
+        return None
+    conn = get_db_connection()
+    try:
+        match = find_near_duplicate(conn, int(job['user_id']), prepared.dhash)
+        if match is None:
+            return None
+        job['duplicate_of'] = {'record_id': match[0], 'distance': match[1], 'predictions_reused': False}
+        print(f"🔎 Near-duplicate of analysis {match[0]} ({match[1]} bits apart)")
+        if not job['reuse_predictions']:
+            return None
+        row = conn.execute('SELECT analysis_result FROM analysis_records WHERE id = ?', (match[0],)).fetchone()
+    finally:
+        conn.close()
+    if row is None or not row['analysis_result']:
+        return None
+    job['duplicate_of']['predictions_reused'] = True
+    publish(job['user_id'], 'analysis.duplicate', job_id=job['job_id'], **job['duplicate_of'])
+    return scale_result(json.loads(row['analysis_result']), prepared.width, prepared.height)
+
+def analyze_frames(job, result):
+    """Analyze the other frames of a multi-frame upload (animated GIF, multi-page TIFF)
+
+    ``result`` is the first frame's, which the rest of the pipeline treats
+    as the image.  The sampled frames are decoded one at a time and share the
+    image pool and inference backend, MULTIFRAME_CONCURRENCY at a time.
+    Returns [{'index', 'width', 'height', 'predictions'}] (or 'error') for
+    every sampled frame, first frame included.
+    """
+    from inference_backends import ROBOFLOW_IMAGE_SIZE, ROBOFLOW_CONFIDENCE, ROBOFLOW_OVERLAP
+    from image_pool import prepare_upload
+    from multiframe import MULTIFRAME_CONCURRENCY, iter_frames, sample_indexes
+    from video_ingest import analyze_bounded
+
+    inference_backend = job['backend']
+    user_id, job_id = job['user_id'], job['job_id']
+    stem = os.path.splitext(job['file_path'])[0]
+    indexes = sample_indexes(job['frame_count'], step=job['frame_step'])
+
+    def analyze_frame(frame):
+        index, image = frame
+        frame_path = f"{stem}_frame{index}.jpg"
+        prepared = None
+        try:
+            image.save(frame_path, 'JPEG', quality=VIDEO_FRAME_QUALITY)
+            del image
+            prepared = prepare_upload(frame_path, ROBOFLOW_IMAGE_SIZE, native_size=inference_backend.native_size,
+                                      budget=job['inference_budget'])
+            frame_result = inference_backend.infer(prepared.path, confidence=ROBOFLOW_CONFIDENCE,
+                                                   overlap=ROBOFLOW_OVERLAP, image_size=prepared.inference_size)
+            if frame_result is None:
+                raise Exception(f"{inference_backend.name} inference failed")
+            predictions = frame_result.get('predictions') or []
+            publish(user_id, 'analysis.frame', job_id=job_id, index=index, predictions=len(predictions))
+            return {'index': index, 'width': prepared.width, 'height': prepared.height, 'predictions': predictions}
+        except Exception as e:
+            print(f"⚠️  Frame {index} failed: {str(e)}")
+            return {'index': index, 'error': str(e)}
+        finally:
+            if prepared is not None:
+                prepared.release()
+            for leftover in {frame_path, prepared.path if prepared else frame_path}:
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+
+    prepared = job['prepared']
+    first = {'index': 0, 'width': prepared.width, 'height': prepared.height,
+             'predictions': result.get('predictions') or []}
+    started = time.perf_counter()
+    frames = [first] + analyze_bounded(iter_frames(job['file_path'], indexes[1:]), analyze_frame,
+                                       MULTIFRAME_CONCURRENCY)
+    print(f"🎞️  Analyzed {len(frames)} of {job['frame_count']} frames in {time.perf_counter() - started:.1f}s")
+    return frames
+
+def finish_analysis(job, result):
+    """Annotate, store and describe an inference result; returns the response body"""
+    from image_pool import render_annotation
+    from image_processing import ANNOTATION_FORMAT, ANNOTATION_EXTENSIONS
+    from metadata import metadata_columns
+    from ground_area import ground_sample_distance, measure_predictions, store_class_areas
+    from stats import record_analysis
+    from geometry import index_analysis
+    from perceptual_hash import index_hash, to_signed
+    from multiframe import store_frames
+
+    inference_backend = job['backend']
+    prepared = job['prepared']
+    user_id, job_id = job['user_id'], job['job_id']
+    image_metadata = job['image_metadata']
+    coordinates = job['coordinates']
+    unique_filename = job['unique_filename']
+
+    if result is None:
+        raise Exception(f"{inference_backend.name} inference failed")
+
+    print(f"API Result keys: {result.keys() if isinstance(result, dict) else 'Not a dict'}")
+
+    if 'predictions' in result:
+        print(f"Found {len(result['predictions'])} predictions")
+    else:
+        print("No predictions key in result")
+    publish(user_id, 'analysis.inferred', job_id=job_id, predictions=len(result.get('predictions') or []))
+
+    # Real-world area per prediction and per class, when the GSD is known
+    gsd_m = ground_sample_distance(image_metadata, job['gsd_cm'])
+    class_areas = measure_predictions(result, image_metadata.get('width'), gsd_m)
+
+    # Create annotated image if predictions exist
+    annotated_image_path = None
+    annotation = None
+    annotation_format = job['annotation_format'] or ANNOTATION_FORMAT
+    annotated_filename = f"annotated_{os.path.splitext(unique_filename)[0]}{ANNOTATION_EXTENSIONS[annotation_format]}"
+
+    if 'predictions' in result and result['predictions']:
+        print(f"Creating annotated image with {len(result['predictions'])} predictions")
+        # Create annotated image path
+        annotated_image_path = upload_path(UPLOAD_FOLDER, annotated_filename)
+
+        # Draw predictions on the prepared pixels in the image pool
+        annotation = render_annotation(prepared, result['predictions'], annotated_image_path,
+                                       annotation_format, job['annotation_quality'])
+        if annotation:
+            print(f"Successfully created annotated image: {annotated_image_path}")
+            publish(user_id, 'analysis.annotated', job_id=job_id,
+                    annotated_image_url=f"/api/uploads/{annotated_filename}",
+                    format=annotation['format'], bytes=annotation['bytes'])
+        else:
+            print("Failed to create annotated image")
+            annotated_image_path = None
+            annotation = None
+    else:
+        print("No predictions found, skipping annotation")
+        annotated_image_path = None
+
+    # Convert result to JSON string for storage
+    analysis_result = json.dumps(result)
+
+    # Save analysis record to database
+    date_time = job['date_time']
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO analysis_records
+        (user_id, drone_name, date_time, location, field_size, flight_time,
+         original_image_path, result_image_path, analysis_result, inference_size,
+         latitude, longitude, captured_at, altitude_m, relative_altitude_m,
+         camera_model, focal_length_mm, image_metadata, gsd_cm,
+         annotation_format, annotation_bytes, annotation_encode_ms, video_id, video_time_s,
+         phash, duplicate_of, frame_count)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (user_id, job['drone_name'], date_time, job['location'], float(job['field_size']),
+          float(job['flight_time']), job['file_path'], annotated_image_path, analysis_result,
+          prepared.inference_size, *(coordinates or (None, None)),
+          *metadata_columns(image_metadata), gsd_m * 100 if gsd_m else None,
+          *((annotation['format'], annotation['bytes'], annotation['encode_ms']) if annotation else (None, None, None)),
+          job['video_id'], job['video_time_s'],
+          to_signed(prepared.dhash) if prepared.dhash is not None else None,
+          job['duplicate_of']['record_id'] if job['duplicate_of'] else None, job['frame_count']))
+
+    record_id = cursor.lastrowid
+    frames = job['frames']
+    if frames:
+        store_frames(cursor, record_id, [frame for frame in frames if 'error' not in frame])
+    if prepared.dhash is not None:
+        index_hash(cursor, record_id, int(user_id), prepared.dhash)
+    store_class_areas(cursor, record_id, user_id, analysis_date(date_time), class_areas)
+    record_analysis(cursor, user_id, analysis_date(date_time), result.get('predictions'))
+    field_ids = index_analysis(cursor, record_id, int(user_id), *coordinates) if coordinates else []
+    conn.commit()
+    conn.close()
+    publish(user_id, 'analysis.stored', job_id=job_id, record_id=record_id, field_ids=field_ids)
+
+    # Prepare response with image URLs
+    return {
+        'message': 'Analysis completed successfully',
+        'record_id': record_id,
+        'job_id': job_id,
+        'model_id_used': inference_backend.model_id,
+        'inference_size': prepared.inference_size,
+        'field_ids': field_ids,
+        'gsd_cm': round(gsd_m * 100, 4) if gsd_m else None,
+        'class_areas': class_areas,
+        'analysis_result': result,
+        'original_image_url': f"/api/uploads/{unique_filename}",
+        'annotated_image_url': f"/api/uploads/{annotated_filename}" if annotated_image_path else None,
+        'annotation': annotation,
+        'duplicate_of': job['duplicate_of'],
+        'frames': {
+            'count': job['frame_count'],
+            'analyzed': [{'index': frame['index'], 'predictions': len(frame['predictions'])}
+                         for frame in frames if 'error' not in frame],
+            'failed': [frame['index'] for frame in frames if 'error' in frame],
+            'url': f"/api/analyses/{record_id}/frames",
+        } if frames else None,
+        'metadata': {
+            'drone_name': job['drone_name'],
+            'date_time': date_time,
+            'location': job['location'],
+            'field_size': float(job['field_size']),
+            'flight_time': float(job['flight_time']),
+            'latitude': coordinates[0] if coordinates else None,
+            'longitude': coordinates[1] if coordinates else None
+        },
+        'image_metadata': image_metadata
+    }
+
+def fail_analysis(job, error):
+    print(f"Analysis error: {str(error)}")
+    import traceback
+    traceback.print_exc()
+
+    publish(job['user_id'], 'analysis.failed', job_id=job['job_id'], error=str(error))
+
+    # Clean up uploaded file (and its resized copy) if analysis fails
+    file_path, prepared = job['file_path'], job['prepared']
+    for leftover in {file_path, prepared.path if prepared else file_path}:
+        if os.path.exists(leftover):
+            os.remove(leftover)
+
+def release_analysis(job):
+    if job['prepared'] is not None:
+        job['prepared'].release()
+
+def run_analysis(job):
+    """prepare -> inference -> finish for a begun job; cleans up and re-raises on failure"""
+    from inference_backends import ROBOFLOW_CONFIDENCE, ROBOFLOW_OVERLAP
+
+    try:
+        prepared = prepare_analysis(job)
+        result = match_duplicate(job)
+        if result is None:
+            result = job['backend'].infer(prepared.path, confidence=ROBOFLOW_CONFIDENCE, overlap=ROBOFLOW_OVERLAP,
+                                          image_size=prepared.inference_size)
+        if job['frame_count'] > 1:
+            job['frames'] = analyze_frames(job, result)
+        return finish_analysis(job, result)
+    except Exception as e:
+        fail_analysis(job, e)
+        raise
+    finally:
+        release_analysis(job)
+
+@api.route('/api/analyze', methods=['POST'])
 @jwt_required()
 def analyze_image():
     try:
         user_id = int(get_jwt_identity())
-        
-        print(f"📊 Request analysis:")
-        print(f"   Files keys: {list(request.files.keys())}")
-        print(f"   Form keys: {list(request.form.keys())}")
         print(f"   Content type: {request.content_type}")
-        
-        # Check if image file is present (flexible key checking)
-        image_file = None
-        for key in ['image', 'file', 'drone_image']:
-            if key in request.files:
-                image_file = request.files[key]
-                print(f"   Found image with key: {key}")
-                break
-        
-        if image_file is None:
-            return jsonify({'error': 'No image file provided. Available keys: ' + str(list(request.files.keys()))}), 422
-        
-        if image_file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
-        
-        if not allowed_file(image_file.filename):
-            return jsonify({'error': 'Invalid file type. Only PNG, JPG, JPEG, GIF allowed'}), 400
-        
-        # Get form data
-        drone_name = request.form.get('drone_name')
-        date_time = request.form.get('date_time')
-        location = request.form.get('location')
-        field_size = request.form.get('field_size')
-        flight_time = request.form.get('flight_time')
-        
-        if not all([drone_name, date_time, location, field_size, flight_time]):
-            return jsonify({'error': 'All form fields are required'}), 400
-        
-        # Save original image
-        filename = secure_filename(image_file.filename)
-        unique_filename = f"{uuid.uuid4()}_{filename}"
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-        image_file.save(file_path)
-        
-        print(f"💾 Saved image to: {file_path}")
-        print(f"📏 File size: {os.path.getsize(file_path)} bytes")
-        
-        # Process image with Roboflow API
-        try:
-            print(f"Processing image: {file_path}")
-            print(f"Model ID constant (ROBOFLOW_MODEL_ID): {ROBOFLOW_MODEL_ID}")
-            print(f"Model ID env (ROBOFLOW_MODEL_ID): {os.getenv('ROBOFLOW_MODEL_ID')}")
-            print(f"API Key: {str(ROBOFLOW_API_KEY)[:10]}...")
-            
-            # Check if file exists
-            if not os.path.exists(file_path):
-                raise Exception(f"Image file not found: {file_path}")
-            
-            # Prepare image to Roboflow UI image size and call inference with explicit params
-            prepared_path = resize_image_for_api(file_path, max_size=ROBOFLOW_IMAGE_SIZE)
-            result = call_roboflow_inference(prepared_path, ROBOFLOW_MODEL_ID, confidence=ROBOFLOW_CONFIDENCE, overlap=ROBOFLOW_OVERLAP, image_size=ROBOFLOW_IMAGE_SIZE)
-            
-            if result is None:
-                raise Exception("Roboflow inference failed")
-            
-            print(f"API Result keys: {result.keys() if isinstance(result, dict) else 'Not a dict'}")
-            
-            if 'predictions' in result:
-                print(f"Found {len(result['predictions'])} predictions")
-            else:
-                print("No predictions key in result")
-            
-            # Create annotated image if predictions exist
-            annotated_image_path = None
-            annotated_filename = f"annotated_{unique_filename}"
-            
-            if 'predictions' in result and result['predictions']:
-                print(f"Creating annotated image with {len(result['predictions'])} predictions")
-                # Create annotated image path
-                annotated_image_path = os.path.join(app.config['UPLOAD_FOLDER'], annotated_filename)
-                
-                # Draw predictions on image
-                success = draw_predictions_on_image(prepared_path, result['predictions'], annotated_image_path)
-                if success:
-                    print(f"Successfully created annotated image: {annotated_image_path}")
-                else:
-                    print("Failed to create annotated image")
-                    annotated_image_path = None
-            else:
-                print("No predictions found, skipping annotation")
-                annotated_image_path = None
-            
-            # Convert result to JSON string for storage
-            analysis_result = json.dumps(result)
-            
-            # Save analysis record to database
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO analysis_records 
-                (user_id, drone_name, date_time, location, field_size, flight_time, 
-                 original_image_path, result_image_path, analysis_result)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (user_id, drone_name, date_time, location, float(field_size), 
-                  float(flight_time), file_path, annotated_image_path, analysis_result))
-            
-            record_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
-            
-            # Prepare response with image URLs
-            response_data = {
-                'message': 'Analysis completed successfully',
-                'record_id': record_id,
-                'model_id_used': ROBOFLOW_MODEL_ID,
-                'analysis_result': result,
-                'original_image_url': f"/api/uploads/{unique_filename}",
-                'annotated_image_url': f"/api/uploads/{annotated_filename}" if annotated_image_path else None,
-                'metadata': {
-                    'drone_name': drone_name,
-                    'date_time': date_time,
-                    'location': location,
-                    'field_size': float(field_size),
-                    'flight_time': float(flight_time)
-                }
-            }
-            
-            return jsonify(response_data), 200
-            
-        except Exception as e:
-            print(f"Analysis error: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            
-            # Clean up uploaded file if analysis fails
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            return jsonify({'error': f'Analysis failed: {str(e)}'}), 500
-        
+        job = begin_analysis(user_id, request.form, request.files)
+    except AnalysisRejected as e:
+        return jsonify({'error': e.message}), e.status
     except Exception as e:
         print(f"Request error: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': f'Analysis request failed: {str(e)}'}), 500
 
-@app.route('/api/history', methods=['GET'])
+    # Process image with the inference backend
+    try:
+        return json_response(run_analysis(job))
+    except Exception as e:
+        return jsonify({'error': f'Analysis failed: {str(e)}'}), 500
+
+_video_slots = None
+_video_slots_lock = threading.Lock()
+
+def _video_slot():
+    """Non-blocking: True if this worker may start another video ingest"""
+    global _video_slots
+    from video_ingest import VIDEO_MAX_ACTIVE
+
+    with _video_slots_lock:
+        if _video_slots is None:
+            _video_slots = threading.BoundedSemaphore(VIDEO_MAX_ACTIVE)
+    return _video_slots.acquire(blocking=False)
+
+def video_options(form):
+    """sample_frames() keyword arguments from the optional form fields"""
+    options = {}
+    try:
+        if form.get('sample_seconds'):
+            options['interval_s'] = float(form.get('sample_seconds'))
+            if not options['interval_s'] > 0:
+                raise ValueError
+        if form.get('scene_threshold'):
+            options['scene_threshold'] = float(form.get('scene_threshold'))
+            if not 0 <= options['scene_threshold'] <= 1:
+                raise ValueError
+    except ValueError:
+        raise AnalysisRejected('sample_seconds must be positive and scene_threshold between 0 and 1')
+    options['keyframes_only'] = str(form.get('keyframes_only', '')).lower() in ('1', 'true', 'yes')
+    return options
+
+@api.route('/api/videos', methods=['POST'])
+@jwt_required()
+def analyze_video():
+    """Analyze a flight video: frames are sampled, deduplicated and analyzed in the background
+
+    Takes the /api/analyze form fields with a ``video`` file, plus optional
+    sample_seconds, scene_threshold and keyframes_only.  Answers 202 at once;
+    progress arrives as video.* events and from GET /api/videos/<id>.  Every
+    analyzed frame becomes an ordinary analysis record.
+    """
+    from video_ingest import VIDEO_EXTENSIONS, is_video, video_support
+
+    try:
+        user_id = int(get_jwt_identity())
+        video_file = request.files.get('video') or request.files.get('file')
+        if video_file is None or video_file.filename == '':
+            return jsonify({'error': 'No video file provided'}), 422
+        if not is_video(video_file.filename):
+            return jsonify({'error': f"Invalid file type. Videos must be {', '.join(sorted(VIDEO_EXTENSIONS))}"}), 400
+        if not video_support():
+            return jsonify({'error': 'Video analysis is not available on this server (pip install av)'}), 501
+        options = video_options(request.form)
+        job = analysis_job(user_id, request.form, {})
+        if not _video_slot():
+            return jsonify({'error': 'Too many videos are being processed, try again later'}), 429
+    except AnalysisRejected as e:
+        return jsonify({'error': e.message}), e.status
+    except Exception as e:
+        print(f"Video request error: {str(e)}")
+        return jsonify({'error': f'Video request failed: {str(e)}'}), 500
+
+    try:
+        filename = secure_filename(video_file.filename)
+        video_path = upload_path(UPLOAD_FOLDER, f"{uuid.uuid4()}_{filename}")
+        video_file.save(video_path)
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO video_ingests (user_id, job_id, filename, status, source_file, worker)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (user_id, job['job_id'], filename, 'queued', os.path.basename(video_path), os.getpid()))
+        video_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        _video_slots.release()
+        print(f"Video upload error: {str(e)}")
+        return jsonify({'error': f'Video upload failed: {str(e)}'}), 500
+
+    print(f"🎬 Video {video_id} saved to: {video_path} ({os.path.getsize(video_path)} bytes)")
+    publish(user_id, 'video.queued', job_id=job['job_id'], video_id=video_id, filename=filename)
+    threading.Thread(target=ingest_video, args=(video_id, job, video_path, options),
+                     name=f'video-{video_id}', daemon=True).start()
+    return jsonify({'video_id': video_id, 'job_id': job['job_id'], 'status': 'queued',
+                    'status_url': f'/api/videos/{video_id}'}), 202
+
+def ingest_video(video_id, job, video_path, options):
+    """Sample, deduplicate and analyze a saved video's frames (runs on its own thread)
+
+    The frames become ordinary analysis records with video_id/video_time_s
+    set; the video file itself is deleted once it has been read.
+    """
+    from video_ingest import sample_frames, analyze_bounded
+
+    user_id, job_id = job['user_id'], job['job_id']
+    stem = os.path.splitext(os.path.basename(video_path))[0].split('_', 1)[-1]
+    stats = {}
+
+    def analyze_frame(frame):
+        unique_filename = f"{uuid.uuid4()}_{stem}_{frame.time_s:.1f}s.jpg"
+        file_path = upload_path(UPLOAD_FOLDER, unique_filename)
+        frame.image.save(file_path, 'JPEG', quality=VIDEO_FRAME_QUALITY)
+        frame_job = dict(job, job_id=f"{job_id}:{frame.index}"[:64], unique_filename=unique_filename,
+                         file_path=file_path, video_id=video_id, video_time_s=frame.time_s,
+                         image_metadata={'width': frame.image.width, 'height': frame.image.height},
+                         backend=None, prepared=None)
+        try:
+            record_id = run_analysis(frame_job)['record_id']
+        except Exception as e:
+            return {'time_s': frame.time_s, 'error': str(e)}
+        publish(user_id, 'video.frame', job_id=job_id, video_id=video_id, time_s=frame.time_s,
+                record_id=record_id, frames_sampled=stats.get('frames_sampled'))
+        return {'time_s': frame.time_s, 'record_id': record_id}
+
+    conn = get_db_connection()
+    conn.execute("UPDATE video_ingests SET status = 'running' WHERE id = ?", (video_id,))
+    conn.commit()
+    conn.close()
+    publish(user_id, 'video.started', job_id=job_id, video_id=video_id)
+
+    started = time.perf_counter()
+    status, error, results = 'done', None, []
+    try:
+        results = analyze_bounded(sample_frames(video_path, stats, **options), analyze_frame)
+    except Exception as e:
+        print(f"❌ Video {video_id} failed: {str(e)}")
+        status, error = 'failed', str(e)
+    finally:
+        if os.path.exists(video_path):
+            os.remove(video_path)
+        _video_slots.release()
+
+    failed = sum(1 for result in results if 'error' in result)
+    conn = get_db_connection()
+    analyzed = conn.execute('SELECT COUNT(*) FROM analysis_records WHERE video_id = ?', (video_id,)).fetchone()[0]
+    conn.execute('''
+        UPDATE video_ingests
+        SET status = ?, error = ?, duration_s = ?, frames_decoded = ?, frames_sampled = ?,
+            frames_duplicate = ?, frames_analyzed = ?, frames_failed = ?, finished_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (status, error, stats.get('duration_s'), stats.get('frames_decoded', 0), stats.get('frames_sampled', 0),
+          stats.get('frames_duplicate', 0), analyzed, failed, video_id))
+    conn.commit()
+    conn.close()
+    print(f"🎬 Video {video_id} {status} in {time.perf_counter() - started:.1f}s: "
+          f"{stats.get('frames_decoded', 0)} frames decoded, {stats.get('frames_sampled', 0)} sampled, "
+          f"{stats.get('frames_duplicate', 0)} near-duplicates, {analyzed} analyzed")
+    publish(user_id, f"video.{'completed' if status == 'done' else 'failed'}", job_id=job_id, video_id=video_id,
+            frames_analyzed=analyzed, frames_failed=failed, error=error)
+
+def _worker_gone(pid, last_seen):
+    """True unless ``pid`` is a live worker: a sibling, or this process since it started"""
+    if not pid:
+        return True
+    if pid == os.getpid():
+        # The same pid before this process started was an earlier process (pids are reused after a restart)
+        return last_seen < _background_started
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        return False
+    return False
+
+def recover_interrupted_videos():
+    """Fail videos left queued/running by a worker that has exited and delete their saved files
+
+    The sampling state only lived in that worker, so they are not restarted;
+    frames it had already analyzed stay as analysis records.
+    """
+    conn = get_db_connection()
+    try:
+        videos = conn.execute('''
+            SELECT id, user_id, job_id, status, source_file, worker, created_at FROM video_ingests
+            WHERE status IN ('queued', 'running')
+        ''').fetchall()
+        failed = []
+        for video in videos:
+            if not _worker_gone(video['worker'], video['created_at']):
+                continue
+            claimed = conn.execute('''
+                UPDATE video_ingests
+                SET status = 'failed', error = 'Interrupted by a server restart', finished_at = CURRENT_TIMESTAMP,
+                    frames_analyzed = (SELECT COUNT(*) FROM analysis_records WHERE video_id = ?)
+                WHERE id = ? AND status = ? AND worker IS ?
+            ''', (video['id'], video['id'], video['status'], video['worker'])).rowcount
+            conn.commit()
+            if claimed:
+                failed.append(video)
+    finally:
+        conn.close()
+
+    for video in failed:
+        if video['source_file']:
+            path = os.path.join(resolve_upload(UPLOAD_FOLDER, video['source_file']), video['source_file'])
+            if os.path.exists(path):
+                os.remove(path)
+        publish(video['user_id'], 'video.failed', job_id=video['job_id'], video_id=video['id'],
+                error='Interrupted by a server restart')
+    if failed:
+        print(f"🎬 Failed {len(failed)} video(s) interrupted by a restart")
+
+@api.route('/api/videos/<int:video_id>', methods=['GET'])
+@jwt_required()
+def get_video(video_id):
+    """Progress of a video ingest and the analysis records of its frames"""
+    try:
+        user_id = int(get_jwt_identity())
+        conn = get_db_connection()
+        try:
+            video = conn.execute('SELECT * FROM video_ingests WHERE id = ? AND user_id = ?',
+                                 (video_id, user_id)).fetchone()
+            if video is None:
+                return jsonify({'error': 'Video not found'}), 404
+            frames = conn.execute('''
+                SELECT id, video_time_s FROM analysis_records
+                WHERE video_id = ? ORDER BY video_time_s
+            ''', (video_id,)).fetchall()
+        finally:
+            conn.close()
+        return jsonify({
+            'video': dict(video),
+            'frames': [{'record_id': frame['id'], 'time_s': frame['video_time_s']} for frame in frames]
+        }), 200
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch video'}), 500
+
+_raster_slots = None
+_raster_slots_lock = threading.Lock()
+
+def _raster_slot():
+    """Blocks until this worker may analyze another raster"""
+    global _raster_slots
+    from raster_ingest import RASTER_MAX_ACTIVE
+
+    with _raster_slots_lock:
+        if _raster_slots is None:
+            _raster_slots = threading.BoundedSemaphore(RASTER_MAX_ACTIVE)
+    return _raster_slots
+
+def raster_options(body):
+    """Optional analysis settings of a raster upload"""
+    from image_processing import INFERENCE_BUDGETS
+
+    options = {}
+    inference_budget = body.get('inference_budget') or None
+    if inference_budget and inference_budget not in INFERENCE_BUDGETS and not str(inference_budget).isdigit():
+        raise AnalysisRejected(f"inference_budget must be one of {', '.join(INFERENCE_BUDGETS)} or a pixel size")
+    options['inference_budget'] = str(inference_budget) if inference_budget else None
+    if body.get('gsd_cm'):
+        try:
+            options['gsd_cm'] = float(body.get('gsd_cm'))
+        except (TypeError, ValueError):
+            raise AnalysisRejected('gsd_cm must be a positive number')
+        if not options['gsd_cm'] > 0:
+            raise AnalysisRejected('gsd_cm must be a positive number')
+    return options
+
+@api.route('/api/rasters', methods=['POST'])
+@jwt_required()
+def create_raster_upload():
+    """Start a chunked upload of a large raster (orthomosaic GeoTIFF)
+
+    Takes JSON (or form fields) filename and size in bytes, plus optional
+    inference_budget, gsd_cm (when the raster has no georeferencing) and
+    job_id.  Answers with the URL to PUT the chunks to; see raster_ingest.py.
+    """
+    from raster_ingest import (MAX_RASTER_SIZE, RASTER_CHUNK_SIZE, RASTER_EXTENSIONS, RASTER_FOLDER, is_raster,
+                               raster_dir, source_path)
+
+    try:
+        user_id = int(get_jwt_identity())
+        body = request.get_json(silent=True) or request.form
+        filename = secure_filename(str(body.get('filename') or ''))
+        if not filename or not is_raster(filename):
+            return jsonify({'error': f"filename must be a {', '.join(sorted(RASTER_EXTENSIONS))} file"}), 400
+        try:
+            size = int(body.get('size'))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'size must be the file size in bytes'}), 400
+        if size <= 0:
+            return jsonify({'error': 'size must be the file size in bytes'}), 400
+        if size > MAX_RASTER_SIZE:
+            return jsonify({'error': f"Rasters are limited to {MAX_RASTER_SIZE // (1024 * 1024)}MB"}), 413
+        options = raster_options(body)
+        os.makedirs(RASTER_FOLDER, exist_ok=True)
+        if shutil.disk_usage(RASTER_FOLDER).free < size * 1.1:
+            return jsonify({'error': 'Not enough disk space for this raster'}), 507
+
+        raster_id = uuid.uuid4().hex
+        job_id = (str(body.get('job_id') or '') or str(uuid.uuid4()))[:64]
+        os.makedirs(raster_dir(raster_id))
+        with open(source_path(raster_id), 'wb'):
+            pass
+        conn = get_db_connection()
+        conn.execute('''
+            INSERT INTO raster_ingests (id, user_id, job_id, filename, size, status, options)
+            VALUES (?, ?, ?, ?, ?, 'uploading', ?)
+        ''', (raster_id, user_id, job_id, filename, size, json.dumps(options)))
+        conn.commit()
+        conn.close()
+    except AnalysisRejected as e:
+        return jsonify({'error': e.message}), e.status
+    except Exception as e:
+        print(f"Raster request error: {str(e)}")
+        return jsonify({'error': f'Raster upload failed: {str(e)}'}), 500
+
+    print(f"🗺️  Raster {raster_id} upload started: {filename} ({size} bytes)")
+    return jsonify({'raster_id': raster_id, 'job_id': job_id, 'status': 'uploading', 'received': 0, 'size': size,
+                    'chunk_size': min(RASTER_CHUNK_SIZE, MAX_FILE_SIZE),
+                    'upload_url': f'/api/rasters/{raster_id}/data',
+                    'status_url': f'/api/rasters/{raster_id}'}), 201
+
+@api.route('/api/rasters/<raster_id>/data', methods=['PUT'])
+@jwt_required()
+def upload_raster_chunk(raster_id):
+    """Append one chunk at ?offset=N; a wrong offset gets 409 and the offset to resume from"""
+    from raster_ingest import RASTER_CHUNK_SIZE, RasterUnsupported, is_raster_id, source_path, write_chunk
+
+    if not is_raster_id(raster_id):
+        return jsonify({'error': 'Raster not found'}), 404
+    user_id = int(get_jwt_identity())
+    conn = get_db_connection()
+    try:
+        raster = conn.execute('SELECT size, received, status, job_id FROM raster_ingests WHERE id = ? AND user_id = ?',
+                              (raster_id, user_id)).fetchone()
+    finally:
+        conn.close()
+    if raster is None:
+        return jsonify({'error': 'Raster not found'}), 404
+    if raster['status'] != 'uploading':
+        return jsonify({'error': 'Upload already complete', 'received': raster['received']}), 409
+
+    offset = request.args.get('offset', type=int)
+    length = request.content_length
+    if offset is None or offset != raster['received']:
+        return jsonify({'error': f"Expected the chunk at offset {raster['received']}",
+                        'received': raster['received']}), 409
+    if not length or length > min(RASTER_CHUNK_SIZE, MAX_FILE_SIZE) or offset + length > raster['size']:
+        return jsonify({'error': 'Chunk is empty, too large or past the declared size',
+                        'received': raster['received']}), 400
+
+    try:
+        written = write_chunk(source_path(raster_id), offset, request.stream, length)
+    except RasterUnsupported as e:
+        return jsonify({'error': str(e)}), 415
+    except OSError as e:
+        print(f"Raster chunk error: {str(e)}")
+        return jsonify({'error': 'Could not store the chunk', 'received': raster['received']}), 500
+
+    received = offset + written
+    complete = received == raster['size']
+    conn = get_db_connection()
+    try:
+        updated = conn.execute('''
+            UPDATE raster_ingests SET received = ?, status = ?, worker = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND received = ? AND status = 'uploading'
+        ''', (received, 'queued' if complete else 'uploading', os.getpid(), raster_id, offset)).rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    if not updated:
+        return jsonify({'error': 'Another chunk was stored at this offset first'}), 409
+    if written != length:
+        return jsonify({'error': 'Chunk ended early', 'received': received}), 400
+
+    if complete:
+        print(f"🗺️  Raster {raster_id} uploaded ({received} bytes)")
+        publish(user_id, 'raster.queued', job_id=raster['job_id'], raster_id=raster_id)
+        threading.Thread(target=ingest_raster, args=(raster_id,), name=f'raster-{raster_id[:8]}', daemon=True).start()
+    return jsonify({'raster_id': raster_id, 'received': received, 'size': raster['size'],
+                    'status': 'queued' if complete else 'uploading'}), 202 if complete else 200
+
+def ingest_raster(raster_id):
+    """Pyramid, tiled inference and georeferencing of an uploaded raster (runs on its own thread)"""
+    from inference_backends import (ROBOFLOW_IMAGE_SIZE, ROBOFLOW_CONFIDENCE, ROBOFLOW_OVERLAP,
+                                    get_inference_backend)
+    from image_pool import prepare_upload
+    from ground_area import measure_predictions
+    from video_ingest import analyze_bounded
+    from raster_ingest import (RASTER_INFERENCE_CONCURRENCY, RASTER_TILE_ATTEMPTS, open_raster, raster_dir, source_path, build_pyramid,
+                               tile_grid, iter_tiles, tile_predictions, store_tile, ground_sample_distance)
+
+    conn = get_db_connection()
+    raster = conn.execute('SELECT user_id, job_id, options FROM raster_ingests WHERE id = ?', (raster_id,)).fetchone()
+    conn.close()
+    user_id, job_id = raster['user_id'], raster['job_id']
+    options = json.loads(raster['options'] or '{}')
+    directory = raster_dir(raster_id)
+
+    def update(**columns):
+        conn = get_db_connection()
+        conn.execute(f"UPDATE raster_ingests SET {', '.join(f'{name} = ?' for name in columns)}, "
+                     f"updated_at = CURRENT_TIMESTAMP WHERE id = ?", (*columns.values(), raster_id))
+        conn.commit()
+        conn.close()
+
+    with _raster_slot():
+        started = time.perf_counter()
+        source = None
+        stats, class_areas, failed = {}, {}, 0
+        conn = get_db_connection()
+        conn.execute('UPDATE raster_ingests SET attempts = attempts + 1 WHERE id = ?', (raster_id,))
+        conn.commit()
+        conn.close()
+        try:
+            inference_backend = get_inference_backend()
+            source = open_raster(source_path(raster_id))
+            georef = source.georeference()
+            gsd_m = options['gsd_cm'] / 100 if options.get('gsd_cm') else \
+                ground_sample_distance(georef, source.width, source.height)
+            grid = tile_grid(source.width, source.height)
+            update(status='running', reader=source.reader, width=source.width, height=source.height,
+                   bands=source.bands, crs=georef['crs'] if georef else None,
+                   transform=json.dumps(georef['transform']) if georef else None,
+                   gsd_cm=gsd_m * 100 if gsd_m else None, tiles_total=len(grid))
+            publish(user_id, 'raster.started', job_id=job_id, raster_id=raster_id, width=source.width,
+                    height=source.height, tiles=len(grid))
+            print(f"🗺️  Raster {raster_id}: {source.width}x{source.height}, {source.bands} bands, "
+                  f"{georef['crs'] if georef else 'not georeferenced'}, {len(grid)} tiles ({source.reader})")
+
+            update(pyramid_levels=build_pyramid(source, directory))
+            publish(user_id, 'raster.preview', job_id=job_id, raster_id=raster_id,
+                    preview_url=f'/api/rasters/{raster_id}/preview.jpg')
+            print(f"🗺️  Raster {raster_id} pyramid built in {time.perf_counter() - started:.1f}s")
+
+            def analyze_tile(tile):
+                tile_path = os.path.join(directory, f"tile_{tile.col}_{tile.row}.jpg")
+                prepared = None
+                try:
+                    tile.image.save(tile_path, 'JPEG', quality=VIDEO_FRAME_QUALITY)
+                    prepared = prepare_upload(tile_path, ROBOFLOW_IMAGE_SIZE, native_size=inference_backend.native_size,
+                                              budget=options.get('inference_budget'))
+                    # One transient inference error must not cost a tile of a raster with hundreds of them
+                    result = None
+                    for attempt in range(1, RASTER_TILE_ATTEMPTS + 1):
+                        try:
+                            result = inference_backend.infer(prepared.path, confidence=ROBOFLOW_CONFIDENCE,
+                                                             overlap=ROBOFLOW_OVERLAP,
+                                                             image_size=prepared.inference_size)
+                        except Exception as e:
+                            print(f"⚠️  Raster {raster_id} tile {tile.col},{tile.row} inference error: {str(e)}")
+                        if result is not None or attempt == RASTER_TILE_ATTEMPTS:
+                            break
+                        time.sleep(attempt)
+                    if result is None:
+                        raise Exception(f"{inference_backend.name} inference failed {RASTER_TILE_ATTEMPTS} times")
+                    predictions = tile_predictions(tile, result.get('predictions') or [], prepared.width,
+                                                   prepared.height)
+                    classes = {}
+                    for prediction in predictions:
+                        entry = classes.setdefault(prediction.get('class', 'unknown'),
+                                                   {'area_m2': 0.0, 'detections': 0})
+                        entry['detections'] += 1
+                    # Areas need a ground sample distance: the raster's georeferencing or the gsd_cm option
+                    for name, totals in measure_predictions({'predictions': predictions}, tile.image.width,
+                                                            gsd_m).items():
+                        classes[name]['area_m2'] = totals['area_m2']
+                    conn = get_db_connection()
+                    store_tile(conn, raster_id, tile, predictions)
+                    conn.commit()
+                    conn.close()
+                    publish(user_id, 'raster.tile', job_id=job_id, raster_id=raster_id, col=tile.col, row=tile.row,
+                            predictions=len(predictions))
+                    return {'predictions': len(predictions), 'classes': classes}
+                except Exception as e:
+                    print(f"⚠️  Raster {raster_id} tile {tile.col},{tile.row} failed: {str(e)}")
+                    return {'error': str(e)}
+                finally:
+                    if prepared is not None:
+                        prepared.release()
+                    for leftover in {tile_path, prepared.path if prepared else tile_path}:
+                        if os.path.exists(leftover):
+                            os.remove(leftover)
+
+            results = analyze_bounded(iter_tiles(source, grid, stats=stats), analyze_tile,
+                                      RASTER_INFERENCE_CONCURRENCY)
+            failed = sum(1 for result in results if 'error' in result)
+            for result in results:
+                for name, totals in (result.get('classes') or {}).items():
+                    entry = class_areas.setdefault(name, {'area_m2': 0.0, 'detections': 0})
+                    entry['area_m2'] += totals['area_m2']
+                    entry['detections'] += totals['detections']
+            # Tiles that still failed leave gaps, but the others' predictions are kept and served
+            if failed and failed == len(results):
+                status, error = 'failed', f'All {failed} tiles failed'
+            else:
+                status, error = 'done', f'{failed} of {len(results)} tiles failed' if failed else None
+        except Exception as e:
+            print(f"❌ Raster {raster_id} failed: {str(e)}")
+            status, error = 'failed', str(e)
+        finally:
+            if source is not None:
+                source.close()
+
+    conn = get_db_connection()
+    analyzed, predictions = conn.execute('''
+        SELECT COUNT(*), COALESCE(SUM(prediction_count), 0) FROM raster_tiles WHERE raster_id = ?
+    ''', (raster_id,)).fetchone()
+    conn.close()
+    update(status=status, error=error, tiles_empty=stats.get('tiles_empty', 0), tiles_analyzed=analyzed,
+           tiles_failed=failed, prediction_count=predictions,
+           class_areas=json.dumps({name: {'area_m2': round(v['area_m2'], 4), 'detections': v['detections']}
+                                   for name, v in class_areas.items()}),
+           finished_at=datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'))
+    print(f"🗺️  Raster {raster_id} {status} in {time.perf_counter() - started:.1f}s: {analyzed} tiles analyzed, "
+          f"{stats.get('tiles_empty', 0)} empty, {failed} failed, {predictions} predictions")
+    publish(user_id, f"raster.{'completed' if status == 'done' else 'failed'}", job_id=job_id, raster_id=raster_id,
+            predictions=predictions, tiles_failed=failed, error=error)
+
+def recover_interrupted_rasters():
+    """Take over rasters left queued/running by a worker that has exited; fail them after RASTER_MAX_ATTEMPTS"""
+    from raster_ingest import RASTER_MAX_ATTEMPTS, source_path
+
+    conn = get_db_connection()
+    try:
+        rasters = conn.execute('''
+            SELECT id, user_id, job_id, size, status, worker, attempts, updated_at FROM raster_ingests
+            WHERE status IN ('queued', 'running')
+        ''').fetchall()
+        requeued, failed = [], []
+        for raster in rasters:
+            if not _worker_gone(raster['worker'], raster['updated_at']):
+                continue
+            path = source_path(raster['id'])
+            retry = raster['attempts'] < RASTER_MAX_ATTEMPTS and os.path.exists(path) and \
+                os.path.getsize(path) == raster['size']
+            # Compare-and-set on the old owner: of several workers starting together only one takes the raster
+            claimed = conn.execute('''
+                UPDATE raster_ingests SET status = ?, worker = ?, error = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = ? AND worker IS ?
+            ''', ('queued' if retry else 'failed', os.getpid(), None if retry else 'Interrupted by a server restart',
+                  raster['id'], raster['status'], raster['worker'])).rowcount
+            conn.commit()
+            if claimed:
+                (requeued if retry else failed).append(raster)
+    finally:
+        conn.close()
+
+    for raster in failed:
+        publish(raster['user_id'], 'raster.failed', job_id=raster['job_id'], raster_id=raster['id'],
+                error='Interrupted by a server restart')
+    for raster in requeued:
+        publish(raster['user_id'], 'raster.queued', job_id=raster['job_id'], raster_id=raster['id'])
+        threading.Thread(target=ingest_raster, args=(raster['id'],), name=f"raster-{raster['id'][:8]}",
+                         daemon=True).start()
+    if requeued or failed:
+        print(f"🗺️  Recovered interrupted rasters: {len(requeued)} requeued, {len(failed)} failed")
+
+def _user_raster(raster_id, user_id):
+    from raster_ingest import is_raster_id
+
+    if not is_raster_id(raster_id):
+        return None
+    conn = get_db_connection()
+    try:
+        return conn.execute('SELECT * FROM raster_ingests WHERE id = ? AND user_id = ?',
+                            (raster_id, user_id)).fetchone()
+    finally:
+        conn.close()
+
+@api.route('/api/rasters/<raster_id>', methods=['GET'])
+@jwt_required()
+def get_raster(raster_id):
+    """Upload/analysis progress of a raster, its georeferencing and preview URLs"""
+    from raster_ingest import raster_summary
+
+    try:
+        raster = _user_raster(raster_id, int(get_jwt_identity()))
+        if raster is None:
+            return jsonify({'error': 'Raster not found'}), 404
+        return jsonify({'raster': raster_summary(raster)}), 200
+    except Exception as e:
+        print(f"Raster status error: {str(e)}")
+        return jsonify({'error': 'Failed to fetch raster'}), 500
+
+@api.route('/api/rasters/<raster_id>/predictions', methods=['GET'])
+@jwt_required()
+def get_raster_predictions(raster_id):
+    """All predictions of an analyzed raster as GeoJSON (?coords=pixel|geo) or SVG, streamed and compressed"""
+    from vector_export import COORDINATE_SYSTEMS, geojson_chunks, svg_chunks, pixel_transform
+    from raster_ingest import iter_raster_predictions, lonlat_transform
+
+    try:
+        output_format = request.args.get('format', 'geojson')
+        coords = request.args.get('coords', 'geo')
+        if output_format not in ('geojson', 'svg'):
+            return jsonify({'error': 'format must be geojson or svg'}), 400
+        if coords not in COORDINATE_SYSTEMS:
+            return jsonify({'error': f"coords must be one of {', '.join(COORDINATE_SYSTEMS)}"}), 400
+        raster = _user_raster(raster_id, int(get_jwt_identity()))
+        if raster is None:
+            return jsonify({'error': 'Raster not found'}), 404
+        if raster['status'] != 'done':
+            return jsonify({'error': f"Raster is {raster['status']}"}), 409
+
+        result = {'image': {'width': raster['width'], 'height': raster['height']},
+                  'predictions': iter_raster_predictions(DB_PATH, raster_id)}
+        if output_format == 'svg':
+            chunks, mimetype = svg_chunks(result), 'image/svg+xml'
+        else:
+            properties = {'raster_id': raster_id, 'coords': coords}
+            if coords == 'geo':
+                georef = {'crs': raster['crs'],
+                          'transform': json.loads(raster['transform']) if raster['transform'] else None}
+                transform = lonlat_transform(georef)
+                if transform is None:
+                    return jsonify({'error': 'Raster is not georeferenced in EPSG:4326 and rasterio is not '
+                                             'installed to reproject it'}), 422
+            else:
+                transform = pixel_transform(1.0)
+                properties.update(width=raster['width'], height=raster['height'])
+            chunks, mimetype = geojson_chunks(result, transform, properties), 'application/geo+json'
+
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+        response = current_app.response_class(compress_stream(chunks, encoding), mimetype=mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+    except Exception as e:
+        print(f"Raster export error: {str(e)}")
+        return jsonify({'error': 'Failed to export raster predictions'}), 500
+
+# Like /api/uploads: unauthenticated (for <img> and map tile layers), the raster id is an unguessable uuid
+@api.route('/api/rasters/<raster_id>/preview.jpg')
+def raster_preview(raster_id):
+    from raster_ingest import raster_dir, is_raster_id
+
+    if not is_raster_id(raster_id):
+        return jsonify({'error': 'Raster not found'}), 404
+    return send_from_directory(raster_dir(raster_id), 'preview.jpg', max_age=86400)
+
+@api.route('/api/rasters/<raster_id>/tiles/<int:level>/<int:col>/<int:row>.jpg')
+def raster_tile(raster_id, level, col, row):
+    from raster_ingest import raster_dir, is_raster_id
+
+    if not is_raster_id(raster_id):
+        return jsonify({'error': 'Raster not found'}), 404
+    return send_from_directory(os.path.join(raster_dir(raster_id), 'pyramid', str(level)), f"{col}_{row}.jpg",
+                               max_age=86400)
+
+def load_history(user_id):
+    conn = get_db_connection()
+    records = conn.execute('''
+        SELECT id, drone_name, date_time, location, field_size, flight_time,
+               created_at, analysis_result, inference_size, latitude, longitude,
+               captured_at, altitude_m, camera_model, frame_count
+        FROM analysis_records
+        WHERE user_id = ?
+        ORDER BY created_at DESC
+    ''', (user_id,)).fetchall()
+    conn.close()
+    return [history_entry(record) for record in records]
+
+@api.route('/api/history', methods=['GET'])
 @jwt_required()
 def get_analysis_history():
     try:
         user_id = get_jwt_identity()
-        
+
+        history = load_history(user_id)
+
+        return json_response({'history': history})
+
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch history'}), 500
+
+@api.route('/api/analyses/<int:record_id>/overlay', methods=['GET'])
+@jwt_required()
+def get_analysis_overlay(record_id):
+    """Predictions of one analysis as vector shapes instead of the annotated image
+
+    ?format=geojson (default) or svg; for GeoJSON ?coords=pixel (original
+    photo pixels, default) or geo (longitude/latitude, needs the record's
+    position and ground sample distance).  Streamed, gzip/brotli compressed
+    when the client accepts it.
+    """
+    from vector_export import COORDINATE_SYSTEMS, geojson_chunks, svg_chunks, pixel_transform, geo_transform
+
+    try:
+        user_id = int(get_jwt_identity())
+        output_format = request.args.get('format', 'geojson')
+        coords = request.args.get('coords', 'pixel')
+        if output_format not in ('geojson', 'svg'):
+            return jsonify({'error': 'format must be geojson or svg'}), 400
+        if coords not in COORDINATE_SYSTEMS:
+            return jsonify({'error': f"coords must be one of {', '.join(COORDINATE_SYSTEMS)}"}), 400
+
         conn = get_db_connection()
-        records = conn.execute('''
-            SELECT id, drone_name, date_time, location, field_size, flight_time, 
-                   created_at, analysis_result
-            FROM analysis_records 
-            WHERE user_id = ? 
-            ORDER BY created_at DESC
-        ''', (user_id,)).fetchall()
+        record = conn.execute('''
+            SELECT analysis_result, latitude, longitude, gsd_cm, image_metadata
+            FROM analysis_records WHERE id = ? AND user_id = ?
+        ''', (record_id, user_id)).fetchone()
         conn.close()
-        
-        history = []
-        for record in records:
-            analysis_result = json.loads(record['analysis_result']) if record['analysis_result'] else {}
-            history.append({
-                'id': record['id'],
-                'drone_name': record['drone_name'],
-                'date_time': record['date_time'],
-                'location': record['location'],
-                'field_size': record['field_size'],
-                'flight_time': record['flight_time'],
-                'created_at': record['created_at'],
-                'analysis_result': analysis_result
-            })
-        
-        return jsonify({'history': history}), 200
-        
+        if record is None:
+            return jsonify({'error': 'Analysis not found'}), 404
+
+        result = json.loads(record['analysis_result']) if record['analysis_result'] else {}
+        image_metadata = json.loads(record['image_metadata']) if record['image_metadata'] else {}
+        inference_width = (result.get('image') or {}).get('width')
+        original_width = image_metadata.get('width') or inference_width
+        original_height = image_metadata.get('height') or (result.get('image') or {}).get('height')
+        if not inference_width or not original_width or not original_height:
+            return jsonify({'error': 'Analysis has no stored image size'}), 422
+        scale = original_width / float(inference_width)
+
+        if output_format == 'svg':
+            chunks, mimetype = svg_chunks(result, original_width, original_height), 'image/svg+xml'
+        else:
+            properties = {'record_id': record_id, 'coords': coords}
+            if coords == 'geo':
+                if record['latitude'] is None or not record['gsd_cm']:
+                    return jsonify({'error': 'Analysis has no position or ground sample distance to georeference'}), 422
+                transform = geo_transform(record['latitude'], record['longitude'], record['gsd_cm'] / 100,
+                                          original_width, original_height,
+                                          image_metadata.get('flight_yaw_deg') or 0.0, scale)
+            else:
+                transform = pixel_transform(scale)
+                properties.update(width=original_width, height=original_height)
+            chunks, mimetype = geojson_chunks(result, transform, properties), 'application/geo+json'
+
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+        response = current_app.response_class(compress_stream(chunks, encoding), mimetype=mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
     except Exception as e:
-        return jsonify({'error': 'Failed to fetch history'}), 500
+        print(f"Overlay export error: {str(e)}")
+        return jsonify({'error': 'Failed to export overlay'}), 500
 
-@app.route('/api/field-estimations', methods=['POST'])
+@api.route('/api/analyses/<int:record_id>/frames', methods=['GET'])
+@jwt_required()
+def get_analysis_frames(record_id):
+    """Per-frame predictions of an animated GIF or multi-page TIFF analysis (?index=N for one frame)"""
+    from multiframe import unpack_predictions
+
+    try:
+        user_id = int(get_jwt_identity())
+        index = request.args.get('index', type=int)
+        conn = get_db_connection()
+        try:
+            record = conn.execute('SELECT frame_count FROM analysis_records WHERE id = ? AND user_id = ?',
+                                  (record_id, user_id)).fetchone()
+            if record is None:
+                return jsonify({'error': 'Analysis not found'}), 404
+            query = 'SELECT frame_index, width, height, predictions FROM analysis_frames WHERE analysis_id = ?'
+            params = [record_id]
+            if index is not None:
+                query += ' AND frame_index = ?'
+                params.append(index)
+            rows = conn.execute(query + ' ORDER BY frame_index', params).fetchall()
+        finally:
+            conn.close()
+        return json_response({
+            'record_id': record_id,
+            'frame_count': record['frame_count'] or 1,
+            'frames': [{
+                'index': row['frame_index'],
+                'image': {'width': row['width'], 'height': row['height']},
+                'predictions': unpack_predictions(row['predictions']),
+            } for row in rows]
+        })
+    except Exception as e:
+        print(f"Frames error: {str(e)}")
+        return jsonify({'error': 'Failed to fetch frames'}), 500
+
+def analysis_date(date_time):
+    """YYYY-MM-DD of the capture time, or today if it is not a parseable date"""
+    try:
+        return datetime.fromisoformat(date_time).date().isoformat()
+    except (TypeError, ValueError):
+        return datetime.utcnow().date().isoformat()
+
+def history_entry(record):
+    analysis_result = json.loads(record['analysis_result']) if record['analysis_result'] else {}
+    return {
+        'id': record['id'],
+        'drone_name': record['drone_name'],
+        'date_time': record['date_time'],
+        'location': record['location'],
+        'field_size': record['field_size'],
+        'flight_time': record['flight_time'],
+        'created_at': record['created_at'],
+        'inference_size': record['inference_size'],
+        'latitude': record['latitude'],
+        'longitude': record['longitude'],
+        'captured_at': record['captured_at'],
+        'altitude_m': record['altitude_m'],
+        'camera_model': record['camera_model'],
+        'frame_count': record['frame_count'],
+        'analysis_result': analysis_result
+    }
+
+@api.route('/api/field-estimations', methods=['POST'])
 @jwt_required()
 def log_field_estimation():
+    from geometry import measure, index_field
+
     try:
         user_id = int(get_jwt_identity())
         data = request.get_json() or {}
@@ -704,21 +1673,19 @@ def log_field_estimation():
         distance_m = data.get('distance_m')
         geometry = data.get('geometry')
 
-        center_lat = None
-        center_lng = None
-
-        if isinstance(geometry, list) and geometry:
-            lats = [float(p.get('lat', 0)) for p in geometry]
-            lngs = [float(p.get('lng', 0)) for p in geometry]
-            center_lat = sum(lats) / len(lats)
-            center_lng = sum(lngs) / len(lngs)
-        elif isinstance(geometry, dict) and 'point' in geometry and geometry['point']:
-            point = geometry['point']
-            center_lat = float(point.get('lat', 0))
-            center_lng = float(point.get('lng', 0))
-
-        if center_lat is not None and center_lng is not None:
-            location = f"Field estimation: {name} ({center_lat:.6f}, {center_lng:.6f})"
+        # Measure on the server rather than trusting the client's numbers
+        measured = None
+        if geometry:
+            try:
+                measured = measure(geometry, measure_type)
+            except ValueError as e:
+                return jsonify({'error': f'Invalid geometry: {str(e)}'}), 400
+
+        if measured:
+            location = f"Field estimation: {name} ({measured['center_lat']:.6f}, {measured['center_lng']:.6f})"
+            area_m2 = measured['area_m2'] if measured['area_m2'] is not None else area_m2
+            perimeter_m = measured['perimeter_m'] if measured['perimeter_m'] is not None else perimeter_m
+            distance_m = measured['length_m'] if measured['length_m'] is not None else distance_m
         else:
             location = f"Field estimation: {name}"
 
@@ -743,6 +1710,7 @@ def log_field_estimation():
             'perimeter_m': perimeter_m,
             'distance_m': distance_m,
             'geometry': geometry,
+            'center': {'lat': measured['center_lat'], 'lng': measured['center_lng']} if measured else None,
             'predictions': []
         }
 
@@ -768,31 +1736,339 @@ def log_field_estimation():
         ))
 
         record_id = cursor.lastrowid
+        if measured:
+            index_field(cursor, record_id, user_id, name, measured)
         conn.commit()
         conn.close()
+        publish(user_id, 'field_estimation.stored', record_id=record_id)
 
-        return jsonify({'message': 'Field estimation logged', 'record_id': record_id}), 201
+        return jsonify({
+            'message': 'Field estimation logged',
+            'record_id': record_id,
+            'area_m2': area_m2,
+            'perimeter_m': perimeter_m,
+            'distance_m': distance_m,
+            'center': analysis_payload['center']
+        }), 201
 
     except Exception as e:
         return jsonify({'error': 'Failed to log field estimation'}), 500
 
-@app.route('/api/uploads/<filename>')
+@api.route('/api/field-estimations', methods=['GET'])
+@jwt_required()
+def search_field_estimations():
+    """Fields in a bounding box (?bbox=min_lng,min_lat,max_lng,max_lat) or near a point (?lat=&lng=&radius_m=)"""
+    from geometry import fields_in_bbox, fields_near
+
+    try:
+        user_id = int(get_jwt_identity())
+        limit = min(int(request.args.get('limit', 100)), 1000)
+
+        conn = get_db_connection()
+        try:
+            if request.args.get('bbox'):
+                min_lng, min_lat, max_lng, max_lat = (float(v) for v in request.args['bbox'].split(','))
+                fields = fields_in_bbox(conn, user_id, min_lat, max_lat, min_lng, max_lng, limit)
+            elif request.args.get('lat') and request.args.get('lng'):
+                radius_m = float(request.args.get('radius_m', 1000))
+                fields = fields_near(conn, user_id, float(request.args['lat']),
+                                     float(request.args['lng']), radius_m, limit)
+            else:
+                return jsonify({'error': 'Provide bbox=min_lng,min_lat,max_lng,max_lat or lat, lng and radius_m'}), 400
+        finally:
+            conn.close()
+
+        return jsonify({'fields': fields, 'count': len(fields)}), 200
+
+    except ValueError:
+        return jsonify({'error': 'Invalid search parameters'}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to search field estimations'}), 500
+
+@api.route('/api/field-estimations/<int:field_id>/analyses', methods=['GET'])
+@jwt_required()
+def get_field_analyses(field_id):
+    """Every drone analysis taken inside a field, newest first"""
+    try:
+        user_id = int(get_jwt_identity())
+        
+        conn = get_db_connection()
+        try:
+            field = conn.execute(
+                'SELECT record_id, name, area_m2 FROM field_geometries WHERE record_id = ? AND user_id = ?',
+                (field_id, user_id)
+            ).fetchone()
+            if field is None:
+                return jsonify({'error': 'Field not found'}), 404
+            
+            records = conn.execute('''
+                SELECT a.id, a.drone_name, a.date_time, a.location, a.field_size, a.flight_time,
+                       a.created_at, a.analysis_result, a.inference_size, a.latitude, a.longitude,
+                       a.captured_at, a.altitude_m, a.camera_model, a.frame_count
+                FROM field_analysis_links l
+                CROSS JOIN analysis_records a ON a.id = l.analysis_id
+                WHERE l.field_id = ?
+                ORDER BY l.analysis_id DESC
+            ''', (field_id,)).fetchall()
+        finally:
+            conn.close()
+        
+        return jsonify({
+            'field': {'id': field['record_id'], 'name': field['name'], 'area_m2': field['area_m2']},
+            'analyses': [history_entry(record) for record in records]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch field analyses'}), 500
+
+@api.route('/api/class-areas', methods=['GET'])
+@jwt_required()
+def get_class_areas():
+    """Detected area per class between ?from= and ?to= (YYYY-MM-DD, default: this month)"""
+    from ground_area import class_area_totals
+
+    try:
+        user_id = int(get_jwt_identity())
+        today = datetime.utcnow().date()
+        date_from = request.args.get('from') or today.replace(day=1).isoformat()
+        date_to = request.args.get('to') or today.isoformat()
+        for value in (date_from, date_to):
+            datetime.strptime(value, '%Y-%m-%d')
+        
+        conn = get_db_connection()
+        try:
+            classes = class_area_totals(conn, user_id, date_from, date_to)
+        finally:
+            conn.close()
+        
+        return jsonify({'from': date_from, 'to': date_to, 'classes': classes}), 200
+        
+    except ValueError:
+        return jsonify({'error': 'from and to must be dates (YYYY-MM-DD)'}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch class areas'}), 500
+
+@api.route('/api/stats', methods=['GET'])
+@jwt_required()
+def get_stats():
+    """Rolled-up statistics between ?from= and ?to= (YYYY-MM-DD, default: the last year), ?group=day|month|year"""
+    from stats import query_stats
+
+    try:
+        user_id = int(get_jwt_identity())
+        today = datetime.utcnow().date()
+        date_from = request.args.get('from') or (today - timedelta(days=365)).isoformat()
+        date_to = request.args.get('to') or today.isoformat()
+        group = request.args.get('group', 'day')
+        for value in (date_from, date_to):
+            datetime.strptime(value, '%Y-%m-%d')
+        if group not in ('day', 'month', 'year'):
+            return jsonify({'error': 'group must be day, month or year'}), 400
+        
+        conn = get_db_connection()
+        try:
+            stats = query_stats(conn, user_id, date_from, date_to, group)
+        finally:
+            conn.close()
+        
+        return jsonify(stats), 200
+        
+    except ValueError:
+        return jsonify({'error': 'from and to must be dates (YYYY-MM-DD)'}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch statistics'}), 500
+
+@api.route('/api/events/token', methods=['POST'])
+@jwt_required()
+def create_event_stream_token():
+    """A token that only opens /api/events and expires in SSE_TOKEN_SECONDS
+
+    EventSource cannot send an Authorization header, so the token goes in the
+    URL, where proxies and access logs see it; the login token never does.
+    """
+    token = create_access_token(identity=get_jwt_identity(), expires_delta=timedelta(seconds=SSE_TOKEN_SECONDS),
+                                additional_claims={'scope': 'events'})
+    return jsonify({'token': token, 'expires_in': SSE_TOKEN_SECONDS}), 200
+
+@api.route('/api/events', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_events():
+    """Server-Sent Events for the current user (EventSource passes a stream token as ?token=)"""
+    if get_jwt_request_location() == 'query_string' and get_jwt().get('scope') != 'events':
+        return jsonify({'error': 'Use a stream token from POST /api/events/token in the URL'}), 401
+    user_id = int(get_jwt_identity())
+    if subscriber_count() >= SSE_MAX_STREAMS:
+        # Each stream holds a worker thread; keep some for ordinary requests
+        response = jsonify({'error': 'Too many event streams, retry later'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0)
+    except ValueError:
+        last_event_id = 0
+    subscription = subscribe(user_id)
+    
+    def generate():
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            # Catch up on what was missed while reconnecting
+            if last_event_id:
+                for event in events_since(user_id, last_event_id):
+                    yield format_sse(*event)
+            deadline = time.monotonic() + SSE_STREAM_SECONDS
+            while time.monotonic() < deadline:
+                event = subscription.get(timeout=SSE_KEEPALIVE_SECONDS)
+                # Comment lines keep proxies from closing an idle connection
+                yield format_sse(*event) if event else ": keepalive\n\n"
+        finally:
+            subscription.close()
+    
+    response = current_app.response_class(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@api.route('/api/uploads/<filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    # Sharded layout for new files, flat folder for uploads made before it
+    return send_from_directory(resolve_upload(UPLOAD_FOLDER, filename), filename)
 
-@app.route('/api/health', methods=['GET'])
+@api.route('/api/health', methods=['GET'])
 def health_check():
+    """Liveness: the process is up (answers before warm-up has finished)"""
     return jsonify({'status': 'healthy', 'timestamp': datetime.utcnow().isoformat()}), 200
 
-@app.errorhandler(413)
+@api.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """Readiness: warmed up and able to reach the database and upload disk; inference is reported"""
+    ready, checks = readiness(DB_PATH, UPLOAD_FOLDER, warm_up_done.is_set())
+    response = jsonify({
+        'status': 'ready' if ready else 'not_ready',
+        'checks': checks,
+        'timestamp': datetime.utcnow().isoformat()
+    })
+    if not ready:
+        response.headers['Retry-After'] = '5'
+    return response, 200 if ready else 503
+
+@api.app_errorhandler(413)
 def too_large(e):
-    return jsonify({'error': 'File too large. Maximum size is 16MB'}), 413
+    limit = request.max_content_length or MAX_FILE_SIZE
+    return jsonify({'error': f'File too large. Maximum size is {limit // (1024 * 1024)}MB'}), 413
 
-# Ensure DB is initialized when running under gunicorn too (idempotent)
-try:
-    init_db()
-except Exception as _e:
-    pass
+_background_pid = None
+_background_started = ''
+_background_lock = threading.Lock()
+warm_up_done = threading.Event()
+
+def start_background_work():
+    """Warm up this process (models, HTTP connections, image pool, fonts) and start maintenance, once.
+
+    Runs on its own thread so requests are served while it loads.  Under
+    gunicorn it is started by the post_worker_init hook in gunicorn.conf.py,
+    so with --preload the master process never starts pools or threads that
+    its forked workers would inherit.
+    """
+    global _background_pid, _background_started
+    if multiprocessing.parent_process() is not None:
+        return  # an image/inference pool worker importing this module
+    with _background_lock:
+        if _background_pid == os.getpid():
+            return
+        _background_pid = os.getpid()
+        _background_started = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    warm_up_done.clear()
+    threading.Thread(target=_warm_up, name='warm-up', daemon=True).start()
+
+def _warm_up():
+    from inference_backends import warm_inference_backend
+    from image_pool import warm_image_pool
+    from maintenance import start_maintenance_thread
+
+    started = time.perf_counter()
+    # Load local models (if configured) and start image workers before the first analysis arrives
+    try:
+        warm_inference_backend()
+    except Exception as e:
+        print(f"⚠️  Inference backend warm-up failed: {str(e)}")
+    try:
+        warm_image_pool()
+    except Exception as e:
+        print(f"⚠️  Image pool warm-up failed: {str(e)}")
+    
+    # Retention/compaction runs on a background thread, never on request threads
+    start_maintenance_thread(DB_PATH, UPLOAD_FOLDER)
+    
+    # Ingests whose worker exited mid-way (restart, deploy, crash) would otherwise stay queued forever
+    try:
+        recover_interrupted_rasters()
+    except Exception as e:
+        print(f"⚠️  Raster recovery failed: {str(e)}")
+    try:
+        recover_interrupted_videos()
+    except Exception as e:
+        print(f"⚠️  Video recovery failed: {str(e)}")
+    
+    # Open the database (schema and pages into cache) and prime the readiness probes
+    ready, checks = readiness(DB_PATH, UPLOAD_FOLDER, True)
+    if not ready:
+        print(f"⚠️  Not ready after warm-up: {checks}")
+    warm_up_done.set()
+    print(f"🔥 Warm-up finished in {time.perf_counter() - started:.2f}s")
+
+class UploadRequest(Request):
+    """Flask's request with a larger body limit on the video upload route"""
+    @property
+    def max_content_length(self):
+        if self.url_rule is not None and self.url_rule.endpoint == 'api.analyze_video':
+            return MAX_VIDEO_SIZE
+        return super().max_content_length
+
+def create_app():
+    """Build the Flask app.
+
+    This only configures Flask and checks the schema version; heavy modules
+    and worker pools load afterwards in start_background_work().
+    """
+    app = Flask(__name__)
+    app.request_class = UploadRequest
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
+    app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'jwt-secret-key')
+    app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
+    # Only /api/events reads tokens from the query string, and only stream tokens (see create_event_stream_token)
+    app.config['JWT_QUERY_STRING_NAME'] = 'token'
+    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
+    
+    # Initialize extensions
+    # CORS: always allow browser access to API routes from any origin.
+    # This avoids preflight failures when calling the backend from the hosted frontend.
+    CORS(
+        app,
+        resources={r"/api/*": {"origins": "*"}},
+        allow_headers=['Content-Type', 'Authorization'],
+        methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
+        supports_credentials=False,
+    )
+    jwt.init_app(app)
+    # gzip/brotli for JSON and other text responses above COMPRESS_MIN_BYTES
+    init_compression(app)
+    app.register_blueprint(api)
+    
+    init_user_cache(DB_PATH)
+    init_events(DB_PATH)
+    try:
+        init_schema()
+    except Exception as e:
+        print(f"⚠️  Database initialization failed: {str(e)}")
+    
+    # gunicorn workers start it from gunicorn.conf.py instead (see start_background_work)
+    if not os.getenv('SERVER_SOFTWARE', '').startswith('gunicorn'):
+        start_background_work()
+    return app
+
+app = create_app()
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', '5000'))
@@ -0,0 +1,166 @@
+"""ASGI entry point (optional): the I/O-bound routes on an event loop.
+
+Under gunicorn's gthread workers every in-flight Roboflow call holds an OS
+thread for up to two minutes.  Here ``/api/analyze``, ``/api/history`` and
+``/api/uploads/<filename>`` are served by Starlette.  Inference requests are
+awaited on an httpx.AsyncClient and uploads are streamed from disk
+asynchronously, so one worker can keep hundreds of analyses in flight.  The
+blocking stages (validation, saving, resizing, annotation, SQLite) are the
+same functions app.py uses, run in Starlette's thread pool.
+
+Every other route is handed to the Flask app unchanged, so the URLs and JSON
+bodies match ``app.py`` exactly.
+
+    pip install starlette httpx a2wsgi uvicorn
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 2
+"""
+
+import os
+import contextlib
+
+import jwt as pyjwt
+from a2wsgi import WSGIMiddleware
+from flask_jwt_extended import decode_token
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import FileResponse, JSONResponse, Response
+from starlette.routing import Mount, Route
+from werkzeug.datastructures import FileStorage
+from werkzeug.security import safe_join
+
+from app import (app as flask_app, MAX_FILE_SIZE, AnalysisRejected, begin_analysis, prepare_analysis,
+                 match_duplicate, analyze_frames, finish_analysis, fail_analysis, release_analysis, load_history, get_user,
+                 is_token_revoked)
+from inference_backends import ROBOFLOW_CONFIDENCE, ROBOFLOW_OVERLAP, close_async_client
+from storage import resolve_upload
+from compression import COMPRESS_MIN_BYTES, negotiate_encoding, compress_bytes
+from fast_json import dumps
+
+# Threads for the Flask routes (each open /api/events stream holds one)
+ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', '16'))
+
+
+def _authenticate(authorization):
+    """User id from a Bearer token, or a (body, status) error like flask_jwt_extended's"""
+    if not authorization.startswith('Bearer '):
+        return None, ({'msg': 'Missing Authorization Header'}, 401)
+    try:
+        with flask_app.app_context():
+            decoded = decode_token(authorization[len('Bearer '):])
+    except pyjwt.ExpiredSignatureError:
+        return None, ({'msg': 'Token has expired'}, 401)
+    except Exception as e:
+        return None, ({'msg': str(e)}, 422)
+    if decoded.get('type') != 'access':
+        return None, ({'msg': 'Only non-refresh tokens are allowed'}, 422)
+    # Stream tokens travel in URLs (see app.create_event_stream_token); none of these routes take them
+    if decoded.get('scope') == 'events':
+        return None, ({'msg': 'User claims verification failed'}, 400)
+    if is_token_revoked(decoded):
+        return None, ({'msg': 'Token has been revoked'}, 401)
+    if get_user(decoded['sub']) is None:
+        return None, ({'msg': f"Error loading the user {decoded['sub']}"}, 401)
+    return int(decoded['sub']), None
+
+
+def _encode_json(body, accept_encoding):
+    data = dumps(body)
+    encoding = negotiate_encoding(accept_encoding) if len(data) >= COMPRESS_MIN_BYTES else None
+    return (compress_bytes(data, encoding) if encoding else data), encoding
+
+
+async def json_response(request, body, status=200):
+    """Large JSON body, encoded (orjson when installed) and compressed off the event loop"""
+    data, encoding = await run_in_threadpool(_encode_json, body, request.headers.get('Accept-Encoding'))
+    headers = {'Vary': 'Accept-Encoding'}
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return Response(data, status, headers=headers, media_type='application/json')
+
+
+async def current_user(request):
+    return await run_in_threadpool(_authenticate, request.headers.get('Authorization', ''))
+
+
+async def analyze_image(request):
+    user_id, error = await current_user(request)
+    if error:
+        return JSONResponse(*error)
+    if int(request.headers.get('Content-Length') or 0) > MAX_FILE_SIZE:
+        return JSONResponse({'error': 'File too large. Maximum size is 16MB'}, 413)
+
+    form = await request.form()
+    try:
+        files = {key: FileStorage(stream=value.file, filename=value.filename, content_type=value.content_type)
+                 for key, value in form.multi_items() if isinstance(value, UploadFile)}
+        fields = {key: value for key, value in form.multi_items() if not isinstance(value, UploadFile)}
+        try:
+            job = await run_in_threadpool(begin_analysis, user_id, fields, files)
+        except AnalysisRejected as e:
+            return JSONResponse({'error': e.message}, e.status)
+        except Exception as e:
+            print(f"Request error: {str(e)}")
+            return JSONResponse({'error': f'Analysis request failed: {str(e)}'}, 500)
+    finally:
+        await form.close()
+
+    try:
+        prepared = await run_in_threadpool(prepare_analysis, job)
+        result = await run_in_threadpool(match_duplicate, job)
+        if result is None:
+            # The only long wait, and it holds no thread
+            result = await job['backend'].infer_async(prepared.path, confidence=ROBOFLOW_CONFIDENCE,
+                                                      overlap=ROBOFLOW_OVERLAP, image_size=prepared.inference_size)
+        if job['frame_count'] > 1:
+            job['frames'] = await run_in_threadpool(analyze_frames, job, result)
+        return await json_response(request, await run_in_threadpool(finish_analysis, job, result))
+    except Exception as e:
+        await run_in_threadpool(fail_analysis, job, e)
+        return JSONResponse({'error': f'Analysis failed: {str(e)}'}, 500)
+    finally:
+        release_analysis(job)
+
+
+async def get_analysis_history(request):
+    user_id, error = await current_user(request)
+    if error:
+        return JSONResponse(*error)
+    try:
+        return await json_response(request, {'history': await run_in_threadpool(load_history, user_id)})
+    except Exception as e:
+        return JSONResponse({'error': 'Failed to fetch history'}, 500)
+
+
+async def uploaded_file(request):
+    filename = request.path_params['filename']
+    folder = await run_in_threadpool(resolve_upload, flask_app.config['UPLOAD_FOLDER'], filename)
+    path = safe_join(folder, filename)
+    if path is None or not await run_in_threadpool(os.path.isfile, path):
+        raise HTTPException(404)
+    return FileResponse(path)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_app):
+    yield
+    await close_async_client()
+
+
+app = Starlette(
+    routes=[
+        Route('/api/analyze', analyze_image, methods=['POST']),
+        Route('/api/history', get_analysis_history, methods=['GET']),
+        Route('/api/uploads/{filename}', uploaded_file, methods=['GET', 'HEAD']),
+        Mount('/', app=WSGIMiddleware(flask_app, workers=ASGI_WSGI_THREADS)),
+    ],
+    middleware=[
+        # Same policy as the Flask-CORS setup in app.py
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_headers=['Content-Type', 'Authorization'],
+                   allow_methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS']),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,50 @@
+"""Class name -> category and drawing colors, shared by the renderer and the statistics.
+
+Classes the model is known to emit keep their Roboflow colors.  Any other
+class is colored by its category, found with the same substring matching
+the Dashboard uses (healthy, pest, weed, or one of the disease markers).
+"""
+
+from functools import lru_cache
+
+DISEASE_MARKERS = ('disease', 'blight', 'mildew', 'mold', 'rot', 'infect')
+
+# EXACT Roboflow class colors: (fill, outline), outline darker for visibility
+CLASS_COLORS = {
+    'healthy corn field area': ((0, 255, 0), (0, 180, 0)),               # Green - for healthy areas
+    'disease corn field area': ((255, 255, 0), (200, 200, 0)),           # Yellow - for disease areas
+    'damage-pest corn field area': ((255, 0, 0), (180, 0, 0)),           # Red - for damage/pest areas
+    'damage pest corn field area': ((255, 0, 0), (180, 0, 0)),           # Red - alternative naming
+    'downy mildew disease': ((255, 171, 0), (200, 134, 0)),
+    'northern corn leaf blight disease': ((0, 128, 255), (0, 90, 180)),
+    'southern corn leaf blight disease': ((255, 128, 0), (180, 90, 0)),
+}
+
+CATEGORY_COLORS = {
+    'healthy': CLASS_COLORS['healthy corn field area'],
+    'disease': CLASS_COLORS['disease corn field area'],
+    'pest': CLASS_COLORS['damage-pest corn field area'],
+    'weed': ((255, 0, 255), (180, 0, 180)),   # Magenta
+    'other': ((0, 255, 255), (0, 180, 180)),  # Cyan for unknown
+}
+
+
+def class_category(class_name):
+    """Same buckets as the Dashboard: healthy, pest, weed, disease or other."""
+    cls = str(class_name or '').lower()
+    if 'healthy' in cls:
+        return 'healthy'
+    if 'pest' in cls:
+        return 'pest'
+    if 'weed' in cls:
+        return 'weed'
+    if any(marker in cls for marker in DISEASE_MARKERS):
+        return 'disease'
+    return 'other'
+
+
+@lru_cache(maxsize=256)
+def class_colors(class_name):
+    """(fill, outline) RGB colors for a class name."""
+    key = str(class_name or '').lower()
+    return CLASS_COLORS.get(key) or CATEGORY_COLORS[class_category(key)]
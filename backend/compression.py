@@ -0,0 +1,117 @@
+"""Content-Encoding negotiation and response compression.
+
+Brotli is used when the ``brotli`` package is installed and the client
+accepts it; gzip (standard library) otherwise.  Streamed bodies are
+compressed incrementally as they are generated.  Other text responses
+(JSON above all: an analysis carries every polygon, and the history every
+analysis) are compressed whole by init_compression()'s after_request hook
+once they reach ``COMPRESS_MIN_BYTES``; smaller ones are not worth a
+header and a dictionary.
+"""
+
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli
+    brotli = None
+
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '5'))
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/geo+json', 'image/svg+xml',
+                          'text/html', 'text/plain', 'text/csv'}
+
+
+def accepted_encodings(accept_encoding):
+    """{coding: q} from an Accept-Encoding header"""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def negotiate_encoding(accept_encoding):
+    """'br', 'gzip' or None (identity) for an Accept-Encoding header"""
+    accepted = accepted_encodings(accept_encoding)
+    offered = (['br'] if brotli else []) + ['gzip']
+    best, best_q = None, 0.0
+    for coding in offered:
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compressor(encoding):
+    """Object with compress(bytes) and flush() for a Content-Encoding"""
+    if encoding == 'br':
+        return _BrotliCompressor()
+    if encoding == 'gzip':
+        return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31: gzip header and trailer
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+class _BrotliCompressor:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+def compress_stream(chunks, encoding):
+    """Compress an iterable of str/bytes chunks; yields compressed bytes as they fill up"""
+    if encoding is None:
+        for chunk in chunks:
+            yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+        return
+    stream = compressor(encoding)
+    for chunk in chunks:
+        data = stream.compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield stream.flush()
+
+
+def compress_bytes(data, encoding):
+    stream = compressor(encoding)
+    return stream.compress(data) + stream.flush()
+
+
+def compress_response(response, accept_encoding):
+    """Compress a buffered Flask response in place when it is worth it"""
+    if (response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers
+            or not 200 <= response.status_code < 300 or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = negotiate_encoding(accept_encoding)
+    if encoding:
+        response.set_data(compress_bytes(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_compression(app):
+    from flask import request
+
+    @app.after_request
+    def _compress(response):
+        return compress_response(response, request.headers.get('Accept-Encoding'))
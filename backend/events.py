@@ -0,0 +1,157 @@
+"""Per-user event stream shared by every gunicorn worker.
+
+``publish`` appends an event to the ``events`` table in agridrone.db.  In each
+worker, one poller thread reads new rows (a single primary-key range query)
+and hands them to the Server-Sent Events streams of that worker that belong to
+the event's user.  So an analysis running in one worker reaches a browser
+connected to another one.  The poller only runs while this worker has
+subscribers, so an idle server does no work at all, and it only reads.
+Events are kept for ``EVENT_RETENTION_SECONDS`` so a reconnecting client can
+catch up with ``Last-Event-ID``; older ones are deleted by maintenance.py
+whether or not anyone is listening.
+"""
+
+import os
+import json
+import time
+import queue
+import sqlite3
+import threading
+
+EVENT_POLL_INTERVAL = float(os.getenv('EVENT_POLL_INTERVAL', '0.25'))
+EVENT_RETENTION_SECONDS = int(os.getenv('EVENT_RETENTION_SECONDS', '3600'))
+EVENT_REPLAY_LIMIT = 100
+
+_db_path = None
+_subscribers = {}
+_lock = threading.Lock()
+_wakeup = threading.Condition(_lock)
+_poller = None
+
+
+def init_events(db_path):
+    global _db_path
+    _db_path = db_path
+
+
+def ensure_event_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    ''')
+
+
+def _connect():
+    return sqlite3.connect(_db_path, timeout=10)
+
+
+def publish(user_id, event_type, **payload):
+    """Record an event for a user; never raises (events are best effort)."""
+    try:
+        conn = _connect()
+        try:
+            conn.execute('INSERT INTO events (user_id, type, payload, created_at) VALUES (?, ?, ?, ?)',
+                         (int(user_id), event_type, json.dumps(payload), time.time()))
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"⚠️  Could not publish {event_type} event: {str(e)}")
+
+
+def events_since(user_id, last_id, limit=EVENT_REPLAY_LIMIT):
+    """Stored events for a user after last_id (for Last-Event-ID catch-up)."""
+    conn = _connect()
+    try:
+        return conn.execute(
+            'SELECT id, type, payload FROM events WHERE id > ? AND user_id = ? ORDER BY id LIMIT ?',
+            (last_id, int(user_id), limit)
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def prune_events(conn, retention_seconds=EVENT_RETENTION_SECONDS):
+    """Delete events older than the replay window; returns how many"""
+    deleted = conn.execute('DELETE FROM events WHERE created_at < ?', (time.time() - retention_seconds,)).rowcount
+    conn.commit()
+    return deleted
+
+
+class Subscription:
+    """Events for one user, as seen by one open stream."""
+
+    def __init__(self, user_id):
+        self.user_id = int(user_id)
+        self.queue = queue.Queue(maxsize=1000)
+
+    def get(self, timeout):
+        """Next (id, type, payload) or None after timeout seconds."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        with _lock:
+            streams = _subscribers.get(self.user_id)
+            if streams:
+                streams.discard(self)
+                if not streams:
+                    del _subscribers[self.user_id]
+
+
+def subscribe(user_id):
+    global _poller
+    subscription = Subscription(user_id)
+    with _lock:
+        _subscribers.setdefault(subscription.user_id, set()).add(subscription)
+        if _poller is None:
+            _poller = threading.Thread(target=_poll, name='event-poller', daemon=True)
+            _poller.start()
+        _wakeup.notify()
+    return subscription
+
+
+def subscriber_count():
+    with _lock:
+        return sum(len(streams) for streams in _subscribers.values())
+
+
+def _poll():
+    conn = _connect()
+    last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+    while True:
+        with _lock:
+            while not _subscribers:
+                _wakeup.wait()
+        try:
+            # Skip whatever was published while nobody in this worker was listening
+            if last_id is None:
+                last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+            rows = conn.execute('SELECT id, user_id, type, payload FROM events WHERE id > ? ORDER BY id',
+                                (last_id,)).fetchall()
+            if rows:
+                last_id = rows[-1][0]
+                with _lock:
+                    for event_id, user_id, event_type, payload in rows:
+                        for subscription in _subscribers.get(user_id, ()):
+                            try:
+                                subscription.queue.put_nowait((event_id, event_type, payload))
+                            except queue.Full:
+                                pass  # a stalled client misses events rather than holding memory
+        except sqlite3.Error as e:
+            print(f"⚠️  Event poller: {str(e)}")
+        time.sleep(EVENT_POLL_INTERVAL)
+        with _lock:
+            if not _subscribers:
+                last_id = None
+
+
+def format_sse(event_id, event_type, payload):
+    return f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n"
@@ -0,0 +1,30 @@
+"""JSON encoding for the large API payloads.
+
+``/api/analyze`` and ``/api/history`` return whole inference results, with
+every polygon vertex.  orjson encodes those several times faster than the
+standard library, so it is used when installed (``pip install orjson``).
+Without it the responses are exactly what jsonify() produces.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # optional
+    orjson = None
+
+
+def dumps(obj):
+    """Compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def json_response(body, status=200):
+    """(response, status) like ``jsonify(body), status``, encoded with orjson when available"""
+    from flask import current_app, jsonify
+
+    if orjson is None:
+        return jsonify(body), status
+    return current_app.response_class(dumps(body), mimetype='application/json'), status
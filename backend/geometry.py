@@ -0,0 +1,419 @@
+"""Geodesic measurements and a spatial index for field estimations.
+
+Field estimations arrive as a list of ``{lat, lng}`` vertices (AREA and
+DISTANCE measures) or ``{"point": {lat, lng}}`` (POI).  The server measures
+them itself instead of trusting the client:
+
+* area on the WGS84 ellipsoid, computed on the authalic (equal-area) sphere,
+* perimeter / length with Vincenty's inverse formula, all edges at once,
+* the area-weighted centroid of the polygon.
+
+Each field's bounding box goes into the ``field_rtree`` R*Tree virtual table,
+so bounding-box and nearby searches only look at candidate rows instead of
+every record.
+
+Drone analyses with GPS coordinates go into ``analysis_rtree``, and
+``field_analysis_links`` records which analyses fall inside which field
+polygons.  The links are maintained whenever either side is inserted, so
+a field's timeline is one primary-key range scan.
+"""
+
+import json
+import math
+
+import numpy as np
+
+# WGS84
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+_E2 = WGS84_F * (2 - WGS84_F)
+_E = math.sqrt(_E2)
+# Mean radius, used for local (field-sized) planar projections
+MEAN_EARTH_RADIUS = 6371008.8
+
+VINCENTY_MAX_ITERATIONS = 200
+VINCENTY_TOLERANCE = 1e-12
+
+KIND_POLYGON = 'polygon'
+KIND_LINE = 'line'
+KIND_POINT = 'point'
+
+
+def _authalic_q(sin_lat):
+    return (1 - _E2) * (sin_lat / (1 - _E2 * sin_lat ** 2)
+                        - np.log((1 - _E * sin_lat) / (1 + _E * sin_lat)) / (2 * _E))
+
+
+_QP = float(_authalic_q(np.float64(1.0)))
+AUTHALIC_RADIUS = WGS84_A * math.sqrt(_QP / 2)
+
+
+def parse_geometry(geometry, measure_type='AREA'):
+    """Return ``(kind, lats, lngs)`` for a field-estimation geometry.
+
+    Raises ValueError for malformed or out-of-range coordinates.
+    """
+    if isinstance(geometry, dict) and geometry.get('point'):
+        points = [geometry['point']]
+        kind = KIND_POINT
+    elif isinstance(geometry, list) and geometry:
+        points = geometry
+        kind = KIND_LINE if str(measure_type).upper() == 'DISTANCE' else KIND_POLYGON
+    else:
+        raise ValueError('geometry must be a list of {lat, lng} points or {"point": {lat, lng}}')
+
+    try:
+        coords = np.array([(float(p['lat']), float(p['lng'])) for p in points], dtype=np.float64)
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('every point needs numeric lat and lng')
+    if not np.all(np.isfinite(coords)):
+        raise ValueError('coordinates must be finite')
+    if np.any(np.abs(coords[:, 0]) > 90) or np.any(np.abs(coords[:, 1]) > 180):
+        raise ValueError('coordinates out of range')
+
+    if kind == KIND_POLYGON:
+        if len(coords) > 1 and np.array_equal(coords[0], coords[-1]):
+            coords = coords[:-1]  # closed ring
+        if len(np.unique(coords, axis=0)) < 3:
+            raise ValueError('a polygon needs at least 3 distinct points')
+    elif kind == KIND_LINE and len(coords) < 2:
+        raise ValueError('a line needs at least 2 points')
+    return kind, coords[:, 0], coords[:, 1]
+
+
+def vincenty_distance(lat1, lng1, lat2, lng2):
+    """Ellipsoidal distance in meters between arrays of points (degrees)."""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lng1, lat2, lng2))
+    f = WGS84_F
+    L = lng2 - lng1
+    U1 = np.arctan((1 - f) * np.tan(lat1))
+    U2 = np.arctan((1 - f) * np.tan(lat2))
+    sin_u1, cos_u1 = np.sin(U1), np.cos(U1)
+    sin_u2, cos_u2 = np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for _ in range(VINCENTY_MAX_ITERATIONS):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.hypot(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+            cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cos_u1 * cos_u2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            # Equatorial lines have cos2_alpha == 0
+            cos_2sm = np.where(cos2_alpha == 0, 0.0, cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha)
+            C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+            lam_prev = lam
+            lam = L + (1 - C) * f * sin_alpha * (
+                sigma + C * sin_sigma * (cos_2sm + C * cos_sigma * (-1 + 2 * cos_2sm ** 2)))
+            if np.all(np.abs(lam - lam_prev) < VINCENTY_TOLERANCE):
+                break
+
+        u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+        A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+        B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+        delta_sigma = B * sin_sigma * (cos_2sm + B / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sm ** 2)
+            - B / 6 * cos_2sm * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sm ** 2)))
+        return np.where(sin_sigma == 0, 0.0, WGS84_B * A * (sigma - delta_sigma))
+
+
+def path_length(lats, lngs, closed=False):
+    """Length of a path in meters; ``closed`` adds the edge back to the start."""
+    if closed:
+        lats, lngs = np.append(lats, lats[0]), np.append(lngs, lngs[0])
+    return float(np.sum(vincenty_distance(lats[:-1], lngs[:-1], lats[1:], lngs[1:])))
+
+
+def polygon_area(lats, lngs):
+    """Area in square meters of a simple polygon on the WGS84 ellipsoid."""
+    beta = np.arcsin(_authalic_q(np.sin(np.radians(lats))) / _QP)
+    lam = np.radians(lngs)
+    # Sum of the signed areas of the triangles each edge forms with the pole
+    tan1 = np.tan((np.pi / 2 - beta) / 2)
+    tan2 = np.roll(tan1, -1)
+    d_lng = lam - np.roll(lam, -1)
+    t = tan1 * tan2
+    excess = np.sum(2 * np.arctan2(t * np.sin(d_lng), 1 + t * np.cos(d_lng)))
+    return float(abs(excess) * AUTHALIC_RADIUS ** 2)
+
+
+def _local_xy(lats, lngs, lat0, lng0):
+    """Equirectangular projection in meters around (lat0, lng0); accurate at field scale."""
+    x = np.radians(lngs - lng0) * math.cos(math.radians(lat0)) * MEAN_EARTH_RADIUS
+    y = np.radians(lats - lat0) * MEAN_EARTH_RADIUS
+    return x, y
+
+
+def centroid(kind, lats, lngs):
+    """Area-weighted centroid of a polygon, length-weighted midpoint of a line."""
+    lat0, lng0 = float(np.mean(lats)), float(np.mean(lngs))
+    x, y = _local_xy(lats, lngs, lat0, lng0)
+    if kind == KIND_POLYGON:
+        x1, y1 = np.roll(x, -1), np.roll(y, -1)
+        cross = x * y1 - x1 * y
+        area2 = np.sum(cross)
+        if abs(area2) > 1e-9:
+            cx = np.sum((x + x1) * cross) / (3 * area2)
+            cy = np.sum((y + y1) * cross) / (3 * area2)
+        else:
+            cx, cy = 0.0, 0.0
+    elif kind == KIND_LINE:
+        seg = np.hypot(np.diff(x), np.diff(y))
+        total = np.sum(seg)
+        if total > 0:
+            cx = np.sum((x[:-1] + x[1:]) / 2 * seg) / total
+            cy = np.sum((y[:-1] + y[1:]) / 2 * seg) / total
+        else:
+            cx, cy = 0.0, 0.0
+    else:
+        return float(lats[0]), float(lngs[0])
+    lat = lat0 + math.degrees(cy / MEAN_EARTH_RADIUS)
+    lng = lng0 + math.degrees(cx / (MEAN_EARTH_RADIUS * math.cos(math.radians(lat0))))
+    return lat, lng
+
+
+def measure(geometry, measure_type='AREA'):
+    """Server-side measurements for a field-estimation geometry."""
+    kind, lats, lngs = parse_geometry(geometry, measure_type)
+    center_lat, center_lng = centroid(kind, lats, lngs)
+    result = {
+        'kind': kind,
+        'area_m2': None,
+        'perimeter_m': None,
+        'length_m': None,
+        'center_lat': center_lat,
+        'center_lng': center_lng,
+        'bbox': (float(lats.min()), float(lats.max()), float(lngs.min()), float(lngs.max())),
+        'coordinates': [[float(lat), float(lng)] for lat, lng in zip(lats, lngs)],
+    }
+    if kind == KIND_POLYGON:
+        result['area_m2'] = polygon_area(lats, lngs)
+        result['perimeter_m'] = path_length(lats, lngs, closed=True)
+    elif kind == KIND_LINE:
+        result['length_m'] = path_length(lats, lngs)
+    return result
+
+
+def point_in_polygon(lat, lng, lats, lngs):
+    """Even-odd rule test, in degrees (fields never straddle the antimeridian)."""
+    lats1, lngs1 = np.roll(lats, -1), np.roll(lngs, -1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crosses = ((lats > lat) != (lats1 > lat)) & (
+            lng < (lngs1 - lngs) * (lat - lats) / (lats1 - lats) + lngs)
+    return bool(np.count_nonzero(crosses) % 2)
+
+
+def distance_to(kind, coordinates, lat, lng):
+    """Meters from (lat, lng) to a stored field; 0 if the point lies inside a polygon."""
+    coords = np.asarray(coordinates, dtype=np.float64)
+    lats, lngs = coords[:, 0], coords[:, 1]
+    if kind == KIND_POINT:
+        return float(vincenty_distance(lat, lng, lats[0], lngs[0]))
+    if kind == KIND_POLYGON and point_in_polygon(lat, lng, lats, lngs):
+        return 0.0
+
+    x, y = _local_xy(lats, lngs, lat, lng)
+    if kind == KIND_POLYGON:
+        x, y = np.append(x, x[0]), np.append(y, y[0])
+    x0, y0, dx, dy = x[:-1], y[:-1], np.diff(x), np.diff(y)
+    seg2 = dx * dx + dy * dy
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.clip(np.where(seg2 > 0, -(x0 * dx + y0 * dy) / seg2, 0.0), 0.0, 1.0)
+    return float(np.min(np.hypot(x0 + t * dx, y0 + t * dy)))
+
+
+def radius_bbox(lat, lng, radius_m):
+    """(min_lat, max_lat, min_lng, max_lng) enclosing a circle of radius_m meters."""
+    d_lat = math.degrees(radius_m / MEAN_EARTH_RADIUS)
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    d_lng = min(180.0, d_lat / cos_lat)
+    return lat - d_lat, lat + d_lat, lng - d_lng, lng + d_lng
+
+
+# --- Spatial index -----------------------------------------------------------
+
+def ensure_spatial_tables(cursor):
+    """Create the field geometry tables; returns True if they were just created."""
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'field_rtree'"
+    ).fetchone() is not None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS field_geometries (
+            record_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            name TEXT,
+            kind TEXT NOT NULL,
+            area_m2 REAL,
+            perimeter_m REAL,
+            length_m REAL,
+            center_lat REAL NOT NULL,
+            center_lng REAL NOT NULL,
+            coordinates TEXT NOT NULL,
+            FOREIGN KEY (record_id) REFERENCES analysis_records (id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_field_geometries_user ON field_geometries (user_id)')
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS field_rtree USING rtree(
+            record_id, min_lat, max_lat, min_lng, max_lng
+        )
+    ''')
+    # Analyses are points, stored as zero-sized boxes
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS analysis_rtree USING rtree(
+            record_id, min_lat, max_lat, min_lng, max_lng
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS field_analysis_links (
+            field_id INTEGER NOT NULL,
+            analysis_id INTEGER NOT NULL,
+            PRIMARY KEY (field_id, analysis_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_field_analysis_links_analysis ON field_analysis_links (analysis_id)')
+    return not exists
+
+
+def index_field(cursor, record_id, user_id, name, measured):
+    """Store a measured field and its bounding box (replacing any previous entry)."""
+    min_lat, max_lat, min_lng, max_lng = measured['bbox']
+    cursor.execute('''
+        INSERT OR REPLACE INTO field_geometries
+        (record_id, user_id, name, kind, area_m2, perimeter_m, length_m, center_lat, center_lng, coordinates)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (record_id, user_id, name, measured['kind'], measured['area_m2'], measured['perimeter_m'],
+          measured['length_m'], measured['center_lat'], measured['center_lng'],
+          json.dumps(measured['coordinates'], separators=(',', ':'))))
+    cursor.execute('INSERT OR REPLACE INTO field_rtree VALUES (?, ?, ?, ?, ?)',
+                   (record_id, min_lat, max_lat, min_lng, max_lng))
+    if measured['kind'] == KIND_POLYGON:
+        _link_analyses_to_field(cursor, record_id, user_id, measured)
+
+
+def _link_analyses_to_field(cursor, field_id, user_id, measured):
+    """Link the user's existing analyses that lie inside a new field polygon.
+
+    The R*Tree stores 32-bit floats rounded outwards, so it only narrows the
+    candidates (by overlap, which the rounding cannot wrongly exclude); the
+    polygon test uses the exact coordinates from analysis_records.
+    """
+    min_lat, max_lat, min_lng, max_lng = measured['bbox']
+    candidates = cursor.execute('''
+        SELECT a.id, a.latitude, a.longitude
+        FROM analysis_rtree r
+        CROSS JOIN analysis_records a ON a.id = r.record_id
+        WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lng >= ? AND r.min_lng <= ?
+          AND a.user_id = ? AND a.latitude IS NOT NULL AND a.longitude IS NOT NULL
+    ''', (min_lat, max_lat, min_lng, max_lng, user_id)).fetchall()
+    coords = np.asarray(measured['coordinates'], dtype=np.float64)
+    links = [(field_id, analysis_id) for analysis_id, lat, lng in candidates
+             if point_in_polygon(lat, lng, coords[:, 0], coords[:, 1])]
+    cursor.executemany('INSERT OR IGNORE INTO field_analysis_links VALUES (?, ?)', links)
+    return len(links)
+
+
+def fields_containing(cursor, user_id, lat, lng):
+    """(field_id, name, area_m2) of the user's field polygons that contain a point."""
+    candidates = cursor.execute('''
+        SELECT g.record_id, g.name, g.area_m2, g.coordinates
+        FROM field_rtree r
+        CROSS JOIN field_geometries g ON g.record_id = r.record_id
+        WHERE r.min_lat <= ? AND r.max_lat >= ? AND r.min_lng <= ? AND r.max_lng >= ?
+          AND g.user_id = ? AND g.kind = ?
+    ''', (lat, lat, lng, lng, user_id, KIND_POLYGON)).fetchall()
+    fields = []
+    for field_id, name, area_m2, coordinates in candidates:
+        coords = np.asarray(json.loads(coordinates), dtype=np.float64)
+        if point_in_polygon(lat, lng, coords[:, 0], coords[:, 1]):
+            fields.append((field_id, name, area_m2))
+    return fields
+
+
+def index_analysis(cursor, analysis_id, user_id, lat, lng):
+    """Store an analysis location and link it to every field polygon containing it.
+
+    Returns the ids of the linked fields.
+    """
+    cursor.execute('INSERT OR REPLACE INTO analysis_rtree VALUES (?, ?, ?, ?, ?)',
+                   (analysis_id, lat, lat, lng, lng))
+    field_ids = [field[0] for field in fields_containing(cursor, user_id, lat, lng)]
+    cursor.executemany('INSERT OR IGNORE INTO field_analysis_links VALUES (?, ?)',
+                       [(field_id, analysis_id) for field_id in field_ids])
+    return field_ids
+
+
+def unindex_records(cursor, record_ids):
+    """Drop spatial rows and links for deleted analysis records."""
+    params = [(record_id,) for record_id in record_ids]
+    cursor.executemany('DELETE FROM analysis_rtree WHERE record_id = ?', params)
+    cursor.executemany('DELETE FROM field_analysis_links WHERE analysis_id = ?', params)
+
+
+def backfill_field_index(cursor):
+    """Index field estimations logged before the spatial index existed."""
+    rows = cursor.execute('''
+        SELECT id, user_id, analysis_result FROM analysis_records
+        WHERE original_image_path = '' AND id NOT IN (SELECT record_id FROM field_geometries)
+    ''').fetchall()
+    indexed = 0
+    for record_id, user_id, analysis_result in rows:
+        try:
+            payload = json.loads(analysis_result or '{}')
+            if payload.get('type') != 'field_estimation' or not payload.get('geometry'):
+                continue
+            measured = measure(payload['geometry'], payload.get('measure_type') or 'AREA')
+        except ValueError:
+            continue
+        index_field(cursor, record_id, user_id, payload.get('name'), measured)
+        indexed += 1
+    if indexed:
+        print(f"✅ Indexed {indexed} existing field estimations")
+    return indexed
+
+
+def _field_row_to_dict(row):
+    return {
+        'id': row['record_id'],
+        'name': row['name'],
+        'kind': row['kind'],
+        'area_m2': row['area_m2'],
+        'perimeter_m': row['perimeter_m'],
+        'length_m': row['length_m'],
+        'center': {'lat': row['center_lat'], 'lng': row['center_lng']},
+        'bbox': [row['min_lng'], row['min_lat'], row['max_lng'], row['max_lat']],
+    }
+
+
+_CANDIDATES_SQL = '''
+    SELECT g.record_id, g.name, g.kind, g.area_m2, g.perimeter_m, g.length_m,
+           g.center_lat, g.center_lng, g.coordinates,
+           r.min_lat, r.max_lat, r.min_lng, r.max_lng
+    FROM field_rtree r
+    CROSS JOIN field_geometries g ON g.record_id = r.record_id  -- CROSS JOIN: let the R*Tree drive
+    WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lng >= ? AND r.min_lng <= ?
+      AND g.user_id = ?
+'''
+
+
+def fields_in_bbox(conn, user_id, min_lat, max_lat, min_lng, max_lng, limit=100):
+    """Fields whose bounding box intersects the given box."""
+    rows = conn.execute(_CANDIDATES_SQL + ' LIMIT ?',
+                        (min_lat, max_lat, min_lng, max_lng, user_id, limit)).fetchall()
+    return [_field_row_to_dict(row) for row in rows]
+
+
+def fields_near(conn, user_id, lat, lng, radius_m, limit=100):
+    """Fields within radius_m meters of a point, nearest first."""
+    rows = conn.execute(_CANDIDATES_SQL, (*radius_bbox(lat, lng, radius_m), user_id)).fetchall()
+    matches = []
+    for row in rows:
+        distance = distance_to(row['kind'], json.loads(row['coordinates']), lat, lng)
+        if distance <= radius_m:
+            field = _field_row_to_dict(row)
+            field['distance_m'] = round(distance, 2)
+            matches.append(field)
+    matches.sort(key=lambda field: field['distance_m'])
+    return matches[:limit]
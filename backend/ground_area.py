@@ -0,0 +1,155 @@
+"""Real-world area of detected regions from the ground sample distance.
+
+The ground sample distance (GSD) is the ground width covered by one pixel
+of the original photo.  It either comes with the upload (``gsd_cm``) or is
+derived from the capture metadata of a nadir shot:
+
+    GSD = altitude above ground * sensor width / (focal length * image width)
+
+Altitude above ground is DJI's XMP ``RelativeAltitude``; the GPS altitude is
+above sea level and cannot be used.  For the cameras in ``SENSOR_WIDTH_MM``
+(keyed by EXIF model) the real focal length and sensor width are used.
+Otherwise, when EXIF has the 35 mm equivalent focal length, the sensor width
+is the matching share of the 35 mm frame diagonal.  Any other camera needs
+``gsd_cm`` with the upload.
+
+Per-class totals are stored in ``analysis_class_areas`` so that questions
+like "diseased hectares this month" are one indexed SUM.
+"""
+
+import math
+
+import numpy as np
+
+FULL_FRAME_DIAGONAL_MM = math.hypot(36.0, 24.0)
+SQUARE_METERS_PER_HECTARE = 10000.0
+
+# Sensor widths of common survey drones' cameras, by EXIF Model
+SENSOR_WIDTH_MM = {
+    'FC330': 6.17,      # Phantom 4
+    'FC6310': 13.2,     # Phantom 4 Pro
+    'FC6310S': 13.2,    # Phantom 4 Pro V2.0
+    'FC6310R': 13.2,    # Phantom 4 RTK
+    'FC220': 6.17,      # Mavic Pro
+    'L1D-20C': 13.2,    # Mavic 2 Pro
+    'FC3411': 13.2,     # Air 2S
+    'L2D-20C': 17.3,    # Mavic 3
+    'M3E': 17.3,        # Mavic 3 Enterprise
+    'M3M': 17.3,        # Mavic 3 Multispectral (RGB camera)
+    'ZENMUSEP1': 35.9,  # Zenmuse P1
+}
+
+
+def ground_sample_distance(metadata, gsd_cm=None):
+    """Meters per original-image pixel, or None when it cannot be determined."""
+    if gsd_cm:
+        return float(gsd_cm) / 100
+    altitude = metadata.get('relative_altitude_m')
+    width, height = metadata.get('width'), metadata.get('height')
+    if not altitude or altitude <= 0 or not width or not height:
+        return None
+    sensor_width_mm = SENSOR_WIDTH_MM.get((metadata.get('camera_model') or '').replace(' ', '').upper())
+    if sensor_width_mm and metadata.get('focal_length_mm'):
+        return altitude * sensor_width_mm / (metadata['focal_length_mm'] * width)
+    if metadata.get('focal_length_35mm'):
+        sensor_width_mm = FULL_FRAME_DIAGONAL_MM * width / math.hypot(width, height)
+        return altitude * sensor_width_mm / (metadata['focal_length_35mm'] * width)
+    return None
+
+
+def prediction_areas(predictions):
+    """Pixel area of every prediction: its polygon if it has one, else its box.
+
+    All polygons are measured in one pass with the shoelace formula.
+    """
+    areas = np.array([float(p.get('width', 0)) * float(p.get('height', 0)) for p in predictions],
+                     dtype=np.float64)
+    polygons = [(i, p['points']) for i, p in enumerate(predictions) if len(p.get('points') or []) >= 3]
+    if not polygons:
+        return areas
+
+    owners = np.concatenate([np.full(len(points), i) for i, points in polygons])
+    xy = np.array([(pt['x'], pt['y']) for _, points in polygons for pt in points], dtype=np.float64)
+    # Next vertex within the same polygon (wrapping to its first vertex)
+    starts = np.cumsum([0] + [len(points) for _, points in polygons[:-1]])
+    lengths = np.array([len(points) for _, points in polygons])
+    offsets = np.arange(len(xy)) - np.repeat(starts, lengths)
+    following = np.repeat(starts, lengths) + (offsets + 1) % np.repeat(lengths, lengths)
+    cross = xy[:, 0] * xy[following, 1] - xy[following, 0] * xy[:, 1]
+    sums = np.bincount(owners, weights=cross, minlength=len(predictions))
+    indexes = [i for i, _ in polygons]
+    areas[indexes] = np.abs(sums[indexes]) / 2
+    return areas
+
+
+def measure_predictions(result, original_width, gsd_m):
+    """Add ``area_m2`` to each prediction and return per-class totals.
+
+    Predictions are in the coordinates of the image sent to inference
+    (``result['image']``), so their pixels are scaled back to the original
+    photo's before applying the GSD.
+    """
+    predictions = result.get('predictions') or []
+    if not predictions or not gsd_m or not original_width:
+        return {}
+    inference_width = (result.get('image') or {}).get('width') or original_width
+    meters_per_pixel = gsd_m * original_width / float(inference_width)
+    areas = prediction_areas(predictions) * meters_per_pixel ** 2
+
+    totals = {}
+    for prediction, area in zip(predictions, areas):
+        prediction['area_m2'] = round(float(area), 4)
+        entry = totals.setdefault(prediction.get('class', 'unknown'), {'area_m2': 0.0, 'detections': 0})
+        entry['area_m2'] += float(area)
+        entry['detections'] += 1
+    return totals
+
+
+def ensure_area_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analysis_class_areas (
+            analysis_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            analysis_date TEXT NOT NULL,
+            class_name TEXT NOT NULL,
+            area_m2 REAL NOT NULL,
+            detections INTEGER NOT NULL,
+            PRIMARY KEY (analysis_id, class_name)
+        ) WITHOUT ROWID
+    ''')
+    # Covers date-range totals per user without touching the table
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_class_areas_user_date
+        ON analysis_class_areas (user_id, analysis_date, class_name, area_m2, detections)
+    ''')
+
+
+def store_class_areas(cursor, analysis_id, user_id, analysis_date, totals):
+    cursor.executemany(
+        'INSERT OR REPLACE INTO analysis_class_areas VALUES (?, ?, ?, ?, ?, ?)',
+        [(analysis_id, user_id, analysis_date, class_name, entry['area_m2'], entry['detections'])
+         for class_name, entry in totals.items()]
+    )
+
+
+def delete_class_areas(cursor, analysis_ids):
+    cursor.executemany('DELETE FROM analysis_class_areas WHERE analysis_id = ?',
+                       [(analysis_id,) for analysis_id in analysis_ids])
+
+
+def class_area_totals(conn, user_id, date_from, date_to):
+    """Per-class area between two dates (inclusive, YYYY-MM-DD)."""
+    rows = conn.execute('''
+        SELECT class_name, SUM(area_m2), SUM(detections), COUNT(*)
+        FROM analysis_class_areas
+        WHERE user_id = ? AND analysis_date BETWEEN ? AND ?
+        GROUP BY class_name
+        ORDER BY SUM(area_m2) DESC
+    ''', (user_id, date_from, date_to)).fetchall()
+    return [{
+        'class': class_name,
+        'area_m2': round(area, 2),
+        'area_ha': round(area / SQUARE_METERS_PER_HECTARE, 4),
+        'detections': detections,
+        'analyses': analyses,
+    } for class_name, area, detections, analyses in rows]
@@ -0,0 +1,12 @@
+"""gunicorn settings; gunicorn reads ./gunicorn.conf.py on its own.
+
+Workers start the warm-up/maintenance thread only once they are up, which
+keeps ``--preload`` safe: the master imports app.py (so the schema is set up
+once and the imports are shared copy-on-write) but never starts worker pools
+or threads that a fork would leave half-alive.
+"""
+
+
+def post_worker_init(worker):
+    from app import start_background_work
+    start_background_work()
@@ -0,0 +1,76 @@
+"""Liveness and readiness probes.
+
+``/api/health`` (liveness) only says that the process is serving requests.
+``/api/ready`` (readiness) says that this worker can take traffic.  That
+means warm-up has finished, the database grants a write lock and the upload
+disk has room.  Whether the inference backend answers is reported as well,
+but it does not decide readiness: login, history, stats and uploads never
+call it, so a Roboflow outage must not take every instance out of rotation.
+The inference check also carries the worker's in-flight and peak upload
+buffer bytes.
+Each probe result, good or bad, is cached for ``READY_CACHE_SECONDS``.  A
+load balancer polling every second therefore costs a dictionary lookup, and
+a slow dependency is not hammered by probes.
+"""
+
+import os
+import time
+import shutil
+import sqlite3
+
+from ttl_cache import TTLCache
+
+READY_CACHE_SECONDS = float(os.getenv('READY_CACHE_SECONDS', '5'))
+READY_MIN_FREE_MB = int(os.getenv('READY_MIN_FREE_MB', '200'))
+READY_PROBE_TIMEOUT = float(os.getenv('READY_PROBE_TIMEOUT', '2'))
+
+_probes = TTLCache(maxsize=8, ttl=READY_CACHE_SECONDS)
+
+
+def _timed(probe):
+    started = time.perf_counter()
+    try:
+        result = probe()
+    except Exception as e:
+        result = {'ok': False, 'error': str(e)}
+    result['ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+def check_database(db_path):
+    """Can we get the write lock?  A stuck writer makes every analysis stall on it."""
+    conn = sqlite3.connect(db_path, timeout=READY_PROBE_TIMEOUT)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('ROLLBACK')
+    finally:
+        conn.close()
+    return {'ok': True}
+
+
+def check_disk(path):
+    free_mb = shutil.disk_usage(path).free // (1024 * 1024)
+    writable = os.access(path, os.W_OK)
+    return {'ok': writable and free_mb >= READY_MIN_FREE_MB, 'free_mb': free_mb, 'writable': writable}
+
+
+def check_inference():
+    from inference_backends import get_inference_backend, upload_memory_stats
+
+    backend = get_inference_backend()
+    ok, detail = backend.check(timeout=READY_PROBE_TIMEOUT)
+    # Image bytes this worker holds for inference uploads, to size memory limits against
+    return {'ok': ok, 'backend': backend.name, 'detail': detail, 'uploads': upload_memory_stats()}
+
+
+def readiness(db_path, upload_folder, warmed):
+    """(ready, checks) for this worker; the inference check is informational."""
+    if not warmed:
+        return False, {'warm_up': {'ok': False}}
+    checks = {
+        'warm_up': {'ok': True},
+        'database': _probes.get_or_load('database', lambda _: _timed(lambda: check_database(db_path))),
+        'disk': _probes.get_or_load('disk', lambda _: _timed(lambda: check_disk(upload_folder))),
+        'inference': _probes.get_or_load('inference', lambda _: _timed(check_inference)),
+    }
+    return all(check['ok'] for name, check in checks.items() if name != 'inference'), checks
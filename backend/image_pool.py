@@ -0,0 +1,167 @@
+"""Process pool for CPU-bound image work.
+
+PIL decoding, resizing, polygon compositing and JPEG encoding all hold the
+GIL, so running them on gunicorn's request threads serialises concurrent
+uploads inside a worker.  Image preparation and annotation rendering run
+here instead, in a small pool of processes per gunicorn worker.
+
+Decoded pixels travel between the two steps through
+``multiprocessing.shared_memory``: the prepare step leaves the RGB buffer in
+a named segment and the render step (possibly in another worker) maps it
+back, so only a segment name and the dimensions are ever pickled.
+"""
+
+import os
+import time
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+def _usable_cpus():
+    """CPUs this process may run on (the affinity mask, not the host's core count)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # macOS and Windows
+        return os.cpu_count() or 1
+
+
+# Every gunicorn worker starts its own pool, so the default stays small
+IMAGE_POOL_WORKERS = int(os.getenv('IMAGE_POOL_WORKERS', str(min(_usable_cpus(), 2))))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class PreparedImage:
+    """A prepared upload: the file sent to inference plus its pixels in shared memory."""
+
+    def __init__(self, path, width, height, shm_name, inference_size, dhash=None):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.shm_name = shm_name
+        self.inference_size = inference_size
+        self.dhash = dhash  # perceptual hash of the pixels, for near-duplicate search
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    def release(self):
+        """Free the shared pixel buffer; safe to call more than once."""
+        if self.shm_name is None:
+            return
+        try:
+            shm = shared_memory.SharedMemory(name=self.shm_name)
+            shm.close()
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+        self.shm_name = None
+
+
+# ---------------------------------------------------------------------------
+# Worker-side functions (run inside the pool processes)
+# ---------------------------------------------------------------------------
+
+def _warm_worker():
+    # Importing PIL and the drawing code is most of a cold worker's first-task cost
+    from image_processing import warm_renderer
+    warm_renderer()
+    return os.getpid()
+
+
+def _prepare_worker(input_path, max_size, native_size, budget):
+    from image_processing import prepare_image
+    from perceptual_hash import dhash
+
+    path, image, inference_size = prepare_image(input_path, max_size, native_size, budget)
+    width, height = image.size
+    shm = shared_memory.SharedMemory(create=True, size=width * height * 3)
+    try:
+        shm.buf[:width * height * 3] = image.tobytes()
+    finally:
+        shm.close()
+    return path, width, height, shm.name, inference_size, dhash(image)
+
+
+def _render_worker(shm_name, width, height, predictions, output_path, output_format=None, quality=None):
+    from PIL import Image
+    from image_processing import annotate_image
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        view = Image.frombuffer('RGB', (width, height), shm.buf, 'raw', 'RGB', 0, 1)
+        image = view.copy()
+        del view  # drop the buffer export before closing the mapping
+    finally:
+        shm.close()
+    return annotate_image(image, predictions, output_path, output_format, quality)
+
+
+# ---------------------------------------------------------------------------
+# Request-thread API
+# ---------------------------------------------------------------------------
+
+def get_image_pool():
+    """Return the shared pool, (re)creating it if needed. None when disabled."""
+    global _pool
+    if IMAGE_POOL_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=IMAGE_POOL_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool
+
+
+def _run(fn, *args):
+    """Run fn in the pool, falling back to the calling thread if the pool died."""
+    global _pool
+    pool = get_image_pool()
+    if pool is None:
+        return fn(*args)
+    try:
+        return pool.submit(fn, *args).result()
+    except BrokenProcessPool:
+        print("⚠️  Image pool broken, recreating it and running this task inline")
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        return fn(*args)
+
+
+def prepare_upload(input_path, max_size, native_size=None, budget=None):
+    """Resize/normalise an upload off the request thread.
+
+    Pass the model's ``native_size`` to let the inference resolution adapt to
+    the image (see image_processing.choose_inference_size).
+    """
+    return PreparedImage(*_run(_prepare_worker, input_path, max_size, native_size, budget))
+
+
+def render_annotation(prepared, predictions, output_path, output_format=None, quality=None):
+    """Render the annotated image for a prepared upload off the request thread.
+
+    Returns annotate_image's encoding summary, or False if drawing failed.
+    """
+    return _run(_render_worker, prepared.shm_name, prepared.width, prepared.height,
+                predictions, output_path, output_format, quality)
+
+
+def warm_image_pool():
+    """Start every worker so the first uploads don't pay for process spawn and imports."""
+    if multiprocessing.parent_process() is not None:
+        return
+    pool = get_image_pool()
+    if pool is None:
+        return
+    started = time.perf_counter()
+    futures = [pool.submit(_warm_worker) for _ in range(IMAGE_POOL_WORKERS)]
+    pids = {future.result() for future in futures}
+    print(f"🔥 Image pool warm: {len(pids)} worker(s) in {time.perf_counter() - started:.2f}s")
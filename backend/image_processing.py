@@ -0,0 +1,329 @@
+"""Image preparation and annotation rendering for the analysis pipeline."""
+
+import os
+import time
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont, ImageStat
+
+from class_styles import class_colors
+
+INFERENCE_BUDGET = os.getenv('INFERENCE_BUDGET', 'balanced')
+INFERENCE_BUDGETS = ('latency', 'balanced', 'quality')
+INFERENCE_DETAIL_THRESHOLD = float(os.getenv('INFERENCE_DETAIL_THRESHOLD', '0.12'))
+# TTF for annotation labels; default is the font built into Pillow, which renders the same everywhere
+ANNOTATION_FONT = os.getenv('ANNOTATION_FONT', '')
+# jpeg and webp carry the photo; overlay is a transparent PNG of the drawings only,
+# laid over the original image by the client
+ANNOTATION_FORMATS = ('jpeg', 'webp', 'overlay')
+ANNOTATION_FORMAT = os.getenv('ANNOTATION_FORMAT', 'jpeg')
+ANNOTATION_QUALITY = int(os.getenv('ANNOTATION_QUALITY', '85'))
+ANNOTATION_EXTENSIONS = {'jpeg': '.jpg', 'webp': '.webp', 'overlay': '.png'}
+if ANNOTATION_FORMAT not in ANNOTATION_FORMATS:
+    print(f"⚠️  Unknown ANNOTATION_FORMAT {ANNOTATION_FORMAT!r}, using jpeg")
+    ANNOTATION_FORMAT = 'jpeg'
+
+
+def fit_within(width, height, max_size):
+    """Size that fits inside max_size x max_size keeping the aspect ratio (never upscales)"""
+    if width <= max_size and height <= max_size:
+        return width, height
+    if width > height:
+        return max_size, int((height * max_size) / width)
+    return int((width * max_size) / height), max_size
+
+def resize_image_for_api(input_path, max_size=1024):
+    """Resize image to be under the API limit while maintaining aspect ratio"""
+    try:
+        with Image.open(input_path) as img:
+            print(f"📐 Original size: {img.size}")
+            
+            # Calculate new size maintaining aspect ratio
+            width, height = img.size
+            new_width, new_height = fit_within(width, height, max_size)
+            
+            if (new_width, new_height) != (width, height):
+                # Resize image
+                resized_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+                
+                # Save resized image
+                base_name = os.path.splitext(input_path)[0]
+                output_path = f"{base_name}_resized.jpg"
+                resized_img.save(output_path, "JPEG", quality=85)
+                
+                print(f"📐 Resized to: {new_width}x{new_height}")
+                return output_path
+            else:
+                print("📐 Image size is good, no resizing needed")
+                return input_path
+                
+    except Exception as e:
+        print(f"❌ Resize error: {str(e)}")
+        return input_path  # Return original if resize fails
+
+def image_detail(input_path, sample_size=256):
+    """Edge density of a small greyscale thumbnail, 0 (flat) to 1 (busy).
+
+    Uses the JPEG decoder's draft mode, so only a fraction of the DCT
+    coefficients are decoded even for very large frames.
+    """
+    with Image.open(input_path) as img:
+        img.draft('L', (sample_size, sample_size))
+        thumb = img.convert('L')
+        thumb.thumbnail((sample_size, sample_size))
+        edges = thumb.filter(ImageFilter.FIND_EDGES)
+        return ImageStat.Stat(edges).mean[0] / 255.0
+
+def choose_inference_size(input_path, width, height, native_size, max_size, budget=None):
+    """Pick the inference resolution for one image.
+
+    ``budget`` is ``latency`` (the model's native size), ``quality`` (up to
+    max_size), ``balanced`` (twice native, or up to max_size for detailed
+    frames) or an explicit pixel limit.  The result never exceeds the image's
+    own long side, so small screenshots are sent as they are.
+    """
+    long_side = max(width, height)
+    budget = budget or INFERENCE_BUDGET
+
+    if isinstance(budget, int) or str(budget).isdigit():
+        cap = int(budget)
+    elif budget == 'latency':
+        cap = native_size
+    elif budget == 'quality':
+        cap = max_size
+    else:
+        cap = native_size * 2
+        if long_side > cap and image_detail(input_path) >= INFERENCE_DETAIL_THRESHOLD:
+            cap = max_size
+    cap = max(native_size, min(cap, max_size))
+
+    if long_side <= cap:
+        return long_side
+    # Stride-aligned sizes avoid a second resample inside the model server
+    return max(native_size, cap - cap % 32)
+
+def prepare_image(input_path, max_size=1024, native_size=None, budget=None):
+    """Decode, downscale and normalise an upload for inference.
+
+    Returns ``(prepared_path, image, inference_size)`` where ``image`` is the
+    RGB pixel data matching the file at ``prepared_path``, so callers can
+    annotate without decoding the JPEG a second time.  With ``native_size``
+    the resolution is chosen per image by choose_inference_size(), otherwise
+    max_size is used as is.
+    """
+    with Image.open(input_path) as img:
+        print(f"📐 Original size: {img.size}")
+        width, height = img.size
+        if native_size:
+            max_size = choose_inference_size(input_path, width, height, native_size, max_size, budget)
+            print(f"📐 Inference size for budget {budget or INFERENCE_BUDGET}: {max_size}")
+        new_width, new_height = fit_within(width, height, max_size)
+
+        # GIFs and TIFFs are re-encoded anyway: the backend gets the first frame only
+        if (new_width, new_height) == (width, height) and img.format in ('JPEG', 'PNG'):
+            print("📐 Image size is good, no resizing needed")
+            return input_path, img.convert('RGB'), max_size
+
+        # Let the JPEG decoder skip detail we are about to throw away
+        img.draft('RGB', (new_width, new_height))
+        image = img.convert('RGB')
+        if image.size != (new_width, new_height):
+            image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+
+    base_name = os.path.splitext(input_path)[0]
+    output_path = f"{base_name}_resized.jpg"
+    image.save(output_path, "JPEG", quality=85)
+    print(f"📐 Prepared {new_width}x{new_height}: {output_path}")
+    return output_path, image, max_size
+
+def draw_predictions_on_image(image_path, predictions, output_path):
+    """Draw instance segmentation polygons and labels exactly like Roboflow interface"""
+    try:
+        # Open the original image
+        image = Image.open(image_path).convert('RGB')
+    except Exception as e:
+        print(f"Error opening image for annotation: {str(e)}")
+        return False
+    return annotate_image(image, predictions, output_path)
+
+class AnnotationRenderer:
+    """Per-process drawing state reused across annotations.
+
+    Fonts are loaded once per size and label images (text on its class
+    colored box) are rendered once and pasted from then on, so the image
+    workers pay those costs on their first annotation only.
+    """
+
+    def __init__(self, font_path=ANNOTATION_FONT):
+        self.font_path = font_path
+
+    @lru_cache(maxsize=16)
+    def font(self, size):
+        if self.font_path:
+            try:
+                return ImageFont.truetype(self.font_path, size)
+            except OSError:
+                print(f"⚠️  Could not load ANNOTATION_FONT {self.font_path}, using the built-in font")
+        try:
+            # Pillow's own FreeType font: the same labels on every OS
+            return ImageFont.load_default(size)
+        except (TypeError, ImportError):
+            return ImageFont.load_default()  # Pillow without FreeType: fixed-size bitmap font
+
+    @lru_cache(maxsize=1024)
+    def label(self, text, fill_color, font_size):
+        """(RGBA image, padding) of a label: black text on a class-colored, black-bordered box"""
+        font = self.font(font_size)
+        measure = ImageDraw.Draw(Image.new('RGBA', (1, 1)))
+        bbox = measure.textbbox((0, 0), text, font=font)
+        label_width = bbox[2] - bbox[0]
+        label_height = bbox[3] - bbox[1]
+        padding = 6
+        # Glyphs may reach below the measured box; leave room so nothing is clipped
+        canvas = Image.new('RGBA', (label_width + 2 * padding + 1,
+                                    max(label_height, bbox[3]) + 2 * padding + 1), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(canvas)
+        draw.rectangle([0, 0, label_width + 2 * padding, label_height + 2 * padding],
+                       fill=fill_color, outline=(0, 0, 0), width=2)
+        draw.text((padding, padding), text, fill=(0, 0, 0), font=font)
+        return canvas, label_width, label_height, padding
+
+    def fill_polygon(self, image, polygon_points, color):
+        """Blend a semi-transparent polygon into image, touching only its bounding box"""
+        left = max(0, int(min(p[0] for p in polygon_points)))
+        top = max(0, int(min(p[1] for p in polygon_points)))
+        right = min(image.width, int(max(p[0] for p in polygon_points)) + 2)
+        bottom = min(image.height, int(max(p[1] for p in polygon_points)) + 2)
+        region = image.crop((left, top, right, bottom)).convert('RGBA')
+        overlay = Image.new('RGBA', region.size, (0, 0, 0, 0))
+        ImageDraw.Draw(overlay).polygon([(x - left, y - top) for x, y in polygon_points], fill=color)
+        image.paste(Image.alpha_composite(region, overlay).convert(image.mode), (left, top))
+
+_renderer = None
+
+def get_renderer():
+    global _renderer
+    if _renderer is None:
+        _renderer = AnnotationRenderer()
+    return _renderer
+
+def save_annotation(image, output_path, output_format, quality):
+    """Encode an annotated image; returns (bytes written, encode ms)"""
+    started = time.perf_counter()
+    if output_format == 'overlay':
+        image.save(output_path, format='PNG')
+    elif output_format == 'webp':
+        image.save(output_path, format='WEBP', quality=quality, method=2)
+    else:
+        # Optimized Huffman tables and progressive scans: smaller files, first pass paints sooner
+        image.save(output_path, format='JPEG', quality=quality, optimize=True, progressive=True)
+    return os.path.getsize(output_path), round((time.perf_counter() - started) * 1000, 1)
+
+def annotate_image(image, predictions, output_path, output_format=None, quality=None):
+    """Draw predictions onto an already decoded RGB image and save it to output_path
+
+    ``output_format`` is one of ANNOTATION_FORMATS (default ANNOTATION_FORMAT).
+    Returns ``{'format', 'quality', 'bytes', 'encode_ms'}``, or False on failure.
+    """
+    try:
+        output_format = output_format or ANNOTATION_FORMAT
+        quality = quality or ANNOTATION_QUALITY
+        if output_format == 'overlay':
+            # Only the drawings: the photo is never re-encoded
+            image = Image.new('RGBA', image.size, (0, 0, 0, 0))
+        renderer = get_renderer()
+        draw = ImageDraw.Draw(image)
+        
+        # Get image dimensions
+        img_width, img_height = image.size
+        font_size = max(16, min(32, img_width // 50))
+        
+        print(f"Drawing {len(predictions)} segmentation masks on image {img_width}x{img_height}")
+        
+        # Draw each prediction
+        for i, prediction in enumerate(predictions):
+            class_name = prediction.get('class', 'Unknown')
+            confidence = prediction.get('confidence', 0)
+            fill_color, outline_color = class_colors(class_name)
+            
+            print(f"Processing prediction {i+1}: {class_name} with confidence {confidence:.3f}")
+            
+            # Check if this is instance segmentation (has points)
+            if 'points' in prediction and prediction['points']:
+                points = prediction['points']
+                print(f"Found {len(points)} polygon points for segmentation")
+                
+                # Convert points to PIL format
+                polygon_points = []
+                for point in points:
+                    x = max(0, min(point['x'], img_width - 1))
+                    y = max(0, min(point['y'], img_height - 1))
+                    polygon_points.append((x, y))
+                
+                if len(polygon_points) >= 3:  # Need at least 3 points for a polygon
+                    # Semi-transparent filled polygon like Roboflow
+                    renderer.fill_polygon(image, polygon_points, fill_color + (80,))
+                    
+                    # Draw thick outline polygon like Roboflow
+                    draw.polygon(polygon_points, outline=outline_color, width=4)
+                    
+                    # Calculate label position (centroid of polygon)
+                    center_x = sum(p[0] for p in polygon_points) // len(polygon_points)
+                    center_y = sum(p[1] for p in polygon_points) // len(polygon_points)
+                    
+                    # Class-colored label with a black border, rendered once per text and size
+                    label, label_width, label_height, padding = renderer.label(
+                        f"{class_name} {confidence:.0%}", fill_color, font_size)
+                    
+                    # Position label around polygon centroid and clamp to image bounds
+                    label_x = center_x - label_width // 2
+                    label_y = center_y - label_height // 2
+                    label_x = max(5, min(label_x, img_width - label_width - 5))
+                    label_y = max(5, min(label_y, img_height - label_height - 5))
+                    image.paste(label, (int(label_x) - padding, int(label_y) - padding), label)
+                    
+                    print(f"Drew segmentation mask with {len(polygon_points)} points")
+                else:
+                    print(f"Not enough points ({len(polygon_points)}) to draw polygon")
+            
+            else:
+                # Fallback to bounding box if no segmentation points
+                print("No segmentation points found, drawing bounding box instead")
+                x = prediction.get('x', 0)
+                y = prediction.get('y', 0)
+                width = prediction.get('width', 0)
+                height = prediction.get('height', 0)
+                
+                if width > 0 and height > 0:
+                    left = x - width / 2
+                    top = y - height / 2
+                    right = x + width / 2
+                    bottom = y + height / 2
+                    
+                    # Clamp to image bounds
+                    left = max(0, min(left, img_width))
+                    top = max(0, min(top, img_height))
+                    right = max(0, min(right, img_width))
+                    bottom = max(0, min(bottom, img_height))
+                    
+                    # Draw bounding box
+                    draw.rectangle([left, top, right, bottom], outline=outline_color, width=3)
+        
+        # Save the annotated image
+        file_size, encode_ms = save_annotation(image, output_path, output_format, quality)
+        print(f"✅ Annotated image saved to: {output_path}")
+        print(f"📁 File size: {file_size} bytes ({output_format}, encoded in {encode_ms} ms)")
+        return {'format': output_format, 'quality': None if output_format == 'overlay' else quality,
+                'bytes': file_size, 'encode_ms': encode_ms}
+        
+    except Exception as e:
+        print(f"Error drawing segmentation: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+def warm_renderer():
+    """Load the fonts for every label size before the first real annotation"""
+    renderer = get_renderer()
+    for size in range(16, 33):
+        renderer.font(size)
@@ -0,0 +1,710 @@
+"""Inference backends for crop segmentation.
+
+Every backend exposes ``infer(image_path, confidence=None, overlap=None,
+image_size=None)`` and returns a Roboflow-style result dict::
+
+    {'inference_id': ..., 'time': ..., 'image': {'width': .., 'height': ..},
+     'predictions': [{'x', 'y', 'width', 'height', 'confidence', 'class',
+                      'class_id', 'points': [{'x', 'y'}, ...], 'detection_id'}]}
+
+``infer_async`` takes the same arguments and is awaited by the ASGI entry
+point (asgi.py) instead of blocking a thread.
+
+``INFERENCE_BACKEND=roboflow`` (default) calls the hosted Roboflow endpoint,
+``INFERENCE_BACKEND=onnx`` runs a YOLOv8-seg style ONNX export on the CPU in
+a process pool where every worker loads the model once.
+"""
+
+import os
+import time
+import uuid
+import base64
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'roboflow').lower()
+
+# Roboflow API configuration
+ROBOFLOW_API_URL = "https://serverless.roboflow.com"
+ROBOFLOW_API_KEY = os.getenv('ROBOFLOW_API_KEY')
+ROBOFLOW_MODEL_ID = "agridroneinsightdetection-zcptl/4"  # Always use v4 model for consistent results
+ROBOFLOW_CONFIDENCE = int(os.getenv('ROBOFLOW_CONFIDENCE', '50'))
+ROBOFLOW_OVERLAP = int(os.getenv('ROBOFLOW_OVERLAP', '30'))
+ROBOFLOW_IMAGE_SIZE = int(os.getenv('ROBOFLOW_IMAGE_SIZE', '2048'))
+ROBOFLOW_NATIVE_SIZE = int(os.getenv('ROBOFLOW_NATIVE_SIZE', '640'))  # training resolution of the hosted model
+
+# Local ONNX Runtime configuration
+ONNX_MODEL_PATH = os.getenv('ONNX_MODEL_PATH', os.path.join(os.path.dirname(__file__), 'models', 'agridrone-seg.onnx'))
+ONNX_CLASS_NAMES = os.getenv('ONNX_CLASS_NAMES', '')
+ONNX_WORKERS = int(os.getenv('ONNX_WORKERS', str(max(1, (os.cpu_count() or 2) // 2))))
+ONNX_THREADS_PER_WORKER = int(os.getenv('ONNX_THREADS_PER_WORKER', '1'))
+ONNX_MASK_THRESHOLD = float(os.getenv('ONNX_MASK_THRESHOLD', '0.5'))
+ONNX_MAX_POLYGON_POINTS = int(os.getenv('ONNX_MAX_POLYGON_POINTS', '200'))
+
+# Keep-alive connections to Roboflow per worker (blocking client), and for the async client (ASGI mode)
+ROBOFLOW_HTTP_POOL = int(os.getenv('ROBOFLOW_HTTP_POOL', '16'))
+ASYNC_INFERENCE_CONNECTIONS = int(os.getenv('ASYNC_INFERENCE_CONNECTIONS', '400'))
+
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+ROBOFLOW_DETECT_URL = "https://detect.roboflow.com"
+
+_http = None
+_http_lock = threading.Lock()
+
+_upload_lock = threading.Lock()
+_upload_in_flight_bytes = 0
+_upload_peak_bytes = 0
+
+
+def _http_session():
+    """Shared requests session so inference calls reuse warm TLS connections."""
+    global _http
+    with _http_lock:
+        if _http is None:
+            _http = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=ROBOFLOW_HTTP_POOL)
+            _http.mount('https://', adapter)
+            _http.mount('http://', adapter)
+        return _http
+
+
+def upload_memory_stats():
+    """Image bytes currently buffered by in-flight inference uploads, and the high-water mark"""
+    with _upload_lock:
+        return {'in_flight_bytes': _upload_in_flight_bytes, 'peak_bytes': _upload_peak_bytes}
+
+
+def _track_upload_bytes(delta):
+    global _upload_in_flight_bytes, _upload_peak_bytes
+    with _upload_lock:
+        _upload_in_flight_bytes += delta
+        _upload_peak_bytes = max(_upload_peak_bytes, _upload_in_flight_bytes)
+        return _upload_in_flight_bytes
+
+
+def _read_image_buffer(image):
+    """Load the image into one preallocated buffer and return a memoryview of it.
+
+    Bytes-like input is wrapped without copying.  Files are read with a single
+    readinto() and closed straight away rather than held open for the whole
+    request.
+    """
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return memoryview(image)
+    with open(image, 'rb') as image_file:
+        buffer = bytearray(os.fstat(image_file.fileno()).st_size)
+        image_file.readinto(buffer)
+    return memoryview(buffer)
+
+
+class _StreamingBody:
+    """Request body produced piecewise from a memoryview.
+
+    Having ``__len__`` makes requests send a Content-Length instead of chunked
+    transfer encoding, and ``__iter__`` lets http.client write each slice
+    straight to the socket without joining them into one bytes object.
+    """
+
+    def __init__(self, head, view, tail, encode=None, encoded_length=None):
+        self._head = head
+        self._view = view
+        self._tail = tail
+        self._encode = encode
+        self._length = len(head) + (encoded_length if encode else len(view)) + len(tail)
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        if self._head:
+            yield self._head
+        # base64 needs input slices that are a multiple of 3 bytes to concatenate cleanly
+        step = UPLOAD_CHUNK_SIZE - UPLOAD_CHUNK_SIZE % 3
+        for offset in range(0, len(self._view), step):
+            chunk = self._view[offset:offset + step]
+            yield self._encode(chunk) if self._encode else chunk
+        if self._tail:
+            yield self._tail
+
+
+def _multipart_body(view, field_name='file', filename='image.jpg', content_type='image/jpeg'):
+    boundary = uuid.uuid4().hex
+    head = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="{field_name}"; filename="{filename}"\r\n'
+        f'Content-Type: {content_type}\r\n\r\n'
+    ).encode('ascii')
+    tail = f'\r\n--{boundary}--\r\n'.encode('ascii')
+    return _StreamingBody(head, view, tail), f'multipart/form-data; boundary={boundary}'
+
+
+def _base64_body(view):
+    encoded_length = 4 * ((len(view) + 2) // 3)
+    return _StreamingBody(b'', view, b'', encode=base64.b64encode, encoded_length=encoded_length)
+
+
+def _roboflow_params(confidence, overlap, image_size):
+    return {
+        'api_key': ROBOFLOW_API_KEY,
+        'confidence': str(int(confidence or ROBOFLOW_CONFIDENCE)),
+        'overlap': str(int(overlap or ROBOFLOW_OVERLAP)),
+        'image_size': str(int(image_size or ROBOFLOW_IMAGE_SIZE)),
+        'format': 'json'
+    }
+
+
+def call_roboflow_inference(image_path, model_id, confidence=None, overlap=None, image_size=None):
+    """Call Roboflow API using correct endpoint and image sizing
+
+    ``image_path`` may also be a bytes-like object holding an encoded image
+    that is already within ``image_size``.
+    """
+    # Imported here to keep the worker processes free of the Flask app
+    from image_processing import resize_image_for_api
+
+    view = None
+    try:
+        print(f"Making inference call for model: {model_id}")
+
+        # Resize image for API if needed
+        target_size = int(image_size or ROBOFLOW_IMAGE_SIZE)
+        if not isinstance(image_path, (bytes, bytearray, memoryview)):
+            print(f"Image path: {image_path}")
+            image_path = resize_image_for_api(image_path, max_size=target_size)
+            print(f"Using resized image: {image_path}")
+
+        view = _read_image_buffer(image_path)
+        in_flight = _track_upload_bytes(len(view))
+        print(f"📦 Upload buffer: {len(view)} bytes (all in-flight uploads: {in_flight} bytes)")
+
+        # Use correct endpoint - detect.roboflow.com works!
+        api_endpoint = f"{ROBOFLOW_DETECT_URL}/{model_id}"
+
+        # Stream the image as a multipart 'file' field straight from the buffer
+        body, content_type = _multipart_body(view)
+        params = _roboflow_params(confidence, overlap, target_size)
+
+        print(f"Making request to: {api_endpoint}")
+        print(f"API Key (first 10 chars): {str(ROBOFLOW_API_KEY)[:10]}...")
+
+        # Make the API call with extended timeout for processing
+        print(f"🚀 Starting API request... (this may take 30-60 seconds)")
+        response = _http_session().post(
+            api_endpoint,
+            data=body,
+            headers={'Content-Type': content_type},
+            params=params,
+            timeout=120  # Increased to 2 minutes for processing time
+        )
+
+        print(f"Response status code: {response.status_code}")
+        print(f"Response headers: {dict(response.headers)}")
+
+        if response.status_code == 200:
+            result = response.json()
+            print(f"Inference successful!")
+            print(f"Result keys: {list(result.keys()) if isinstance(result, dict) else 'Not a dict'}")
+            return result
+        else:
+            print(f"API Error: {response.status_code}")
+            print(f"Response text: {response.text}")
+
+            # Try alternative format with base64 encoding
+            return call_roboflow_inference_base64(view, model_id, confidence=confidence, overlap=overlap, image_size=image_size)
+
+    except Exception as e:
+        print(f"Multipart inference call failed: {str(e)}")
+        import traceback
+        traceback.print_exc()
+
+        # Try alternative format with base64 encoding
+        return call_roboflow_inference_base64(view if view is not None else image_path, model_id,
+                                              confidence=confidence, overlap=overlap, image_size=image_size)
+    finally:
+        if view is not None:
+            _track_upload_bytes(-len(view))
+
+
+def call_roboflow_inference_base64(image_path, model_id, confidence=None, overlap=None, image_size=None):
+    """Alternative Roboflow API call using base64 encoding
+
+    The body is base64-encoded one chunk at a time while it is sent, so the
+    encoded image never exists as a whole in memory.
+    """
+    try:
+        print(f"Trying base64 inference for model: {model_id}")
+
+        owns_buffer = not isinstance(image_path, memoryview)
+        view = _read_image_buffer(image_path)
+        if owns_buffer:
+            _track_upload_bytes(len(view))
+
+        try:
+            # Use correct endpoint for base64 as well
+            api_endpoint = f"{ROBOFLOW_DETECT_URL}/{model_id}"
+
+            # Prepare headers and data
+            headers = {
+                'Content-Type': 'application/x-www-form-urlencoded'
+            }
+            params = _roboflow_params(confidence, overlap, image_size)
+
+            print(f"Making base64 request to: {api_endpoint}")
+
+            # Make the API call with extended timeout
+            print(f"🚀 Starting base64 API request... (this may take 30-60 seconds)")
+            response = _http_session().post(
+                api_endpoint,
+                data=_base64_body(view),
+                headers=headers,
+                params=params,
+                timeout=120  # Increased timeout
+            )
+        finally:
+            if owns_buffer:
+                _track_upload_bytes(-len(view))
+
+        print(f"Base64 response status code: {response.status_code}")
+
+        if response.status_code == 200:
+            result = response.json()
+            print(f"Base64 inference successful!")
+            print(f"Result keys: {list(result.keys()) if isinstance(result, dict) else 'Not a dict'}")
+            return result
+        else:
+            print(f"Base64 API Error: {response.status_code}")
+            print(f"Response text: {response.text}")
+            return None
+
+    except Exception as e:
+        print(f"Base64 inference call failed: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+
+async def _async_body(body):
+    for chunk in body:
+        yield chunk
+
+
+_async_client = None
+
+
+def _get_async_client():
+    """One httpx.AsyncClient per process (ASGI mode runs a single event loop)."""
+    global _async_client
+    if _async_client is None:
+        import httpx  # only needed in ASGI mode
+        _async_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(120, connect=10),
+            limits=httpx.Limits(max_connections=ASYNC_INFERENCE_CONNECTIONS,
+                                max_keepalive_connections=min(ASYNC_INFERENCE_CONNECTIONS, 64)),
+        )
+    return _async_client
+
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+async def _post_async(api_endpoint, body, content_type, params):
+    response = await _get_async_client().post(
+        api_endpoint,
+        content=_async_body(body),
+        headers={'Content-Type': content_type, 'Content-Length': str(len(body))},
+        params=params,
+    )
+    print(f"Response status code: {response.status_code}")
+    if response.status_code == 200:
+        return response.json()
+    print(f"API Error: {response.status_code}")
+    print(f"Response text: {response.text}")
+    return None
+
+
+async def call_roboflow_inference_async(image_path, model_id, confidence=None, overlap=None, image_size=None):
+    """call_roboflow_inference for an event loop.
+
+    The request waits on the network without holding a thread, so one process
+    can keep hundreds of inferences in flight.  Resizing and reading the file
+    run in the default thread pool.  The multipart/base64 fallback is the same
+    as in the blocking version.
+    """
+    from image_processing import resize_image_for_api
+
+    view = None
+    try:
+        print(f"Making async inference call for model: {model_id}")
+        target_size = int(image_size or ROBOFLOW_IMAGE_SIZE)
+        if not isinstance(image_path, (bytes, bytearray, memoryview)):
+            image_path = await asyncio.to_thread(resize_image_for_api, image_path, max_size=target_size)
+
+        view = await asyncio.to_thread(_read_image_buffer, image_path)
+        in_flight = _track_upload_bytes(len(view))
+        print(f"📦 Upload buffer: {len(view)} bytes (all in-flight uploads: {in_flight} bytes)")
+
+        api_endpoint = f"{ROBOFLOW_DETECT_URL}/{model_id}"
+        params = _roboflow_params(confidence, overlap, target_size)
+        body, content_type = _multipart_body(view)
+        try:
+            result = await _post_async(api_endpoint, body, content_type, params)
+        except Exception as e:
+            print(f"Multipart inference call failed: {str(e)}")
+            result = None
+        if result is None:
+            print(f"Trying base64 inference for model: {model_id}")
+            result = await _post_async(api_endpoint, _base64_body(view),
+                                       'application/x-www-form-urlencoded', params)
+        if result is not None:
+            print(f"Inference successful!")
+        return result
+
+    except Exception as e:
+        print(f"Async inference call failed: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return None
+    finally:
+        if view is not None:
+            _track_upload_bytes(-len(view))
+
+
+class RoboflowHTTPBackend:
+    """Hosted Roboflow detect endpoint."""
+
+    name = 'roboflow'
+
+    def __init__(self, model_id=ROBOFLOW_MODEL_ID, native_size=ROBOFLOW_NATIVE_SIZE):
+        self.model_id = model_id
+        self.native_size = native_size
+
+    def warm(self):
+        # Opens (and keeps) a connection so the first inference skips DNS and the TLS handshake
+        _, detail = self.check()
+        print(f"🔥 Roboflow connection: {detail}")
+
+    def check(self, timeout=3):
+        """(reachable, detail) for readiness probes."""
+        try:
+            response = _http_session().head(ROBOFLOW_DETECT_URL, timeout=timeout)
+        except requests.RequestException as e:
+            return False, f"unreachable: {e.__class__.__name__}"
+        return response.status_code < 500, f"HTTP {response.status_code}"
+
+    def infer(self, image_path, confidence=None, overlap=None, image_size=None):
+        return call_roboflow_inference(image_path, self.model_id, confidence=confidence,
+                                       overlap=overlap, image_size=image_size)
+
+    async def infer_async(self, image_path, confidence=None, overlap=None, image_size=None):
+        return await call_roboflow_inference_async(image_path, self.model_id, confidence=confidence,
+                                                   overlap=overlap, image_size=image_size)
+
+    def shutdown(self):
+        pass
+
+
+# ---------------------------------------------------------------------------
+# Local ONNX Runtime backend
+#
+# Everything below that starts with ``_onnx_`` runs inside the pool workers.
+# Each worker builds one InferenceSession in its initializer and keeps it in
+# module globals for the lifetime of the process.
+# ---------------------------------------------------------------------------
+
+_onnx_session = None
+_onnx_class_names = []
+_onnx_input_size = 640
+
+
+def _parse_class_names(session, override):
+    if override:
+        return [name.strip() for name in override.split(',') if name.strip()]
+
+    # Ultralytics exports store "{0: 'name', ...}" in the model metadata
+    names = session.get_modelmeta().custom_metadata_map.get('names')
+    if names:
+        import ast
+        try:
+            parsed = ast.literal_eval(names)
+            if isinstance(parsed, dict):
+                return [parsed[k] for k in sorted(parsed)]
+            return list(parsed)
+        except (ValueError, SyntaxError):
+            pass
+    return []
+
+
+def _onnx_init_worker(model_path, class_names, threads):
+    global _onnx_session, _onnx_class_names, _onnx_input_size
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+    _onnx_session = ort.InferenceSession(model_path, sess_options=options, providers=['CPUExecutionProvider'])
+    _onnx_class_names = _parse_class_names(_onnx_session, class_names)
+
+    shape = _onnx_session.get_inputs()[0].shape
+    if isinstance(shape[-1], int):
+        _onnx_input_size = shape[-1]
+    print(f"🧠 ONNX worker {os.getpid()} loaded {model_path} (input {_onnx_input_size}px, {len(_onnx_class_names)} classes)")
+
+
+def _onnx_warm_worker():
+    """Run one dummy forward pass so the first real request doesn't pay for allocation."""
+    import numpy as np
+
+    size = _onnx_input_size
+    dummy = np.zeros((1, 3, size, size), dtype=np.float32)
+    _onnx_session.run(None, {_onnx_session.get_inputs()[0].name: dummy})
+    return os.getpid(), size
+
+
+def _letterbox(image, size):
+    """Scale to fit a size x size square, padding with grey like the training pipeline."""
+    import numpy as np
+    from PIL import Image
+
+    width, height = image.size
+    scale = min(size / width, size / height)
+    new_width, new_height = max(1, round(width * scale)), max(1, round(height * scale))
+    pad_x, pad_y = (size - new_width) // 2, (size - new_height) // 2
+
+    canvas = Image.new('RGB', (size, size), (114, 114, 114))
+    canvas.paste(image.resize((new_width, new_height), Image.Resampling.BILINEAR), (pad_x, pad_y))
+
+    tensor = np.asarray(canvas, dtype=np.float32).transpose(2, 0, 1)[None] / 255.0
+    return tensor, scale, pad_x, pad_y
+
+
+def _nms(boxes, scores, iou_threshold):
+    """Plain greedy NMS over xyxy boxes."""
+    import numpy as np
+
+    order = scores.argsort()[::-1]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        xx1 = np.maximum(boxes[i, 0], boxes[order[1:], 0])
+        yy1 = np.maximum(boxes[i, 1], boxes[order[1:], 1])
+        xx2 = np.minimum(boxes[i, 2], boxes[order[1:], 2])
+        yy2 = np.minimum(boxes[i, 3], boxes[order[1:], 3])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        iou = inter / (areas[i] + areas[order[1:]] - inter + 1e-9)
+        order = order[1:][iou <= iou_threshold]
+    return keep
+
+
+def _mask_to_polygon(mask, max_points):
+    """Trace a polygon around a binary mask by scanning its rows.
+
+    Walks the leftmost filled pixel of every row top to bottom and the
+    rightmost back up.  That is exact for row-convex regions, which covers
+    field-area masks well, and avoids pulling in OpenCV just for contours.
+    """
+    import numpy as np
+
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size < 2:
+        return []
+
+    row_masks = mask[rows]
+    left = row_masks.argmax(axis=1)
+    right = mask.shape[1] - 1 - row_masks[:, ::-1].argmax(axis=1)
+
+    xs = np.concatenate([left, right[::-1] + 1])
+    ys = np.concatenate([rows, rows[::-1]])
+    if xs.size > max_points:
+        step = int(np.ceil(xs.size / max_points))
+        xs, ys = xs[::step], ys[::step]
+    return list(zip(xs.tolist(), ys.tolist()))
+
+
+def _onnx_infer(image_path, confidence, overlap):
+    import numpy as np
+    from PIL import Image
+
+    started = time.perf_counter()
+    with Image.open(image_path) as img:
+        image = img.convert('RGB')
+    img_width, img_height = image.size
+
+    size = _onnx_input_size
+    tensor, scale, pad_x, pad_y = _letterbox(image, size)
+    outputs = _onnx_session.run(None, {_onnx_session.get_inputs()[0].name: tensor})
+
+    # YOLOv8-seg: (1, 4 + classes + mask_dims, anchors) and (1, mask_dims, mh, mw)
+    raw, protos = outputs[0][0], outputs[1][0]
+    mask_dims, proto_h, proto_w = protos.shape
+    num_classes = raw.shape[0] - 4 - mask_dims
+    raw = raw.T
+
+    class_scores = raw[:, 4:4 + num_classes]
+    class_ids = class_scores.argmax(axis=1)
+    scores = class_scores[np.arange(len(raw)), class_ids]
+    selected = scores >= confidence
+    raw, class_ids, scores = raw[selected], class_ids[selected], scores[selected]
+
+    predictions = []
+    if len(raw):
+        cx, cy, w, h = raw[:, 0], raw[:, 1], raw[:, 2], raw[:, 3]
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+        # Class-aware NMS: offset boxes per class so they never suppress each other
+        offsets = class_ids[:, None].astype(np.float32) * (size * 2)
+        keep = _nms(boxes + offsets, scores, overlap)
+        boxes, class_ids, scores = boxes[keep], class_ids[keep], scores[keep]
+        coefficients = raw[keep, 4 + num_classes:]
+
+        masks = coefficients @ protos.reshape(mask_dims, -1)
+        masks = (1.0 / (1.0 + np.exp(-masks))).reshape(-1, proto_h, proto_w)
+
+        # Work in proto space and map polygons back through the letterbox
+        ratio_x, ratio_y = proto_w / size, proto_h / size
+        for box, class_id, score, mask in zip(boxes, class_ids, scores, masks):
+            x1, y1, x2, y2 = box
+            crop = np.zeros_like(mask, dtype=bool)
+            crop[max(0, int(y1 * ratio_y)):int(np.ceil(y2 * ratio_y)),
+                 max(0, int(x1 * ratio_x)):int(np.ceil(x2 * ratio_x))] = True
+            binary = (mask > ONNX_MASK_THRESHOLD) & crop
+
+            left = min(max((x1 - pad_x) / scale, 0.0), img_width)
+            top = min(max((y1 - pad_y) / scale, 0.0), img_height)
+            right = min(max((x2 - pad_x) / scale, 0.0), img_width)
+            bottom = min(max((y2 - pad_y) / scale, 0.0), img_height)
+            if right <= left or bottom <= top:
+                continue  # box lies entirely in the letterbox padding
+
+            points = []
+            for px, py in _mask_to_polygon(binary, ONNX_MAX_POLYGON_POINTS):
+                x = (px / ratio_x - pad_x) / scale
+                y = (py / ratio_y - pad_y) / scale
+                points.append({'x': float(min(max(x, 0), img_width)), 'y': float(min(max(y, 0), img_height))})
+
+            class_id = int(class_id)
+            class_name = _onnx_class_names[class_id] if class_id < len(_onnx_class_names) else str(class_id)
+            predictions.append({
+                'x': float((left + right) / 2),
+                'y': float((top + bottom) / 2),
+                'width': float(right - left),
+                'height': float(bottom - top),
+                'confidence': float(score),
+                'class': class_name,
+                'points': points,
+                'class_id': class_id,
+                'detection_id': str(uuid.uuid4())
+            })
+
+    return {
+        'inference_id': str(uuid.uuid4()),
+        'time': time.perf_counter() - started,
+        'image': {'width': img_width, 'height': img_height},
+        'predictions': predictions
+    }
+
+
+class OnnxRuntimeBackend:
+    """Local CPU segmentation with ONNX Runtime in a warmed process pool."""
+
+    name = 'onnx'
+
+    def __init__(self, model_path=ONNX_MODEL_PATH, workers=ONNX_WORKERS,
+                 threads_per_worker=ONNX_THREADS_PER_WORKER, class_names=ONNX_CLASS_NAMES):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"ONNX model not found: {model_path}")
+        self.model_path = model_path
+        self.model_id = f"onnx:{os.path.basename(model_path)}"
+        self.native_size = 640  # replaced by the model's real input size once warm
+        self.workers = workers
+        # spawn keeps workers independent of the threads of the gunicorn worker that owns the pool
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_onnx_init_worker,
+            initargs=(model_path, class_names, threads_per_worker),
+        )
+
+    def warm(self):
+        """Start every worker and run a dummy pass so models are resident before traffic."""
+        started = time.perf_counter()
+        futures = [self._pool.submit(_onnx_warm_worker) for _ in range(self.workers)]
+        warmed = [future.result() for future in futures]
+        pids = {pid for pid, _ in warmed}
+        self.native_size = warmed[0][1]
+        print(f"🔥 ONNX pool warm: {len(pids)} worker(s) in {time.perf_counter() - started:.2f}s")
+
+    def check(self, timeout=3):
+        """(usable, detail) for readiness probes; a crashed worker breaks the whole pool."""
+        if getattr(self._pool, '_broken', False):
+            return False, 'process pool is broken'
+        return True, f"{self.workers} worker(s)"
+
+    def infer(self, image_path, confidence=None, overlap=None, image_size=None):
+        # image_size is a hosted-API knob; the local model always runs at its native input size
+        confidence = int(confidence or ROBOFLOW_CONFIDENCE) / 100.0
+        overlap = int(overlap or ROBOFLOW_OVERLAP) / 100.0
+        try:
+            return self._pool.submit(_onnx_infer, image_path, confidence, overlap).result()
+        except Exception as e:
+            print(f"ONNX inference failed: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            return None
+
+    async def infer_async(self, image_path, confidence=None, overlap=None, image_size=None):
+        confidence = int(confidence or ROBOFLOW_CONFIDENCE) / 100.0
+        overlap = int(overlap or ROBOFLOW_OVERLAP) / 100.0
+        try:
+            # Awaiting the pool future keeps the event loop free while a worker runs the model
+            return await asyncio.wrap_future(self._pool.submit(_onnx_infer, image_path, confidence, overlap))
+        except Exception as e:
+            print(f"ONNX inference failed: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            return None
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_inference_backend():
+    """Return the configured backend, creating it on first use."""
+    global _backend
+    # The warm-up thread and the first request may get here at the same time
+    with _backend_lock:
+        if _backend is None:
+            if INFERENCE_BACKEND == 'onnx':
+                _backend = OnnxRuntimeBackend()
+            elif INFERENCE_BACKEND == 'roboflow':
+                _backend = RoboflowHTTPBackend()
+            else:
+                raise ValueError(f"Unknown INFERENCE_BACKEND: {INFERENCE_BACKEND}")
+            print(f"🔌 Inference backend: {_backend.name} ({_backend.model_id})")
+        return _backend
+
+
+def warm_inference_backend():
+    """Create and warm the backend unless we are ourselves a pool worker."""
+    if multiprocessing.parent_process() is not None:
+        return None
+    backend = get_inference_backend()
+    backend.warm()
+    return backend
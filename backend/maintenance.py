@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""Retention and compaction for the uploads folder and agridrone.db.
+
+One maintenance run:
+
+0. moves files left over from the flat uploads layout into their shards
+   (see storage.py),
+1. deletes image analyses older than ``RETENTION_DAYS`` (0 keeps them
+   forever) together with their original, resized and annotated files,
+2. deletes files in the uploads folder that no record references and that
+   are older than ``ORPHAN_GRACE_HOURS`` (so in-flight uploads are safe),
+3. drops expired rows from ``revoked_tokens``, events older than
+   ``EVENT_RETENTION_SECONDS`` (see events.py), raster uploads abandoned
+   and failed rasters left for ``RASTER_UPLOAD_EXPIRY_HOURS`` and (with
+   retention) old rasters,
+4. reclaims up to ``MAINTENANCE_VACUUM_PAGES`` free pages with
+   ``PRAGMA incremental_vacuum(N)`` and refreshes planner statistics with
+   ``PRAGMA optimize``.
+
+Databases created before incremental auto_vacuum was enabled are never
+rewritten in the background: a full VACUUM locks the database for the whole
+rewrite and needs twice its size in free disk.  Convert one once, during a
+quiet period, with ``python maintenance.py --enable-incremental-vacuum``.
+
+When ``MAINTENANCE_INTERVAL_HOURS`` is set, the app runs it on a background
+thread at that interval.  A file lock and the ``maintenance_runs`` table make sure only one
+gunicorn worker does the work per interval.  Run ``python maintenance.py``
+to do a pass by hand.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from datetime import datetime
+
+from events import prune_events
+from geometry import unindex_records
+from ground_area import delete_class_areas
+from perceptual_hash import delete_hashes
+from multiframe import delete_frames
+from raster_ingest import expire_rasters
+from storage import migrate_flat_uploads, resolve_upload
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: single process, no lock needed
+    fcntl = None
+
+RETENTION_DAYS = int(os.getenv('RETENTION_DAYS', '0'))
+ORPHAN_GRACE_HOURS = float(os.getenv('ORPHAN_GRACE_HOURS', '24'))
+# Off unless configured: a dev checkout's uploads folder holds files no local record knows about
+MAINTENANCE_INTERVAL_HOURS = float(os.getenv('MAINTENANCE_INTERVAL_HOURS', '0'))
+MAINTENANCE_BATCH_SIZE = 200
+# Free pages given back per pass; each page is a short write, so the lock is held briefly
+MAINTENANCE_VACUUM_PAGES = int(os.getenv('MAINTENANCE_VACUUM_PAGES', '2000'))
+
+_started = False
+
+
+def ensure_maintenance_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS maintenance_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_at TEXT NOT NULL,
+            report TEXT NOT NULL
+        )
+    ''')
+
+
+def _connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _remove_file(path):
+    """Delete a file and return the bytes freed (0 if it was already gone)."""
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except OSError:
+        return 0
+
+
+def _derived_files(path, upload_folder):
+    """Files the analysis pipeline writes next to an original upload."""
+    base = os.path.splitext(path)[0]
+    resized = f"{os.path.basename(base)}_resized.jpg"
+    # New ones sit in the original's shard; legacy flat ones were migrated into the shard of their own name
+    migrated = os.path.join(resolve_upload(upload_folder, resized), resized)
+    return list(dict.fromkeys([path, f"{base}_resized.jpg", migrated]))
+
+
+def _iter_upload_files(upload_folder):
+    stack = [upload_folder]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+
+
+def apply_retention(conn, upload_folder, days=RETENTION_DAYS):
+    """Delete image analyses older than ``days`` and their files."""
+    report = {'records_deleted': 0, 'files_deleted': 0, 'file_bytes_reclaimed': 0}
+    if days <= 0:
+        return report
+
+    while True:
+        rows = conn.execute('''
+            SELECT id, original_image_path, result_image_path FROM analysis_records
+            WHERE created_at < datetime('now', ?) AND original_image_path != ''
+            LIMIT ?
+        ''', (f'-{days} days', MAINTENANCE_BATCH_SIZE)).fetchall()
+        if not rows:
+            return report
+
+        # Short transactions so request threads are never locked out for long
+        conn.executemany('DELETE FROM analysis_records WHERE id = ?', [(row['id'],) for row in rows])
+        unindex_records(conn, [row['id'] for row in rows])
+        delete_class_areas(conn, [row['id'] for row in rows])
+        delete_hashes(conn, [row['id'] for row in rows])
+        delete_frames(conn, [row['id'] for row in rows])
+        conn.commit()
+        report['records_deleted'] += len(rows)
+
+        for row in rows:
+            paths = _derived_files(row['original_image_path'], upload_folder)
+            if row['result_image_path']:
+                paths.append(row['result_image_path'])
+            for path in paths:
+                freed = _remove_file(path)
+                if freed:
+                    report['files_deleted'] += 1
+                    report['file_bytes_reclaimed'] += freed
+
+
+def delete_orphans(conn, upload_folder, grace_hours=ORPHAN_GRACE_HOURS):
+    """Delete upload files no record references, if they are older than the grace period."""
+    report = {'orphans_deleted': 0, 'orphan_bytes_reclaimed': 0}
+    if not os.path.isdir(upload_folder):
+        return report
+
+    referenced = set()
+    for row in conn.execute('SELECT original_image_path, result_image_path FROM analysis_records'):
+        if row['original_image_path']:
+            referenced.update(os.path.basename(path) for path in _derived_files(row['original_image_path'], upload_folder))
+        if row['result_image_path']:
+            referenced.add(os.path.basename(row['result_image_path']))
+
+    cutoff = time.time() - grace_hours * 3600
+    for entry in _iter_upload_files(upload_folder):
+        if entry.name in referenced or entry.name.startswith('.'):
+            continue
+        stat = entry.stat(follow_symlinks=False)
+        if stat.st_mtime > cutoff:
+            continue
+        freed = _remove_file(entry.path)
+        if freed:
+            report['orphans_deleted'] += 1
+            report['orphan_bytes_reclaimed'] += freed
+    return report
+
+
+def compact_database(conn):
+    """Reclaim free pages and refresh statistics; returns bytes given back to the filesystem."""
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    pages_before = conn.execute('PRAGMA page_count').fetchone()[0]
+
+    conn.execute("DELETE FROM revoked_tokens WHERE expires_at IS NOT NULL AND expires_at < strftime('%s', 'now')")
+    conn.commit()
+
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        # execute() would only step the pragma once (one page); executescript runs it to completion
+        conn.executescript(f'PRAGMA incremental_vacuum({MAINTENANCE_VACUUM_PAGES});')
+    conn.execute('PRAGMA optimize')
+    conn.commit()
+
+    pages_after = conn.execute('PRAGMA page_count').fetchone()[0]
+    return {'db_bytes_reclaimed': max(0, pages_before - pages_after) * page_size}
+
+
+def enable_incremental_vacuum(db_path):
+    """One-time conversion of an older database to incremental auto_vacuum.
+
+    Runs a full VACUUM: the database is locked until it finishes and the
+    disk needs room for a second copy.  Not part of the scheduled passes.
+    """
+    conn = _connect(db_path)
+    try:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+            print("🧹 auto_vacuum is already INCREMENTAL")
+            return False
+        started = time.perf_counter()
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+    print(f"🧹 Enabled incremental auto_vacuum in {time.perf_counter() - started:.1f}s")
+    return True
+
+
+def run_maintenance(db_path, upload_folder):
+    """One full maintenance pass. Returns a report of what was reclaimed."""
+    started = time.perf_counter()
+    report = {'started_at': datetime.utcnow().isoformat()}
+    report.update(migrate_flat_uploads(db_path, upload_folder))
+    conn = _connect(db_path)
+    try:
+        ensure_maintenance_tables(conn)
+        report.update(apply_retention(conn, upload_folder))
+        report.update(delete_orphans(conn, upload_folder))
+        report.update(expire_rasters(conn, os.path.join(os.path.dirname(db_path), 'rasters'), RETENTION_DAYS))
+        report['events_deleted'] = prune_events(conn)
+        report.update(compact_database(conn))
+        report['bytes_reclaimed'] = (report['file_bytes_reclaimed'] + report['orphan_bytes_reclaimed']
+                                     + report['raster_bytes_reclaimed'] + report['db_bytes_reclaimed'])
+        report['duration_s'] = round(time.perf_counter() - started, 3)
+        conn.execute('INSERT INTO maintenance_runs (started_at, report) VALUES (?, ?)',
+                     (report['started_at'], json.dumps(report)))
+        conn.commit()
+    finally:
+        conn.close()
+
+    print(f"🧹 Maintenance: {report['records_deleted']} expired records, "
+          f"{report['files_deleted'] + report['orphans_deleted']} files deleted, "
+          f"{report['bytes_reclaimed'] / (1024 * 1024):.1f} MB reclaimed in {report['duration_s']}s")
+    return report
+
+
+def _last_run_age_hours(db_path):
+    conn = _connect(db_path)
+    try:
+        ensure_maintenance_tables(conn)
+        row = conn.execute(
+            "SELECT (julianday('now') - julianday(MAX(started_at))) * 24 FROM maintenance_runs"
+        ).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row and row[0] is not None else None
+
+
+def _run_if_due(db_path, upload_folder, interval_hours):
+    lock_path = os.path.join(os.path.dirname(os.path.abspath(db_path)), '.maintenance.lock')
+    with open(lock_path, 'w') as lock_file:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return None  # another worker is already on it
+        age = _last_run_age_hours(db_path)
+        if age is not None and age < interval_hours:
+            return None
+        return run_maintenance(db_path, upload_folder)
+
+
+def start_maintenance_thread(db_path, upload_folder, interval_hours=MAINTENANCE_INTERVAL_HOURS):
+    """Run maintenance in the background every interval (no-op if disabled or already started)."""
+    global _started
+    if interval_hours <= 0 or _started:
+        return
+    _started = True
+
+    def loop():
+        # Give the worker time to start serving before doing any disk work
+        time.sleep(60)
+        while True:
+            try:
+                _run_if_due(db_path, upload_folder, interval_hours)
+            except Exception as e:
+                print(f"❌ Maintenance failed: {str(e)}")
+            time.sleep(min(3600, interval_hours * 3600))
+
+    threading.Thread(target=loop, name='maintenance', daemon=True).start()
+
+
+if __name__ == "__main__":
+    import sys
+    from dotenv import load_dotenv
+    load_dotenv()
+    data_dir = os.getenv('DATA_DIR', '.')
+    if '--enable-incremental-vacuum' in sys.argv[1:]:
+        enable_incremental_vacuum(os.path.join(data_dir, 'agridrone.db'))
+        sys.exit(0)
+    result = run_maintenance(os.path.join(data_dir, 'agridrone.db'), os.path.join(data_dir, 'uploads'))
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""Capture metadata embedded in drone images.
+
+Drone photos carry EXIF (GPS position and altitude, capture time, camera
+and focal length) and, for DJI aircraft, an XMP packet with the altitude
+above the take-off point and the gimbal angles.  ``read_metadata`` walks the
+JPEG segment headers to find those blocks and parses only them.  It never
+decodes pixels and never reads past the start of the image data, so it
+costs well under a millisecond and can run on every upload.
+
+    python metadata.py <image or folder> ...   # print metadata as JSON lines
+    python metadata.py backfill                # fill metadata columns for stored analyses
+"""
+
+import io
+import os
+import re
+import json
+
+from PIL import Image
+
+EXIF_IFD = 0x8769
+GPS_IFD = 0x8825
+
+TAG_MAKE = 0x010F
+TAG_MODEL = 0x0110
+TAG_DATETIME = 0x0132
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_FOCAL_LENGTH = 0x920A
+TAG_FOCAL_LENGTH_35MM = 0xA405
+
+GPS_LATITUDE_REF, GPS_LATITUDE = 1, 2
+GPS_LONGITUDE_REF, GPS_LONGITUDE = 3, 4
+GPS_ALTITUDE_REF, GPS_ALTITUDE = 5, 6
+
+_XMP_HEADER = b'http://ns.adobe.com/xap/1.0/\x00'
+_EXIF_HEADER = b'Exif\x00\x00'
+# SOFn markers carry the frame size; C4 (DHT), C8 (JPG) and CC (DAC) do not
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# DJI writes e.g. drone-dji:RelativeAltitude="+52.30" (attribute) or as an element
+_XMP_VALUE = re.compile(rb'drone-dji:(\w+)(?:="([^"]*)"|>([^<]*)<)')
+_XMP_FIELDS = {
+    b'RelativeAltitude': 'relative_altitude_m',
+    b'AbsoluteAltitude': 'xmp_altitude_m',
+    b'GimbalPitchDegree': 'gimbal_pitch_deg',
+    b'FlightYawDegree': 'flight_yaw_deg',
+    b'GpsLatitude': 'xmp_latitude',
+    b'GpsLongitude': 'xmp_longitude',
+    b'GpsLongtitude': 'xmp_longitude',  # sic, older DJI firmware
+}
+
+
+def _jpeg_segments(f):
+    """(exif bytes, xmp bytes, (width, height)) from a JPEG's header segments."""
+    if f.read(2) != b'\xff\xd8':
+        return None
+    exif = xmp = size = None
+    while True:
+        header = f.read(2)
+        if len(header) < 2 or header[0] != 0xFF:
+            break
+        marker = header[1]
+        while marker == 0xFF:  # fill bytes
+            marker = f.read(1)[0]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            continue
+        if marker in (0xDA, 0xD9):  # start of scan / end of image: no more metadata
+            break
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            break
+        length = int.from_bytes(length_bytes, 'big') - 2
+        if marker == 0xE1 and (exif is None or xmp is None):
+            payload = f.read(length)
+            if payload.startswith(_EXIF_HEADER) and exif is None:
+                exif = payload
+            elif payload.startswith(_XMP_HEADER) and xmp is None:
+                xmp = payload[len(_XMP_HEADER):]
+        elif marker in _SOF_MARKERS:
+            payload = f.read(length)
+            size = (int.from_bytes(payload[3:5], 'big'), int.from_bytes(payload[1:3], 'big'))
+            break  # EXIF/XMP always precede the frame header
+        else:
+            f.seek(length, io.SEEK_CUR)
+    return exif, xmp, size
+
+
+def _other_format_segments(f):
+    """EXIF/XMP for PNG/GIF/etc. via Pillow, which also stops at the header."""
+    with Image.open(f) as image:
+        exif = image.info.get('exif')
+        xmp = image.info.get('xmp') or image.info.get('XML:com.adobe.xmp')
+        if isinstance(xmp, str):
+            xmp = xmp.encode('utf-8')
+        return exif, xmp, image.size
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+
+
+def _dms_to_degrees(dms, ref):
+    degrees, minutes, seconds = (float(v) for v in dms)
+    value = degrees + minutes / 60 + seconds / 3600
+    return -value if ref in ('S', 'W') else value
+
+
+def _exif_datetime(value):
+    """'2024:05:01 10:22:33' -> '2024-05-01T10:22:33' (the format the upload form uses)."""
+    if not isinstance(value, str) or len(value) < 19:
+        return None
+    date, _, time = value.strip('\x00 ').partition(' ')
+    return f"{date.replace(':', '-')}T{time}" if time else None
+
+
+def _parse_exif(data, result):
+    exif = Image.Exif()
+    exif.load(data)
+    if exif.get(TAG_MAKE):
+        result['camera_make'] = str(exif[TAG_MAKE]).strip('\x00 ')
+    if exif.get(TAG_MODEL):
+        result['camera_model'] = str(exif[TAG_MODEL]).strip('\x00 ')
+
+    details = exif.get_ifd(EXIF_IFD)
+    captured = _exif_datetime(details.get(TAG_DATETIME_ORIGINAL)) or _exif_datetime(exif.get(TAG_DATETIME))
+    if captured:
+        result['captured_at'] = captured
+    if details.get(TAG_FOCAL_LENGTH):
+        result['focal_length_mm'] = _float(details[TAG_FOCAL_LENGTH])
+    if details.get(TAG_FOCAL_LENGTH_35MM):
+        result['focal_length_35mm'] = _float(details[TAG_FOCAL_LENGTH_35MM])
+
+    gps = exif.get_ifd(GPS_IFD)
+    if GPS_LATITUDE in gps and GPS_LONGITUDE in gps:
+        try:
+            lat = _dms_to_degrees(gps[GPS_LATITUDE], gps.get(GPS_LATITUDE_REF, 'N'))
+            lng = _dms_to_degrees(gps[GPS_LONGITUDE], gps.get(GPS_LONGITUDE_REF, 'E'))
+            if -90 <= lat <= 90 and -180 <= lng <= 180 and (lat, lng) != (0, 0):
+                result['latitude'], result['longitude'] = lat, lng
+        except (TypeError, ValueError, ZeroDivisionError):
+            pass
+    altitude = _float(gps.get(GPS_ALTITUDE))
+    if altitude is not None:
+        result['altitude_m'] = -altitude if gps.get(GPS_ALTITUDE_REF) in (1, b'\x01') else altitude
+
+
+def _parse_xmp(data, result):
+    for match in _XMP_VALUE.finditer(data):
+        key = _XMP_FIELDS.get(match.group(1))
+        if key:
+            value = _float((match.group(2) or match.group(3) or b'').strip())
+            if value is not None:
+                result.setdefault(key, value)
+    # Fall back to the XMP position/altitude when EXIF has none
+    if 'latitude' not in result and 'xmp_latitude' in result and 'xmp_longitude' in result:
+        result['latitude'], result['longitude'] = result['xmp_latitude'], result['xmp_longitude']
+    if 'altitude_m' not in result and 'xmp_altitude_m' in result:
+        result['altitude_m'] = result['xmp_altitude_m']
+    for key in ('xmp_latitude', 'xmp_longitude', 'xmp_altitude_m'):
+        result.pop(key, None)
+
+
+def read_metadata(source):
+    """Capture metadata from an image path or binary file object.
+
+    Returns a dict holding only the keys that were found, e.g. latitude,
+    longitude, altitude_m, relative_altitude_m, captured_at, camera_make,
+    camera_model, focal_length_mm, focal_length_35mm, gimbal_pitch_deg,
+    flight_yaw_deg, width, height.  File objects are rewound afterwards.
+    """
+    result = {}
+    if isinstance(source, (str, os.PathLike)):
+        f = open(source, 'rb')
+        close, start = True, 0
+    else:
+        f, close = source, False
+        start = f.tell()
+    try:
+        segments = _jpeg_segments(f)
+        if segments is None:
+            f.seek(start)
+            segments = _other_format_segments(f)
+        exif, xmp, size = segments
+        if size:
+            result['width'], result['height'] = size
+        if exif:
+            _parse_exif(exif, result)
+        if xmp:
+            _parse_xmp(xmp, result)
+    except Exception as e:
+        print(f"⚠️  Could not read image metadata: {str(e)}")
+    finally:
+        if close:
+            f.close()
+        else:
+            f.seek(start)
+    return result
+
+
+def metadata_columns(meta):
+    """(captured_at, altitude_m, relative_altitude_m, camera_model, focal_length_mm, image_metadata)"""
+    return (meta.get('captured_at'), meta.get('altitude_m'), meta.get('relative_altitude_m'),
+            meta.get('camera_model'), meta.get('focal_length_mm'),
+            json.dumps(meta) if meta else None)
+
+
+def backfill(db_path):
+    """Extract metadata for stored analyses that have none yet."""
+    import sqlite3
+    import time
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        rows = conn.execute('''
+            SELECT id, original_image_path FROM analysis_records
+            WHERE image_metadata IS NULL AND original_image_path != ''
+        ''').fetchall()
+        started = time.perf_counter()
+        updated = 0
+        for record_id, path in rows:
+            if not os.path.exists(path):
+                continue
+            meta = read_metadata(path)
+            conn.execute('''
+                UPDATE analysis_records
+                SET captured_at = ?, altitude_m = ?, relative_altitude_m = ?, camera_model = ?,
+                    focal_length_mm = ?, image_metadata = ?,
+                    latitude = COALESCE(latitude, ?), longitude = COALESCE(longitude, ?)
+                WHERE id = ?
+            ''', (*metadata_columns(meta), meta.get('latitude'), meta.get('longitude'), record_id))
+            updated += 1
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"📷 Metadata backfilled for {updated} analyses in {time.perf_counter() - started:.2f}s")
+    return updated
+
+
+def _iter_images(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.tif', '.tiff')):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    if sys.argv[1:] == ['backfill']:
+        backfill(os.path.join(os.getenv('DATA_DIR', '.'), 'agridrone.db'))
+        sys.exit(0)
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    count = 0
+    started = time.perf_counter()
+    for image_path in _iter_images(sys.argv[1:]):
+        print(json.dumps({'file': image_path, **read_metadata(image_path)}))
+        count += 1
+    elapsed = time.perf_counter() - started
+    print(f"📷 {count} images in {elapsed:.3f}s ({elapsed / max(count, 1) * 1000:.3f} ms/image)", file=sys.stderr)
@@ -0,0 +1,103 @@
+"""Multi-frame uploads: animated GIFs and multi-page TIFFs.
+
+The first frame is analyzed like any single image (it gets the annotated
+image and the analysis record).  The other frames, or every n-th of them
+for long files, are then decoded one at a time in file order and analyzed
+with at most ``MULTIFRAME_CONCURRENCY`` frames in flight.  Only the frames
+in flight are ever held decoded, never the whole file.
+
+Per-frame predictions go into ``analysis_frames``, one row per frame, as
+zlib-compressed JSON.  Coordinates are rounded to a tenth of a pixel and
+polygons are flat ``[x0, y0, x1, y1, ...]`` lists, which is a small
+fraction of the size of the raw inference result.
+"""
+
+import os
+import json
+import math
+import zlib
+
+from PIL import Image
+
+MULTIFRAME_EXTENSIONS = {'gif', 'tif', 'tiff'}
+MULTIFRAME_MAX_FRAMES = int(os.getenv('MULTIFRAME_MAX_FRAMES', '24'))
+MULTIFRAME_CONCURRENCY = int(os.getenv('MULTIFRAME_CONCURRENCY', '4'))
+
+
+def frame_count(path):
+    """Number of frames/pages; 1 for anything that is not a GIF or TIFF"""
+    if path.rsplit('.', 1)[-1].lower() not in MULTIFRAME_EXTENSIONS:
+        return 1
+    with Image.open(path) as img:
+        return getattr(img, 'n_frames', 1)
+
+
+def sample_indexes(count, max_frames=MULTIFRAME_MAX_FRAMES, step=None):
+    """Frame indexes to analyze: every ``step``-th, by default spread so at most max_frames are taken"""
+    step = step or max(1, math.ceil(count / max_frames))
+    return list(range(0, count, step))[:max_frames]
+
+
+def iter_frames(path, indexes):
+    """Yield (index, RGB image) for the given frame indexes, decoding one frame at a time"""
+    with Image.open(path) as img:
+        for index in sorted(indexes):
+            img.seek(index)
+            yield index, img.convert('RGB')
+
+
+def pack_predictions(predictions):
+    """Compact, compressed form of a frame's predictions"""
+    packed = []
+    for prediction in predictions:
+        entry = {
+            'c': prediction.get('class', 'Unknown'),
+            'p': round(prediction.get('confidence', 0), 4),
+            'b': [round(prediction.get(key, 0), 1) for key in ('x', 'y', 'width', 'height')],
+        }
+        if prediction.get('points'):
+            entry['s'] = [round(v, 1) for point in prediction['points'] for v in (point['x'], point['y'])]
+        packed.append(entry)
+    return zlib.compress(json.dumps(packed, separators=(',', ':')).encode('utf-8'), 6)
+
+
+def unpack_predictions(blob):
+    """Predictions in the inference result format from pack_predictions() output"""
+    predictions = []
+    for entry in json.loads(zlib.decompress(blob)):
+        x, y, width, height = entry['b']
+        prediction = {'class': entry['c'], 'confidence': entry['p'], 'x': x, 'y': y, 'width': width, 'height': height}
+        if 's' in entry:
+            flat = entry['s']
+            prediction['points'] = [{'x': flat[i], 'y': flat[i + 1]} for i in range(0, len(flat), 2)]
+        predictions.append(prediction)
+    return predictions
+
+
+def ensure_frame_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analysis_frames (
+            analysis_id INTEGER NOT NULL,
+            frame_index INTEGER NOT NULL,
+            width INTEGER,
+            height INTEGER,
+            prediction_count INTEGER NOT NULL,
+            predictions BLOB NOT NULL,
+            PRIMARY KEY (analysis_id, frame_index)
+        ) WITHOUT ROWID
+    ''')
+
+
+def store_frames(cursor, analysis_id, frames):
+    """frames: [{'index', 'width', 'height', 'predictions'}]"""
+    cursor.executemany('INSERT OR REPLACE INTO analysis_frames VALUES (?, ?, ?, ?, ?, ?)', [
+        (analysis_id, frame['index'], frame.get('width'), frame.get('height'), len(frame['predictions']),
+         pack_predictions(frame['predictions']))
+        for frame in frames
+    ])
+
+
+def delete_frames(cursor, analysis_ids):
+    if analysis_ids:
+        marks = ','.join('?' * len(analysis_ids))
+        cursor.execute(f'DELETE FROM analysis_frames WHERE analysis_id IN ({marks})', list(analysis_ids))
@@ -0,0 +1,90 @@
+"""Password hashing through a small bounded pool.
+
+The request thread still waits for its hash, so a gthread slot is taken
+for the duration; what the pool adds is a bound.  At most
+``PASSWORD_HASH_WORKERS`` hashes run at once (werkzeug's KDFs release the
+GIL, so they do not stall the worker's other thread), and once
+``PASSWORD_HASH_QUEUE`` more are pending new ones fail fast with
+HashingBusy instead of queueing behind a credential-stuffing burst.
+
+``PASSWORD_HASH_METHOD`` takes werkzeug method strings such as
+``pbkdf2:sha256:600000`` or ``scrypt:32768:8:1``.  Hashes made with other
+parameters still verify, and verify_password() hands back a replacement
+hash so the caller can upgrade the stored one on login.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '2'))
+PASSWORD_HASH_QUEUE = int(os.getenv('PASSWORD_HASH_QUEUE', '16'))
+PASSWORD_HASH_WAIT = float(os.getenv('PASSWORD_HASH_WAIT', '2'))  # seconds to wait for a queue slot
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full."""
+
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix='pwhash')
+_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE)
+
+
+def _submit(fn, *args):
+    if not _slots.acquire(timeout=PASSWORD_HASH_WAIT):
+        raise HashingBusy()
+    try:
+        future = _executor.submit(fn, *args)
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future.result()
+
+
+def hash_method(password_hash):
+    """Method prefix of a werkzeug hash, e.g. ``pbkdf2:sha256:600000``"""
+    return password_hash.split('$', 1)[0]
+
+
+def _canonical_method(method):
+    # werkzeug fills in default parameters, so 'pbkdf2' is stored as 'pbkdf2:sha256:600000'
+    parts = method.split(':')
+    if parts[0] == 'pbkdf2' and len(parts) < 3:
+        from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS
+        parts = ['pbkdf2', parts[1] if len(parts) > 1 else 'sha256', str(DEFAULT_PBKDF2_ITERATIONS)]
+    elif parts[0] == 'scrypt' and len(parts) < 4:
+        parts = ['scrypt', '32768', '8', '1']
+    return ':'.join(parts)
+
+
+_CURRENT_METHOD = _canonical_method(PASSWORD_HASH_METHOD)
+
+
+def needs_rehash(password_hash):
+    return hash_method(password_hash) != _CURRENT_METHOD
+
+
+def hash_password(password):
+    """Hash with the configured KDF parameters on the hashing pool."""
+    return _submit(generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+
+def _verify(password_hash, password):
+    if not check_password_hash(password_hash, password):
+        return False, None
+    if needs_rehash(password_hash):
+        return True, generate_password_hash(password, PASSWORD_HASH_METHOD)
+    return True, None
+
+
+def verify_password(password_hash, password):
+    """Check a password on the hashing pool.
+
+    Returns ``(ok, new_hash)``; ``new_hash`` is set when the stored hash was
+    made with different KDF parameters and should be replaced.
+    """
+    return _submit(_verify, password_hash, password)
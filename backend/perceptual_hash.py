@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""Perceptual hashes for spotting near-identical images.
+
+A difference hash (dHash) shrinks the image to 9x8 greyscale pixels and
+keeps one bit per horizontal neighbour pair: is the right pixel brighter?
+Re-encoding, resizing and small exposure changes flip few of the 64 bits,
+so the Hamming distance between two hashes measures how alike two images
+look.
+
+Every analysis stores its upload's hash in ``analysis_records.phash``.  It
+also stores the hash's eight bytes in ``analysis_hash_bands``, a
+multi-index: two hashes at most 7 bits apart agree on at least one whole
+byte (pigeonhole), so the near-duplicates of a hash are among the rows that
+share a (band, value) with it.  That is eight indexed lookups, after which
+only a handful of candidates need an exact Hamming distance.
+
+    python perceptual_hash.py backfill      # hash stored analyses that have none
+"""
+
+import os
+
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8
+HASH_BANDS = 8  # one per byte: finds everything up to HASH_BANDS - 1 bits apart
+
+# Near-duplicates: at most this many differing bits, among the user's uploads of the last N days
+DUPLICATE_DISTANCE = min(int(os.getenv('DUPLICATE_DISTANCE', '6')), HASH_BANDS - 1)
+DUPLICATE_RECENT_DAYS = int(os.getenv('DUPLICATE_RECENT_DAYS', '30'))
+# Copy the earlier analysis's predictions instead of running inference (forms: reuse_predictions)
+DUPLICATE_REUSE_PREDICTIONS = os.getenv('DUPLICATE_REUSE_PREDICTIONS', 'false').lower() in ('1', 'true', 'yes')
+
+
+def dhash_pixels(pixels):
+    """64-bit dHash of a HASH_SIZE x (HASH_SIZE + 1) greyscale array"""
+    pixels = np.asarray(pixels, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def dhash(image):
+    """64-bit dHash of a PIL image"""
+    small = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX)
+    return dhash_pixels(np.asarray(small))
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def to_signed(value):
+    """SQLite integers are signed 64-bit"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def from_signed(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def hash_bands(value):
+    """[(band, byte)] for the multi-index"""
+    return [(band, (value >> (8 * band)) & 0xFF) for band in range(HASH_BANDS)]
+
+
+def ensure_hash_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analysis_hash_bands (
+            user_id INTEGER NOT NULL,
+            band INTEGER NOT NULL,
+            value INTEGER NOT NULL,
+            analysis_id INTEGER NOT NULL,
+            PRIMARY KEY (user_id, band, value, analysis_id)
+        ) WITHOUT ROWID
+    ''')
+
+
+def index_hash(cursor, analysis_id, user_id, value):
+    cursor.executemany('INSERT OR IGNORE INTO analysis_hash_bands VALUES (?, ?, ?, ?)',
+                       [(user_id, band, byte, analysis_id) for band, byte in hash_bands(value)])
+
+
+def delete_hashes(cursor, analysis_ids):
+    if analysis_ids:
+        marks = ','.join('?' * len(analysis_ids))
+        cursor.execute(f'DELETE FROM analysis_hash_bands WHERE analysis_id IN ({marks})', list(analysis_ids))
+
+
+def find_near_duplicate(conn, user_id, value, max_distance=DUPLICATE_DISTANCE, recent_days=DUPLICATE_RECENT_DAYS):
+    """(analysis_id, distance) of the user's closest recent upload within max_distance bits, or None"""
+    bands = hash_bands(value)
+    # One primary-key range per band
+    candidates = conn.execute(f'''
+        WITH probe(band, value) AS (VALUES {','.join(['(?, ?)'] * len(bands))})
+        SELECT DISTINCT a.id, a.phash
+        FROM probe
+        CROSS JOIN analysis_hash_bands b ON b.user_id = ? AND b.band = probe.band AND b.value = probe.value
+        JOIN analysis_records a ON a.id = b.analysis_id
+        WHERE a.created_at >= datetime('now', ?)
+    ''', (*[v for band in bands for v in band], user_id, f'-{recent_days} days')).fetchall()
+    best = None
+    for analysis_id, stored in candidates:
+        distance = hamming(value, from_signed(stored))
+        if distance <= max_distance and (best is None or (distance, -analysis_id) < (best[1], -best[0])):
+            best = (analysis_id, distance)
+    return best
+
+
+def scale_result(result, width, height):
+    """A stored inference result with its predictions rescaled to a width x height image"""
+    image = result.get('image') or {}
+    sx = width / float(image.get('width') or width)
+    sy = height / float(image.get('height') or height)
+    predictions = []
+    for prediction in result.get('predictions') or []:
+        scaled = {key: value for key, value in prediction.items() if key != 'area_m2'}
+        for key, factor in (('x', sx), ('y', sy), ('width', sx), ('height', sy)):
+            if key in scaled:
+                scaled[key] = scaled[key] * factor
+        if prediction.get('points'):
+            scaled['points'] = [{**point, 'x': point['x'] * sx, 'y': point['y'] * sy} for point in prediction['points']]
+        predictions.append(scaled)
+    return {**result, 'image': {'width': width, 'height': height}, 'predictions': predictions}
+
+
+def backfill(db_path):
+    """Hash the original images of stored analyses that have no hash yet."""
+    import sqlite3
+    import time
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    started = time.perf_counter()
+    updated = 0
+    try:
+        rows = conn.execute('''
+            SELECT id, user_id, original_image_path FROM analysis_records
+            WHERE phash IS NULL AND original_image_path != ''
+        ''').fetchall()
+        for record_id, user_id, path in rows:
+            if not os.path.exists(path):
+                continue
+            try:
+                with Image.open(path) as img:
+                    img.draft('L', (256, 256))
+                    value = dhash(img)
+            except OSError as e:
+                print(f"⚠️  Could not hash {path}: {str(e)}")
+                continue
+            conn.execute('UPDATE analysis_records SET phash = ? WHERE id = ?', (to_signed(value), record_id))
+            index_hash(conn, record_id, user_id, value)
+            updated += 1
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"🔎 Perceptual hashes backfilled for {updated} analyses in {time.perf_counter() - started:.2f}s")
+    return updated
+
+
+if __name__ == "__main__":
+    import sys
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    if sys.argv[1:] == ['backfill']:
+        backfill(os.path.join(os.getenv('DATA_DIR', '.'), 'agridrone.db'))
+        sys.exit(0)
+    print(__doc__)
+    sys.exit(1)
@@ -0,0 +1,572 @@
+"""Large rasters: orthomosaics and other multi-gigabyte GeoTIFFs.
+
+Uploading.  A raster is uploaded in chunks of at most ``RASTER_CHUNK_MB``
+(so every request stays under the normal body limit): POST /api/rasters
+declares the file and its size, then each chunk is PUT at its byte offset.
+The server only accepts the chunk at the offset it has reached; any other
+offset gets 409 with that offset, so an interrupted upload resumes where it
+stopped instead of starting over.
+
+Reading.  The raster is never decoded as a whole.  With rasterio
+(``pip install rasterio``) windows are read through GDAL: tiled or striped,
+compressed, BigTIFF, internal overviews, any CRS.  Without it only
+uncompressed 8-bit striped TIFFs can be read: their pixels are memory
+mapped and each window is copied out of the mapping, whose pages are then
+released.  Either way the memory in use is a few tiles, not the raster.
+
+Analysis.  The raster is cut into ``RASTER_TILE_SIZE`` tiles overlapping by
+``RASTER_TILE_OVERLAP`` pixels.  Fully transparent/nodata tiles are
+skipped, the rest go to inference.  A detection is kept by the one tile
+whose core (the tile minus half the overlap on every inner edge) contains
+its centre, so detections in an overlap are not counted twice.  Detections
+larger than the overlap can still be split across tiles.  Predictions are
+stored per tile, in raster pixels, in the compact form of multiframe.py.
+Inference is tried ``RASTER_TILE_ATTEMPTS`` times per tile.  A raster with
+some tiles still failed is done (``partial``, with ``tiles_failed``) and its
+stored predictions are served; only one where every tile failed is failed.
+
+Restarts.  The analysis runs on a thread of the worker process that stored
+the last chunk; its pid is kept in ``worker``.  A worker starting up takes
+over rasters left queued or running by a process that is gone and analyzes
+them again, up to ``RASTER_MAX_ATTEMPTS`` times in all; after that they are
+marked failed.
+
+Previews.  An overview pyramid of ``PYRAMID_TILE_SIZE`` JPEG tiles is built:
+level 1 is half the resolution, read from the raster window by window; each
+further level is made from four tiles of the level below.  The top level fits
+in ``RASTER_PREVIEW_SIZE`` and is also saved as a single preview image.
+
+Georeferencing.  The affine pixel -> CRS transform and the CRS come from
+rasterio, or from the GeoTIFF tags (ModelPixelScale/ModelTiepoint or
+ModelTransformation, GeoKeyDirectory) without it.  Predictions are
+exported as GeoJSON in longitude/latitude.  That needs the raster to be in
+EPSG:4326, or rasterio to reproject it.
+"""
+
+import os
+import json
+import math
+import mmap
+import shutil
+import sqlite3
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image, TiffImagePlugin
+
+from multiframe import pack_predictions, unpack_predictions
+
+MB = 1024 * 1024
+
+RASTER_EXTENSIONS = {'tif', 'tiff'}
+RASTER_FOLDER = os.path.join(os.getenv('DATA_DIR', '.'), 'rasters')
+MAX_RASTER_SIZE = int(os.getenv('MAX_RASTER_SIZE_MB', '20480')) * MB
+RASTER_CHUNK_SIZE = int(os.getenv('RASTER_CHUNK_MB', '8')) * MB
+RASTER_TILE_SIZE = int(os.getenv('RASTER_TILE_SIZE', '1024'))
+RASTER_TILE_OVERLAP = int(os.getenv('RASTER_TILE_OVERLAP', '64'))
+RASTER_INFERENCE_CONCURRENCY = int(os.getenv('RASTER_INFERENCE_CONCURRENCY', '4'))
+# Inference tries per tile before the tile counts as failed
+RASTER_TILE_ATTEMPTS = int(os.getenv('RASTER_TILE_ATTEMPTS', '3'))
+# Rasters analyzed at once per worker; the rest wait their turn
+RASTER_MAX_ACTIVE = int(os.getenv('RASTER_MAX_ACTIVE', '1'))
+# Uploads with no new chunk, and failed rasters, are deleted by maintenance after this long
+RASTER_UPLOAD_EXPIRY_HOURS = float(os.getenv('RASTER_UPLOAD_EXPIRY_HOURS', '24'))
+# Analyses cut short by a restart are started again on startup this many times in all
+RASTER_MAX_ATTEMPTS = int(os.getenv('RASTER_MAX_ATTEMPTS', '2'))
+# GDAL's block cache; the default (5% of RAM) is far more than tiled reads need
+RASTER_GDAL_CACHE_MB = int(os.getenv('RASTER_GDAL_CACHE_MB', '64'))
+
+PYRAMID_TILE_SIZE = 512
+RASTER_PREVIEW_SIZE = 1024
+PYRAMID_QUALITY = 80
+COPY_BLOCK_SIZE = MB
+
+TIFF_SIGNATURES = (b'II*\x00', b'MM\x00*', b'II+\x00', b'MM\x00+')
+SOURCE_NAME = 'source.tif'
+
+RasterTile = namedtuple('RasterTile', 'col row x y image core')
+
+
+class RasterUnsupported(Exception):
+    """The file is not a raster this server can read window by window"""
+
+
+def is_raster(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in RASTER_EXTENSIONS
+
+
+def raster_support():
+    """'rasterio' when installed, else 'memmap' (uncompressed TIFFs only)"""
+    try:
+        import rasterio  # noqa: F401
+    except ImportError:
+        return 'memmap'
+    return 'rasterio'
+
+
+def raster_dir(raster_id, folder=RASTER_FOLDER):
+    return os.path.join(folder, raster_id)
+
+
+def source_path(raster_id, folder=RASTER_FOLDER):
+    return os.path.join(raster_dir(raster_id, folder), SOURCE_NAME)
+
+
+def ensure_raster_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS raster_ingests (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            job_id TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            received INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL,
+            options TEXT,
+            reader TEXT,
+            width INTEGER,
+            height INTEGER,
+            bands INTEGER,
+            crs TEXT,
+            transform TEXT,
+            gsd_cm REAL,
+            pyramid_levels INTEGER,
+            tiles_total INTEGER NOT NULL DEFAULT 0,
+            tiles_empty INTEGER NOT NULL DEFAULT 0,
+            tiles_analyzed INTEGER NOT NULL DEFAULT 0,
+            tiles_failed INTEGER NOT NULL DEFAULT 0,
+            prediction_count INTEGER NOT NULL DEFAULT 0,
+            class_areas TEXT,
+            error TEXT,
+            worker INTEGER,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_raster_ingests_user ON raster_ingests (user_id, created_at)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS raster_tiles (
+            raster_id TEXT NOT NULL,
+            col INTEGER NOT NULL,
+            row INTEGER NOT NULL,
+            prediction_count INTEGER NOT NULL,
+            predictions BLOB NOT NULL,
+            PRIMARY KEY (raster_id, col, row)
+        ) WITHOUT ROWID
+    ''')
+
+
+# ---------------------------------------------------------------------------
+# Chunked uploads
+# ---------------------------------------------------------------------------
+
+def write_chunk(path, offset, stream, length):
+    """Copy ``length`` bytes of ``stream`` into the file at ``offset``; returns the bytes written
+
+    A chunk at offset 0 must start with a TIFF signature.
+    """
+    written = 0
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        while written < length:
+            block = stream.read(min(COPY_BLOCK_SIZE, length - written))
+            if not block:
+                break
+            if written == 0 and offset == 0 and block[:4] not in TIFF_SIGNATURES:
+                raise RasterUnsupported('Not a TIFF file')
+            f.write(block)
+            written += len(block)
+    return written
+
+
+# ---------------------------------------------------------------------------
+# Windowed readers
+# ---------------------------------------------------------------------------
+
+def _to_uint8(pixels):
+    if pixels.dtype == np.uint8:
+        return pixels
+    if pixels.dtype == np.uint16:
+        return (pixels >> 8).astype(np.uint8)
+    return np.clip(pixels, 0, 255).astype(np.uint8)
+
+
+class RasterioSource:
+    """Windowed reads through GDAL; only the blocks a window touches are decoded."""
+
+    reader = 'rasterio'
+
+    def __init__(self, path):
+        import rasterio
+
+        self._env = rasterio.Env(GDAL_CACHEMAX=RASTER_GDAL_CACHE_MB * MB)
+        self._env.__enter__()
+        try:
+            self.dataset = rasterio.open(path)
+        except Exception as e:
+            self._env.__exit__(None, None, None)
+            raise RasterUnsupported(str(e))
+        self.width, self.height, self.bands = self.dataset.width, self.dataset.height, self.dataset.count
+        self._indexes = [1, 2, 3] if self.bands >= 3 else [1, 1, 1]
+
+    def read(self, x, y, width, height, out_width=None, out_height=None):
+        """(RGB uint8 array, validity mask) of a window, resampled to out_width x out_height"""
+        from rasterio.enums import Resampling
+        from rasterio.windows import Window
+
+        window = Window(x, y, width, height)
+        out_shape = (out_height or height, out_width or width)
+        pixels = self.dataset.read(self._indexes, window=window, out_shape=(3,) + out_shape,
+                                   resampling=Resampling.average)
+        mask = self.dataset.dataset_mask(window=window, out_shape=out_shape) > 0
+        return _to_uint8(np.moveaxis(pixels, 0, -1)), mask
+
+    def georeference(self):
+        crs = self.dataset.crs
+        if crs is None:
+            return None
+        try:
+            units_m = 1.0 if crs.is_geographic else crs.linear_units_factor[1]
+        except Exception:
+            units_m = 1.0
+        return {'crs': crs.to_string(), 'transform': list(self.dataset.transform)[:6],
+                'geographic': crs.is_geographic, 'units_m': units_m}
+
+    def close(self):
+        self.dataset.close()
+        self._env.__exit__(None, None, None)
+
+
+class MemmapSource:
+    """Uncompressed 8-bit striped TIFFs: the pixel data is memory mapped in place."""
+
+    reader = 'memmap'
+
+    def __init__(self, path):
+        # TiffImageFile rather than Image.open: no decompression-bomb check, it only reads the header
+        header = TiffImagePlugin.TiffImageFile(path)
+        try:
+            tags = header.tag_v2
+            self.width, self.height = header.size
+            samples = tags.get(277, 1)
+            strip_offsets = tags.get(273)
+            strip_counts = tags.get(279)
+            if tags.get(259, 1) != 1 or tags.get(284, 1) != 1 or tags.get(322) or not strip_offsets:
+                raise RasterUnsupported('Compressed, planar or tiled rasters need rasterio (pip install rasterio)')
+            if set(tags.get(258, (8,))) != {8} or samples not in (1, 3, 4) or tags.get(262) not in (1, 2):
+                raise RasterUnsupported('Only 8-bit greyscale/RGB(A) rasters can be read without rasterio')
+            if any(offset != strip_offsets[0] + sum(strip_counts[:i]) for i, offset in enumerate(strip_offsets)):
+                raise RasterUnsupported('Rasters with scattered strips need rasterio (pip install rasterio)')
+            self._geo_tags = {tag: tags.get(tag) for tag in (33550, 33922, 34264, 34735)}
+        finally:
+            header.close()
+        self.bands = samples
+        self._row_bytes = self.width * samples
+        self._offset = strip_offsets[0]
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._pixels = np.frombuffer(self._map, dtype=np.uint8, count=self.height * self._row_bytes,
+                                     offset=self._offset).reshape(self.height, self.width, samples)
+
+    def read(self, x, y, width, height, out_width=None, out_height=None):
+        """(RGB uint8 array, validity mask) of a window, resampled to out_width x out_height"""
+        window = np.array(self._pixels[y:y + height, x:x + width])
+        # The copy is all we need: let the kernel take back the mapped pages
+        start = (self._offset + y * self._row_bytes) // mmap.PAGESIZE * mmap.PAGESIZE
+        end = self._offset + (y + height) * self._row_bytes
+        self._map.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+        mask = window[:, :, 3] > 0 if self.bands == 4 else np.ones(window.shape[:2], dtype=bool)
+        rgb = window[:, :, :3] if self.bands >= 3 else np.repeat(window, 3, axis=2)
+        if (out_width or width, out_height or height) != (width, height):
+            size = (out_width, out_height)
+            rgb = np.asarray(Image.fromarray(rgb).resize(size, Image.Resampling.BOX))
+            mask = np.asarray(Image.fromarray(mask).resize(size, Image.Resampling.NEAREST))
+        return rgb, mask
+
+    def georeference(self):
+        return georeference_from_tags(self._geo_tags)
+
+    def close(self):
+        del self._pixels
+        self._map.close()
+        self._file.close()
+
+
+def open_raster(path):
+    """A windowed reader for the raster at ``path``: rasterio if installed, else the memory-mapped one"""
+    if raster_support() == 'rasterio':
+        return RasterioSource(path)
+    try:
+        return MemmapSource(path)
+    except (OSError, SyntaxError, KeyError, TypeError) as e:
+        raise RasterUnsupported(f'Unreadable raster: {str(e)}')
+
+
+# ---------------------------------------------------------------------------
+# Georeferencing
+# ---------------------------------------------------------------------------
+
+# ProjLinearUnitsGeoKey values: metre, foot, US survey foot
+LINEAR_UNITS_M = {9001: 1.0, 9002: 0.3048, 9003: 1200 / 3937}
+
+
+def georeference_from_tags(tags):
+    """{'crs', 'transform', 'geographic', 'units_m'} from GeoTIFF tags (33550 pixel scale, 33922 tiepoint,
+    34264 transformation matrix, 34735 GeoKey directory), or None"""
+    transform = None
+    if tags.get(34264):
+        m = tags[34264]
+        transform = [m[0], m[1], m[3], m[4], m[5], m[7]]
+    elif tags.get(33550) and tags.get(33922):
+        scale_x, scale_y = tags[33550][:2]
+        i, j, _, x, y = tags[33922][:5]
+        transform = [scale_x, 0.0, x - i * scale_x, 0.0, -scale_y, y + j * scale_y]
+    if transform is None:
+        return None
+
+    crs, geographic = None, False
+    keys = tags.get(34735) or ()
+    geokeys = {keys[n]: keys[n + 3] for n in range(4, len(keys) - 3, 4) if keys[n + 1] == 0}
+    if geokeys.get(3072) not in (None, 0, 32767):
+        crs = f"EPSG:{geokeys[3072]}"
+    elif geokeys.get(2048) not in (None, 0, 32767):
+        crs, geographic = f"EPSG:{geokeys[2048]}", True
+    return {'crs': crs, 'transform': [float(v) for v in transform], 'geographic': geographic,
+            'units_m': LINEAR_UNITS_M.get(geokeys.get(3076), 1.0)}
+
+
+def _apply_affine(transform, xs, ys):
+    a, b, c, d, e, f = transform
+    return [a * x + b * y + c for x, y in zip(xs, ys)], [d * x + e * y + f for x, y in zip(xs, ys)]
+
+
+def lonlat_transform(georef):
+    """Raster pixels -> [[lng, lat], ...] for a georeferenced raster, or None if it cannot be reprojected"""
+    if not georef or not georef.get('transform') or not georef.get('crs'):
+        return None
+    transform, crs = georef['transform'], georef['crs']
+    if crs.upper() in ('EPSG:4326', 'OGC:CRS84'):
+        reproject = None
+    else:
+        try:
+            from rasterio.warp import transform as reproject_points
+        except ImportError:
+            return None
+
+        def reproject(xs, ys):
+            return reproject_points(crs, 'EPSG:4326', xs, ys)
+
+    def to_lonlat(ring):
+        xs, ys = _apply_affine(transform, [x for x, _ in ring], [y for _, y in ring])
+        if reproject:
+            xs, ys = reproject(xs, ys)
+        coordinates = [[round(x, 8), round(y, 8)] for x, y in zip(xs, ys)]
+        # RFC 7946: exterior rings are counterclockwise
+        area = sum(p[0] * q[1] - q[0] * p[1] for p, q in zip(coordinates, coordinates[1:]))
+        return coordinates[::-1] if area < 0 else coordinates
+    return to_lonlat
+
+
+def ground_sample_distance(georef, width, height):
+    """Metres per pixel of a georeferenced raster (geometric mean of x and y), or None"""
+    if not georef or not georef.get('transform'):
+        return None
+    a, b, _, d, e, _ = georef['transform']
+    units_m = georef.get('units_m') or 1.0
+    pixel_x, pixel_y = math.hypot(a, d) * units_m, math.hypot(b, e) * units_m
+    if georef.get('geographic'):
+        # Degrees: measure one pixel at the centre of the raster
+        to_lonlat = lonlat_transform(georef)
+        if to_lonlat is None:
+            return None
+        from geometry import MEAN_EARTH_RADIUS
+
+        (lng0, lat0), (lng1, lat1), (lng2, lat2) = to_lonlat([(width / 2, height / 2), (width / 2 + 1, height / 2),
+                                                             (width / 2, height / 2 + 1)])[:3]
+        meters_per_degree = math.radians(1) * MEAN_EARTH_RADIUS
+        pixel_x = math.hypot((lng1 - lng0) * math.cos(math.radians(lat0)), lat1 - lat0) * meters_per_degree
+        pixel_y = math.hypot((lng2 - lng0) * math.cos(math.radians(lat0)), lat2 - lat0) * meters_per_degree
+    return math.sqrt(pixel_x * pixel_y) or None
+
+
+# ---------------------------------------------------------------------------
+# Tiling and the overview pyramid
+# ---------------------------------------------------------------------------
+
+def _tile_starts(length, tile_size, overlap):
+    stride = max(1, tile_size - overlap)
+    start = 0
+    while True:
+        yield start
+        if start + tile_size >= length:
+            return
+        start += stride
+
+
+def tile_grid(width, height, tile_size=RASTER_TILE_SIZE, overlap=RASTER_TILE_OVERLAP):
+    """[(col, row, x, y, w, h, core)] covering the raster; ``core`` is the (x0, y0, x1, y1) the tile owns"""
+    half = overlap / 2
+    grid = []
+    for row, y in enumerate(_tile_starts(height, tile_size, overlap)):
+        h = min(tile_size, height - y)
+        for col, x in enumerate(_tile_starts(width, tile_size, overlap)):
+            w = min(tile_size, width - x)
+            core = (x + half if x else 0, y + half if y else 0,
+                    x + w - half if x + w < width else width, y + h - half if y + h < height else height)
+            grid.append((col, row, x, y, w, h, core))
+    return grid
+
+
+def iter_tiles(source, grid, stats=None):
+    """Yield RasterTile (with a PIL image) for every tile with valid pixels, reading one window at a time"""
+    for col, row, x, y, w, h, core in grid:
+        pixels, mask = source.read(x, y, w, h)
+        if not mask.any():
+            if stats is not None:
+                stats['tiles_empty'] = stats.get('tiles_empty', 0) + 1
+            continue
+        yield RasterTile(col, row, x, y, Image.fromarray(pixels), core)
+        del pixels, mask
+
+
+def tile_predictions(tile, predictions, inference_width, inference_height):
+    """Predictions of a tile's inference image moved to raster pixels, keeping those centred in its core"""
+    scale_x = tile.image.width / float(inference_width)
+    scale_y = tile.image.height / float(inference_height)
+    x0, y0, x1, y1 = tile.core
+    kept = []
+    for prediction in predictions:
+        x = tile.x + prediction.get('x', 0) * scale_x
+        y = tile.y + prediction.get('y', 0) * scale_y
+        if not (x0 <= x < x1 and y0 <= y < y1):
+            continue
+        moved = dict(prediction, x=x, y=y, width=prediction.get('width', 0) * scale_x,
+                     height=prediction.get('height', 0) * scale_y)
+        if prediction.get('points'):
+            moved['points'] = [{'x': tile.x + p['x'] * scale_x, 'y': tile.y + p['y'] * scale_y}
+                               for p in prediction['points']]
+        kept.append(moved)
+    return kept
+
+
+def pyramid_levels(width, height, preview_size=RASTER_PREVIEW_SIZE):
+    """Number of overview levels: level k is 1/2**k of the raster, the last fits in preview_size"""
+    return max(1, math.ceil(math.log2(max(width, height) / preview_size)))
+
+
+def _level_size(width, height, level):
+    return max(1, math.ceil(width / 2 ** level)), max(1, math.ceil(height / 2 ** level))
+
+
+def pyramid_tile_path(directory, level, col, row):
+    return os.path.join(directory, 'pyramid', str(level), f"{col}_{row}.jpg")
+
+
+def build_pyramid(source, directory, tile_size=PYRAMID_TILE_SIZE):
+    """Write the overview pyramid and preview.jpg under ``directory``; returns the number of levels"""
+    levels = pyramid_levels(source.width, source.height)
+    for level in range(1, levels + 1):
+        os.makedirs(os.path.join(directory, 'pyramid', str(level)), exist_ok=True)
+        level_width, level_height = _level_size(source.width, source.height, level)
+        for row in range(math.ceil(level_height / tile_size)):
+            for col in range(math.ceil(level_width / tile_size)):
+                out_width = min(tile_size, level_width - col * tile_size)
+                out_height = min(tile_size, level_height - row * tile_size)
+                if level == 1:
+                    x, y = col * tile_size * 2, row * tile_size * 2
+                    pixels, _ = source.read(x, y, min(2 * tile_size, source.width - x),
+                                            min(2 * tile_size, source.height - y), out_width, out_height)
+                    tile = Image.fromarray(pixels)
+                else:
+                    # Four tiles of the level below, halved
+                    canvas = Image.new('RGB', (out_width * 2, out_height * 2))
+                    for dy in (0, 1):
+                        for dx in (0, 1):
+                            child = pyramid_tile_path(directory, level - 1, col * 2 + dx, row * 2 + dy)
+                            if os.path.exists(child):
+                                with Image.open(child) as child_image:
+                                    canvas.paste(child_image, (dx * tile_size, dy * tile_size))
+                    tile = canvas.resize((out_width, out_height), Image.Resampling.BOX)
+                tile.save(pyramid_tile_path(directory, level, col, row), 'JPEG', quality=PYRAMID_QUALITY)
+
+    # The top level is at most preview_size: stitch its tiles into one image
+    top_width, top_height = _level_size(source.width, source.height, levels)
+    preview = Image.new('RGB', (top_width, top_height))
+    for row in range(math.ceil(top_height / tile_size)):
+        for col in range(math.ceil(top_width / tile_size)):
+            with Image.open(pyramid_tile_path(directory, levels, col, row)) as tile:
+                preview.paste(tile, (col * tile_size, row * tile_size))
+    preview.save(os.path.join(directory, 'preview.jpg'), 'JPEG', quality=PYRAMID_QUALITY)
+    return levels
+
+
+# ---------------------------------------------------------------------------
+# Stored predictions
+# ---------------------------------------------------------------------------
+
+def store_tile(conn, raster_id, tile, predictions):
+    conn.execute('INSERT OR REPLACE INTO raster_tiles VALUES (?, ?, ?, ?, ?)',
+                 (raster_id, tile.col, tile.row, len(predictions), pack_predictions(predictions)))
+
+
+def iter_raster_predictions(db_path, raster_id):
+    """Every stored prediction of a raster, in raster pixels, one tile at a time"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        for (blob,) in conn.execute('SELECT predictions FROM raster_tiles WHERE raster_id = ? ORDER BY row, col',
+                                    (raster_id,)):
+            yield from unpack_predictions(blob)
+    finally:
+        conn.close()
+
+
+def expire_rasters(conn, folder=RASTER_FOLDER, retention_days=0, upload_expiry_hours=RASTER_UPLOAD_EXPIRY_HOURS):
+    """Delete abandoned uploads, failed rasters and, with retention_days, rasters older than that.
+
+    Failed rasters keep their (possibly multi-gigabyte) source until then,
+    so the status and error can still be read. Returns a report.
+    """
+    conditions = ["(status IN ('uploading', 'failed') AND updated_at < datetime('now', ?))"]
+    params = [f'-{upload_expiry_hours} hours']
+    if retention_days:
+        conditions.append("created_at < datetime('now', ?)")
+        params.append(f'-{retention_days} days')
+    ids = [row[0] for row in conn.execute(f"SELECT id FROM raster_ingests WHERE {' OR '.join(conditions)}", params)]
+    reclaimed = 0
+    for raster_id in ids:
+        directory = raster_dir(raster_id, folder)
+        for root, _, files in os.walk(directory):
+            reclaimed += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+        shutil.rmtree(directory, ignore_errors=True)
+        conn.execute('DELETE FROM raster_tiles WHERE raster_id = ?', (raster_id,))
+        conn.execute('DELETE FROM raster_ingests WHERE id = ?', (raster_id,))
+    conn.commit()
+    return {'rasters_deleted': len(ids), 'raster_bytes_reclaimed': reclaimed}
+
+
+def raster_summary(row):
+    """API view of a raster_ingests row"""
+    summary = {key: row[key] for key in ('id', 'job_id', 'filename', 'size', 'received', 'status', 'reader',
+                                         'width', 'height', 'bands', 'crs', 'gsd_cm', 'pyramid_levels',
+                                         'tiles_total', 'tiles_empty', 'tiles_analyzed', 'tiles_failed',
+                                         'prediction_count', 'error', 'created_at', 'finished_at')}
+    summary['transform'] = json.loads(row['transform']) if row['transform'] else None
+    summary['class_areas'] = json.loads(row['class_areas']) if row['class_areas'] else None
+    base = f"/api/rasters/{row['id']}"
+    summary['upload_url'] = f"{base}/data" if row['status'] == 'uploading' else None
+    summary['partial'] = row['status'] == 'done' and row['tiles_failed'] > 0
+    if row['pyramid_levels']:
+        summary['preview_url'] = f"{base}/preview.jpg"
+        summary['tile_url'] = f"{base}/tiles/{{level}}/{{col}}/{{row}}.jpg"
+        summary['pyramid_tile_size'] = PYRAMID_TILE_SIZE
+    if row['status'] == 'done':
+        summary['predictions_url'] = f"{base}/predictions"
+    return summary
+
+
+def is_raster_id(value):
+    """Raster ids are uuid4 hex strings; anything else never reaches the filesystem"""
+    return len(value) == 32 and all(c in '0123456789abcdef' for c in value)
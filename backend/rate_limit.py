@@ -0,0 +1,76 @@
+"""In-process token-bucket rate limiting.
+
+Limits are per gunicorn worker, which is enough to stop a single client
+from burning the CPU with password hashes; they are not a global quota.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+
+class RateLimiter:
+    """Token buckets keyed by arbitrary strings (``ip:...``, ``user:...``).
+
+    ``rate`` tokens are added per ``per`` seconds up to ``burst``.  Only the
+    ``max_keys`` most recently used buckets are remembered.
+    """
+
+    def __init__(self, rate, per=60.0, burst=None, max_keys=10000):
+        self.rate = float(rate)
+        self.per = float(per)
+        self.burst = float(burst or rate)
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key):
+        """Take one token for key. Returns 0 if allowed, else seconds until the next token."""
+        now = time.monotonic()
+        refill = self.rate / self.per
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * refill)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1 - tokens) / refill
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+LOGIN_LIMIT_PER_IP = int(os.getenv('LOGIN_LIMIT_PER_IP', '30'))            # attempts per minute
+LOGIN_LIMIT_PER_ACCOUNT = int(os.getenv('LOGIN_LIMIT_PER_ACCOUNT', '10'))  # attempts per minute
+
+ip_limiter = RateLimiter(LOGIN_LIMIT_PER_IP, per=60)
+account_limiter = RateLimiter(LOGIN_LIMIT_PER_ACCOUNT, per=60)
+
+
+# Proxies in front of the app that append to X-Forwarded-For. 0 trusts no header and
+# uses the socket address; behind Render's load balancer set 1 (render.yaml does)
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', '0'))
+
+
+def client_ip(request):
+    """Client address as seen by the trusted proxy.
+
+    Entries before the ones our proxies appended come from the client and
+    can be anything, so a fresh fake X-Forwarded-For must not buy a fresh
+    bucket: take the hop TRUSTED_PROXY_HOPS from the end.
+    """
+    forwarded = [hop.strip() for hop in request.headers.get('X-Forwarded-For', '').split(',') if hop.strip()]
+    if TRUSTED_PROXY_HOPS and len(forwarded) >= TRUSTED_PROXY_HOPS:
+        return forwarded[-TRUSTED_PROXY_HOPS]
+    return request.remote_addr or 'unknown'
+
+
+def check_auth_rate(request, account=None):
+    """Seconds the caller must wait before another auth attempt, or 0."""
+    wait = ip_limiter.hit(f"ip:{client_ip(request)}")
+    if account and not wait:
+        wait = account_limiter.hit(f"user:{account.lower()}")
+    return wait
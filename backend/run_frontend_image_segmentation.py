@@ -4,6 +4,7 @@ import os
 import json
 from dotenv import load_dotenv
 import app
+import inference_backends
 
 
 def main():
@@ -12,7 +13,7 @@ def main():
     load_dotenv(dotenv_path=os.path.join(backend_dir, ".env"))
 
     # After loading env, make sure the imported app module sees the values
-    app.ROBOFLOW_API_KEY = os.getenv("ROBOFLOW_API_KEY") or "RlnFmttALS6BQzCy3M6d"
+    inference_backends.ROBOFLOW_API_KEY = os.getenv("ROBOFLOW_API_KEY") or "RlnFmttALS6BQzCy3M6d"
     model_id = os.getenv("ROBOFLOW_MODEL_ID") or "agridroneinsightdetection-zcptl/4"
 
     # Absolute path provided by you (fallback to relative if needed)
@@ -0,0 +1,171 @@
+"""Per-user daily statistics, rolled up as analyses are stored.
+
+``daily_stats`` keeps one row per user and capture day (number of analyses,
+detections, sum of readiness scores).  ``daily_class_stats`` keeps one row
+per user, day and class (detections, confidence sum, pixel and real-world
+area).  Both are updated in the same transaction as the analysis insert, so
+``/api/stats`` only reads a few hundred rows for a year of data instead of
+re-parsing every stored result.
+
+Rollups are history: retention deleting old analyses does not rewrite them.
+"""
+
+import json
+
+from class_styles import class_category
+from ground_area import prediction_areas
+
+
+def readiness_score(predictions, areas=None):
+    """Crop readiness 0-100, the Dashboard's computeReadiness() formula."""
+    if not predictions:
+        return 0
+    if areas is None:
+        areas = prediction_areas(predictions)
+    by_category = {}
+    for prediction, area in zip(predictions, areas):
+        category = class_category(prediction.get('class'))
+        by_category[category] = by_category.get(category, 0.0) + max(0.0, float(area))
+    total = sum(by_category.values())
+    if total <= 0:
+        return 0
+
+    avg_conf = sum(p.get('confidence') or 0 for p in predictions) / len(predictions)
+    score = by_category.get('healthy', 0) / total * 100
+    score -= by_category.get('disease', 0) / total * 50
+    score -= by_category.get('pest', 0) / total * 40
+    score -= by_category.get('weed', 0) / total * 25
+    score += (avg_conf - 0.5) * 30
+    # Math.round semantics (halves round up)
+    return int(max(0.0, min(100.0, score)) + 0.5)
+
+
+def ensure_stats_tables(cursor):
+    """Create the rollup tables; returns True if they were just created."""
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'daily_stats'").fetchone() is not None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            analyses INTEGER NOT NULL DEFAULT 0,
+            detections INTEGER NOT NULL DEFAULT 0,
+            readiness_sum REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_class_stats (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            class_name TEXT NOT NULL,
+            analyses INTEGER NOT NULL DEFAULT 0,
+            detections INTEGER NOT NULL DEFAULT 0,
+            confidence_sum REAL NOT NULL DEFAULT 0,
+            pixel_area REAL NOT NULL DEFAULT 0,
+            area_m2 REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day, class_name)
+        ) WITHOUT ROWID
+    ''')
+    return not exists
+
+
+def record_analysis(cursor, user_id, day, predictions):
+    """Fold one stored analysis into the rollups."""
+    predictions = predictions or []
+    areas = prediction_areas(predictions) if predictions else []
+    cursor.execute('''
+        INSERT INTO daily_stats (user_id, day, analyses, detections, readiness_sum)
+        VALUES (?, ?, 1, ?, ?)
+        ON CONFLICT (user_id, day) DO UPDATE SET
+            analyses = analyses + 1,
+            detections = detections + excluded.detections,
+            readiness_sum = readiness_sum + excluded.readiness_sum
+    ''', (user_id, day, len(predictions), readiness_score(predictions, areas)))
+
+    classes = {}
+    for prediction, area in zip(predictions, areas):
+        entry = classes.setdefault(prediction.get('class', 'unknown'), [0, 0.0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += prediction.get('confidence') or 0
+        entry[2] += float(area)
+        entry[3] += prediction.get('area_m2') or 0
+    cursor.executemany('''
+        INSERT INTO daily_class_stats
+        (user_id, day, class_name, analyses, detections, confidence_sum, pixel_area, area_m2)
+        VALUES (?, ?, ?, 1, ?, ?, ?, ?)
+        ON CONFLICT (user_id, day, class_name) DO UPDATE SET
+            analyses = analyses + 1,
+            detections = detections + excluded.detections,
+            confidence_sum = confidence_sum + excluded.confidence_sum,
+            pixel_area = pixel_area + excluded.pixel_area,
+            area_m2 = area_m2 + excluded.area_m2
+    ''', [(user_id, day, class_name, *entry) for class_name, entry in classes.items()])
+
+
+def rebuild_stats(cursor, analysis_day):
+    """Roll up every stored image analysis (first start after upgrading)."""
+    cursor.execute('DELETE FROM daily_stats')
+    cursor.execute('DELETE FROM daily_class_stats')
+    rows = cursor.execute('''
+        SELECT user_id, date_time, analysis_result FROM analysis_records
+        WHERE original_image_path != ''
+    ''').fetchall()
+    for user_id, date_time, analysis_result in rows:
+        try:
+            predictions = json.loads(analysis_result or '{}').get('predictions') or []
+        except ValueError:
+            predictions = []
+        record_analysis(cursor, user_id, analysis_day(date_time), predictions)
+    if rows:
+        print(f"✅ Rolled up statistics for {len(rows)} existing analyses")
+
+
+def _period_expr(group):
+    # day is YYYY-MM-DD
+    return {'day': 'day', 'month': 'substr(day, 1, 7)', 'year': 'substr(day, 1, 4)'}[group]
+
+
+def query_stats(conn, user_id, date_from, date_to, group='day'):
+    """Totals, a per-period series and per-class figures between two days (inclusive)."""
+    rows = conn.execute(f'''
+        SELECT {_period_expr(group)}, SUM(analyses), SUM(detections), SUM(readiness_sum)
+        FROM daily_stats
+        WHERE user_id = ? AND day BETWEEN ? AND ?
+        GROUP BY 1 ORDER BY 1
+    ''', (user_id, date_from, date_to)).fetchall()
+    series = [{
+        'period': period,
+        'analyses': analyses,
+        'detections': detections,
+        'avg_readiness': round(readiness_sum / analyses) if analyses else 0,
+    } for period, analyses, detections, readiness_sum in rows]
+
+    classes = [{
+        'class': row[0],
+        'category': class_category(row[0]),
+        'analyses': row[1],
+        'detections': row[2],
+        'mean_confidence': round(row[3] / row[2], 4) if row[2] else None,
+        'pixel_area': round(row[4], 1),
+        'area_m2': round(row[5], 2),
+    } for row in conn.execute('''
+        SELECT class_name, SUM(analyses), SUM(detections), SUM(confidence_sum), SUM(pixel_area), SUM(area_m2)
+        FROM daily_class_stats
+        WHERE user_id = ? AND day BETWEEN ? AND ?
+        GROUP BY class_name ORDER BY SUM(detections) DESC
+    ''', (user_id, date_from, date_to))]
+
+    analyses = sum(row[1] for row in rows)
+    readiness_total = sum(row[3] for row in rows)
+    return {
+        'from': date_from,
+        'to': date_to,
+        'group': group,
+        'totals': {
+            'analyses': analyses,
+            'detections': sum(entry['detections'] for entry in series),
+            'avg_readiness': round(readiness_total / analyses) if analyses else 0,
+        },
+        'series': series,
+        'classes': classes,
+    }
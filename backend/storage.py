@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Sharded layout for the uploads folder.
+
+New files go to ``<UPLOAD_FOLDER>/ab/cd/<filename>`` where ``abcd`` are the
+first hex digits of the SHA-1 of the filename.  That keeps every directory
+small, so lookups, listings and backups stay fast as uploads grow into the
+hundreds of thousands.  Public URLs are unchanged (``/api/uploads/<filename>``),
+because the shard is derived from the name alone.
+
+Files from before the sharded layout are still found in the top level of
+the folder; ``python storage.py migrate`` (and every maintenance pass)
+moves them into shards and rewrites the paths stored in
+``analysis_records``.
+"""
+
+import os
+import hashlib
+import sqlite3
+
+
+def shard_dir(upload_folder, filename):
+    digest = hashlib.sha1(filename.encode('utf-8')).hexdigest()
+    return os.path.join(upload_folder, digest[:2], digest[2:4])
+
+
+def upload_path(upload_folder, filename):
+    """Where a new upload called ``filename`` should be written (creates the shard)."""
+    directory = shard_dir(upload_folder, filename)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, filename)
+
+
+def resolve_upload(upload_folder, filename):
+    """Directory holding ``filename``: its shard, or the flat folder for legacy files."""
+    directory = shard_dir(upload_folder, filename)
+    if os.path.exists(os.path.join(directory, filename)):
+        return directory
+    return upload_folder
+
+
+def migrate_flat_uploads(db_path, upload_folder):
+    """Move top-level files into their shards and repoint analysis_records at them.
+
+    Safe to re-run: files are moved with an atomic rename, and record paths
+    are rewritten from wherever the file now lives.
+    """
+    moved = {}
+    if os.path.isdir(upload_folder):
+        with os.scandir(upload_folder) as entries:
+            for entry in entries:
+                if not entry.is_file(follow_symlinks=False) or entry.name.startswith('.'):
+                    continue
+                target = upload_path(upload_folder, entry.name)
+                os.replace(entry.path, target)
+                moved[entry.name] = target
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    updated = 0
+    try:
+        rows = conn.execute(
+            'SELECT id, original_image_path, result_image_path FROM analysis_records'
+        ).fetchall()
+        for record_id, original, result in rows:
+            new_original = _sharded_location(upload_folder, original)
+            new_result = _sharded_location(upload_folder, result)
+            if (new_original, new_result) != (original, result):
+                conn.execute(
+                    'UPDATE analysis_records SET original_image_path = ?, result_image_path = ? WHERE id = ?',
+                    (new_original, new_result, record_id)
+                )
+                updated += 1
+        conn.commit()
+    finally:
+        conn.close()
+
+    print(f"📦 Upload migration: {len(moved)} files moved into shards, {updated} records updated")
+    return {'files_moved': len(moved), 'records_updated': updated}
+
+
+def _sharded_location(upload_folder, path):
+    if not path:
+        return path
+    filename = os.path.basename(path)
+    candidate = os.path.join(shard_dir(upload_folder, filename), filename)
+    if path == candidate:
+        return path  # already migrated, no need to touch the disk
+    return candidate if os.path.exists(candidate) else path
+
+
+if __name__ == "__main__":
+    import sys
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    if sys.argv[1:] != ['migrate']:
+        print("Usage: python storage.py migrate")
+        sys.exit(1)
+    data_dir = os.getenv('DATA_DIR', '.')
+    migrate_flat_uploads(os.path.join(data_dir, 'agridrone.db'), os.path.join(data_dir, 'uploads'))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Stream tokens (POST /api/events/token) open /api/events and nothing else.
+
+They travel in the /api/events URL, so proxies and access logs see them.
+Checks both servers on a throwaway database, without Roboflow:
+
+    flask       app.py routes: a stream token is refused in the
+                Authorization header of other routes, and a login token
+                is refused in the /api/events query string
+    asgi        asgi.py's own authentication (/api/analyze, /api/history)
+                refuses stream tokens too (needs starlette, httpx, a2wsgi)
+
+    python test_event_tokens.py
+"""
+
+import os
+import sys
+import tempfile
+
+os.environ['DATA_DIR'] = tempfile.mkdtemp()
+
+from app import app  # noqa: E402
+
+
+def tokens(client):
+    r = client.post('/api/register', json={'username': 'streamer', 'email': 'streamer@example.com',
+                                           'password': 'correct horse battery'})
+    login = r.get_json()['access_token']
+    r = client.post('/api/events/token', headers={'Authorization': f'Bearer {login}'})
+    return login, r.get_json()['token']
+
+
+def test_flask(client, login, stream):
+    try:
+        assert client.get('/api/history', headers={'Authorization': f'Bearer {login}'}).status_code == 200
+        status = client.get('/api/history', headers={'Authorization': f'Bearer {stream}'}).status_code
+        assert status == 400, f"stream token on /api/history: {status}"
+        status = client.get(f'/api/events?token={login}').status_code
+        assert status == 401, f"login token in the /api/events URL: {status}"
+        r = client.get(f'/api/events?token={stream}', buffered=False)
+        assert r.status_code == 200 and r.mimetype == 'text/event-stream', f"stream token on /api/events: {r.status_code}"
+        r.close()
+        print("✅ Flask: stream tokens only open /api/events")
+        return True
+    except AssertionError as e:
+        print(f"❌ Flask: {str(e)}")
+        return False
+
+
+def test_asgi(login, stream):
+    try:
+        import asgi
+        from starlette.testclient import TestClient
+    except ImportError as e:
+        print(f"⏭️  ASGI skipped ({str(e)})")
+        return True
+    try:
+        assert asgi._authenticate(f'Bearer {login}')[1] is None
+        user_id, error = asgi._authenticate(f'Bearer {stream}')
+        assert user_id is None and error[1] == 400, f"_authenticate accepted a stream token: {user_id}, {error}"
+        with TestClient(asgi.app) as client:
+            assert client.get('/api/history', headers={'Authorization': f'Bearer {login}'}).status_code == 200
+            status = client.get('/api/history', headers={'Authorization': f'Bearer {stream}'}).status_code
+            assert status == 400, f"stream token on /api/history: {status}"
+            status = client.post('/api/analyze', headers={'Authorization': f'Bearer {stream}'}).status_code
+            assert status == 400, f"stream token on /api/analyze: {status}"
+        print("✅ ASGI: stream tokens refused on /api/analyze and /api/history")
+        return True
+    except AssertionError as e:
+        print(f"❌ ASGI: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    client = app.test_client()
+    login, stream = tokens(client)
+    results = [test_flask(client, login, stream), test_asgi(login, stream)]
+    print(f"\n{sum(results)}/{len(results)} token checks passed")
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Encode time and wire size of the large JSON responses.
+
+Builds an /api/analyze response around each stored inference result
+(successful_api_result.json, real_api_response.json,
+frontend_image_result.json) and an /api/history page made of all of them,
+then reports
+
+    encode     time to serialise: Flask's stdlib encoder vs orjson
+    identity   bytes on the wire uncompressed
+    gzip, br   compressed bytes and compression time (as compression.py does it)
+
+orjson and brotli are optional; their columns are skipped when missing.
+
+    python test_json_payloads.py [history_entries]
+"""
+
+import os
+import sys
+import json
+import time
+import statistics
+
+from compression import GZIP_LEVEL, BROTLI_QUALITY, brotli, compress_bytes
+from fast_json import orjson, dumps
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = ['successful_api_result.json', 'real_api_response.json', 'frontend_image_result.json']
+HISTORY_ENTRIES = 50
+REPEAT = 20
+
+
+def timed(fn, *args):
+    """(median ms, result) over REPEAT calls"""
+    times = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        result = fn(*args)
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times), result
+
+
+def stdlib_dumps(obj):
+    # What jsonify() does outside debug mode
+    return json.dumps(obj, ensure_ascii=True, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def analyze_response(result, record_id=1):
+    return {
+        'message': 'Analysis completed successfully',
+        'record_id': record_id,
+        'model_id_used': 'agridroneinsightdetection-zcptl/4',
+        'analysis_result': result,
+        'original_image_url': f'/api/uploads/{record_id}.jpg',
+        'annotated_image_url': f'/api/uploads/annotated_{record_id}.jpg',
+        'metadata': {'drone_name': 'DJI Mavic 3M', 'date_time': '2025-07-01T09:30', 'location': 'North field',
+                     'field_size': 2.5, 'flight_time': 12.0, 'latitude': 14.5, 'longitude': 121.0},
+    }
+
+
+def history_response(results, entries=HISTORY_ENTRIES):
+    return {'history': [{
+        'id': i, 'drone_name': 'DJI Mavic 3M', 'date_time': '2025-07-01T09:30', 'location': 'North field',
+        'field_size': 2.5, 'flight_time': 12.0, 'created_at': '2025-07-01 09:31:02', 'inference_size': 1024,
+        'latitude': 14.5, 'longitude': 121.0, 'captured_at': None, 'altitude_m': None, 'camera_model': None,
+        'analysis_result': results[i % len(results)],
+    } for i in range(entries)]}
+
+
+def report(name, payload):
+    stdlib_ms, data = timed(stdlib_dumps, payload)
+    row = [name, f"{stdlib_ms:.2f}"]
+    row.append(f"{timed(dumps, payload)[0]:.2f}" if orjson else '-')
+    row.append(f"{len(data):,}")
+    gzip_ms, gzipped = timed(compress_bytes, data, 'gzip')
+    row.append(f"{len(gzipped):,} ({gzip_ms:.1f} ms)")
+    if brotli:
+        br_ms, brotlied = timed(compress_bytes, data, 'br')
+        row.append(f"{len(brotlied):,} ({br_ms:.1f} ms)")
+    else:
+        row.append('-')
+    return row
+
+
+def main(history_entries=HISTORY_ENTRIES):
+    results = []
+    for name in FIXTURES:
+        with open(os.path.join(HERE, name)) as f:
+            results.append(json.load(f))
+
+    header = ['payload', 'stdlib ms', 'orjson ms', 'identity B', f'gzip-{GZIP_LEVEL} B', f'br-{BROTLI_QUALITY} B']
+    rows = [report(f"analyze {name.split('.')[0]}", analyze_response(result)) for name, result in zip(FIXTURES, results)]
+    rows.append(report(f"history x{history_entries}", history_response(results, history_entries)))
+
+    widths = [max(len(str(r[i])) for r in rows + [header]) for i in range(len(header))]
+    for row in [header] + rows:
+        print('  '.join(str(cell).rjust(width) if i else str(cell).ljust(width)
+                        for i, (cell, width) in enumerate(zip(row, widths))))
+    if not orjson:
+        print("\norjson is not installed (pip install orjson): responses use the stdlib encoder")
+    if not brotli:
+        print("brotli is not installed (pip install brotli): responses use gzip")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else HISTORY_ENTRIES)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Login latency under analysis load.
+
+Measures /api/login latency against a running backend, first on its own and
+then while several /api/analyze uploads are in flight, and prints both so
+you can check that logins stay flat while the CPU-heavy analysis runs.
+
+    python test_login_load.py [base_url] [analysis_threads] [logins]
+"""
+
+import os
+import sys
+import time
+import uuid
+import threading
+import statistics
+
+import requests
+
+BASE_URL = os.getenv('API_URL', 'http://localhost:5000')
+ANALYSIS_THREADS = 4
+LOGINS = 20
+# Pace requests to stay under the server's per-IP login limit so we measure hashing, not 429s
+LOGIN_INTERVAL = 60.0 / int(os.getenv('LOGIN_LIMIT_PER_IP', '30')) + 0.1
+# ...and rotate accounts so none of them reaches the per-account limit either
+ACCOUNTS = int(os.getenv('LOGIN_LIMIT_PER_IP', '30')) // int(os.getenv('LOGIN_LIMIT_PER_ACCOUNT', '10')) + 1
+TEST_IMAGE = os.path.join(os.path.dirname(__file__), 'test_crop_field.jpg')
+
+
+def register_user():
+    username = f"load_{uuid.uuid4().hex[:8]}"
+    password = uuid.uuid4().hex
+    response = requests.post(f"{BASE_URL}/api/register", json={
+        'username': username,
+        'email': f"{username}@example.com",
+        'password': password
+    }, timeout=30)
+    response.raise_for_status()
+    return username, password, response.json()['access_token']
+
+
+def measure_logins(accounts, count):
+    latencies = []
+    statuses = {}
+    for i in range(count):
+        username, password, _ = accounts[i % len(accounts)]
+        started = time.perf_counter()
+        response = requests.post(f"{BASE_URL}/api/login", json={'username': username, 'password': password}, timeout=30)
+        latencies.append((time.perf_counter() - started) * 1000)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        time.sleep(LOGIN_INTERVAL)
+    return latencies, statuses
+
+
+def analysis_worker(token, stop):
+    headers = {'Authorization': f'Bearer {token}'}
+    form = {
+        'drone_name': 'Load Test Drone',
+        'date_time': '2025-01-01T09:00',
+        'location': 'Load test field',
+        'field_size': '1',
+        'flight_time': '1'
+    }
+    while not stop.is_set():
+        with open(TEST_IMAGE, 'rb') as image_file:
+            try:
+                requests.post(f"{BASE_URL}/api/analyze", headers=headers, data=form,
+                              files={'image': ('field.jpg', image_file, 'image/jpeg')}, timeout=180)
+            except requests.RequestException as e:
+                print(f"⚠️  Analysis request failed: {e}")
+
+
+def summarize(label, latencies, statuses):
+    latencies = sorted(latencies)
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(f"{label}: p50 {statistics.median(latencies):.0f} ms, p95 {p95:.0f} ms, max {latencies[-1]:.0f} ms, statuses {statuses}")
+    return statistics.median(latencies)
+
+
+def main():
+    print(f"🔧 Target: {BASE_URL}")
+    accounts = [register_user() for _ in range(ACCOUNTS)]
+    token = accounts[0][2]
+    print(f"👤 Registered {len(accounts)} test accounts")
+
+    print(f"⏱️  Measuring {LOGINS} logins with no other load...")
+    idle = summarize("Idle    ", *measure_logins(accounts, LOGINS))
+
+    print(f"🚁 Starting {ANALYSIS_THREADS} analysis threads...")
+    stop = threading.Event()
+    threads = [threading.Thread(target=analysis_worker, args=(token, stop), daemon=True) for _ in range(ANALYSIS_THREADS)]
+    for thread in threads:
+        thread.start()
+    time.sleep(2)
+
+    try:
+        print(f"⏱️  Measuring {LOGINS} logins during analysis...")
+        loaded = summarize("Analysis", *measure_logins(accounts, LOGINS))
+    finally:
+        stop.set()
+
+    ratio = loaded / idle if idle else float('inf')
+    print(f"📊 Median login latency under load is {ratio:.2f}x idle")
+    if ratio < 1.5:
+        print("✅ Login latency stays flat while analyses run")
+    else:
+        print("❌ Login latency degrades under analysis load")
+
+
+if __name__ == "__main__":
+    BASE_URL = sys.argv[1] if len(sys.argv) > 1 else BASE_URL
+    ANALYSIS_THREADS = int(sys.argv[2]) if len(sys.argv) > 2 else ANALYSIS_THREADS
+    LOGINS = int(sys.argv[3]) if len(sys.argv) > 3 else LOGINS
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Deterministic checks of the near-duplicate search in perceptual_hash.py.
+
+No Roboflow key or model needed; everything runs on an in-memory SQLite
+database:
+
+    recall      the band multi-index finds exactly what a brute-force
+                Hamming scan finds, for every distance up to
+                DUPLICATE_DISTANCE, including bits spread over 7 bytes
+    scope       other users' and old uploads are never returned
+    dhash       a re-encoded, resized copy of an image stays within
+                DUPLICATE_DISTANCE bits; a different image does not
+
+    python test_perceptual_hash.py
+"""
+
+import io
+import sys
+import random
+import sqlite3
+
+import numpy as np
+from PIL import Image
+
+from perceptual_hash import (DUPLICATE_DISTANCE, HASH_BANDS, dhash, ensure_hash_tables, find_near_duplicate,
+                             hamming, index_hash, to_signed)
+
+STORED = 2000
+PROBES_PER_DISTANCE = 200
+
+
+def make_db(rng, users=(1, 2)):
+    """In-memory database with STORED random hashes per user; returns (conn, {user: {id: hash}})"""
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE analysis_records (id INTEGER PRIMARY KEY, user_id INTEGER, phash INTEGER, '
+                 'created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
+    ensure_hash_tables(conn)
+    hashes = {}
+    for user_id in users:
+        hashes[user_id] = {}
+        for _ in range(STORED):
+            value = rng.getrandbits(64)  # about half have the top bit set: stored as negative integers
+            analysis_id = conn.execute('INSERT INTO analysis_records (user_id, phash) VALUES (?, ?)',
+                                       (user_id, to_signed(value))).lastrowid
+            index_hash(conn, analysis_id, user_id, value)
+            hashes[user_id][analysis_id] = value
+    conn.commit()
+    return conn, hashes
+
+
+def brute_force(hashes, value, max_distance):
+    """What find_near_duplicate should return: the closest hash, the latest upload on ties"""
+    best = min(((hamming(value, stored), -analysis_id) for analysis_id, stored in hashes.items()), default=None)
+    if best is None or best[0] > max_distance:
+        return None
+    return -best[1], best[0]
+
+
+def flip(rng, value, distance, spread=False):
+    """value with ``distance`` bits flipped; with spread, in as many different bytes as possible"""
+    if spread:
+        bytes_ = rng.sample(range(8), min(distance, 8))
+        positions = [8 * b + rng.randrange(8) for b in bytes_]
+        positions += rng.sample(sorted(set(range(64)) - set(positions)), distance - len(positions))
+    else:
+        positions = rng.sample(range(64), distance)
+    for position in positions:
+        value ^= 1 << position
+    return value
+
+
+def test_band_recall():
+    """Index lookups agree with a full Hamming scan at every distance the index covers"""
+    rng = random.Random(48)
+    conn, hashes = make_db(rng)
+    mine = hashes[1]
+    ids = sorted(mine)
+    try:
+        checked = 0
+        for max_distance in sorted({DUPLICATE_DISTANCE, HASH_BANDS - 1}):
+            for distance in range(max_distance + 1):
+                for n in range(PROBES_PER_DISTANCE):
+                    probe = flip(rng, mine[rng.choice(ids)], distance, spread=n % 2 == 0)
+                    expected = brute_force(mine, probe, max_distance)
+                    found = find_near_duplicate(conn, 1, probe, max_distance=max_distance)
+                    assert found == expected, f"distance {distance}: index {found}, scan {expected}"
+                    assert found is not None and found[1] <= distance
+                    checked += 1
+            # Unrelated hashes: nearly always nothing within reach, and both must agree on it
+            for _ in range(PROBES_PER_DISTANCE):
+                probe = rng.getrandbits(64)
+                assert find_near_duplicate(conn, 1, probe, max_distance=max_distance) == \
+                    brute_force(mine, probe, max_distance)
+        print(f"✅ Band index matches a full scan ({checked} probes, up to {HASH_BANDS - 1} bits, "
+              f"DUPLICATE_DISTANCE={DUPLICATE_DISTANCE})")
+        return True
+    except AssertionError as e:
+        print(f"❌ Band recall: {str(e)}")
+        return False
+    finally:
+        conn.close()
+
+
+def test_scope():
+    """Only the user's own uploads of the last recent_days are candidates"""
+    rng = random.Random(4848)
+    conn, hashes = make_db(rng)
+    try:
+        other_id, other = next(iter(hashes[2].items()))
+        assert find_near_duplicate(conn, 1, other) == brute_force(hashes[1], other, DUPLICATE_DISTANCE), \
+            "another user's upload was returned"
+        assert find_near_duplicate(conn, 2, other) == (other_id, 0)
+
+        conn.execute("UPDATE analysis_records SET created_at = datetime('now', '-40 days') WHERE id = ?", (other_id,))
+        assert find_near_duplicate(conn, 2, other, recent_days=30) == \
+            brute_force({k: v for k, v in hashes[2].items() if k != other_id}, other, DUPLICATE_DISTANCE), \
+            "old upload was returned"
+        assert find_near_duplicate(conn, 2, other, recent_days=60) == (other_id, 0)
+        print("✅ Searches stay within the user's recent uploads")
+        return True
+    except AssertionError as e:
+        print(f"❌ Search scope: {str(e)}")
+        return False
+    finally:
+        conn.close()
+
+
+def field_image(seed, size=(640, 480)):
+    """A smooth synthetic 'field': a few soft blobs on a gradient"""
+    rng = np.random.default_rng(seed)
+    ys, xs = np.mgrid[0:size[1], 0:size[0]].astype(np.float32)
+    image = 60 + 80 * xs / size[0] + 40 * ys / size[1]
+    for _ in range(6):
+        cx, cy, r = rng.uniform(0, size[0]), rng.uniform(0, size[1]), rng.uniform(40, 160)
+        image += rng.uniform(-60, 60) * np.exp(-((xs - cx) ** 2 + (ys - cy) ** 2) / (2 * r * r))
+    grey = np.clip(image, 0, 255).astype(np.uint8)
+    return Image.fromarray(np.stack([grey, np.clip(grey * 1.1, 0, 255).astype(np.uint8), grey // 2], axis=2))
+
+
+def test_dhash_near_duplicates():
+    try:
+        original = field_image(1)
+        buffer = io.BytesIO()
+        original.resize((320, 240), Image.Resampling.LANCZOS).save(buffer, 'JPEG', quality=60)
+        copy = Image.open(io.BytesIO(buffer.getvalue()))
+        distance = hamming(dhash(original), dhash(copy))
+        assert distance <= DUPLICATE_DISTANCE, f"re-encoded copy is {distance} bits away"
+        other = hamming(dhash(original), dhash(field_image(2)))
+        assert other > DUPLICATE_DISTANCE, f"a different image is only {other} bits away"
+        print(f"✅ dHash: re-encoded copy {distance} bits away, different image {other} bits")
+        return True
+    except AssertionError as e:
+        print(f"❌ dHash: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    results = [test_band_recall(), test_scope(), test_dhash_near_duplicates()]
+    print(f"\n{sum(results)}/{len(results)} perceptual hash checks passed")
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Deterministic checks of the raster tiling and GeoTIFF reading in raster_ingest.py.
+
+No Roboflow key, model or rasterio needed:
+
+    tiling      the tile cores partition the raster, and a detection seen by
+                several overlapping tiles is kept by exactly one of them
+    georef      the pixel -> CRS transform and CRS from GeoTIFF tags
+                (ModelPixelScale + ModelTiepoint, and ModelTransformation)
+    memmap      uncompressed strip TIFFs are read in place; files whose
+                strips are not back to back are rejected
+
+    python test_raster_ingest.py
+"""
+
+import os
+import sys
+import struct
+import random
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+from raster_ingest import (MemmapSource, RasterTile, RasterUnsupported, georeference_from_tags,
+                           ground_sample_distance, tile_grid, tile_predictions)
+
+# (width, height, tile_size, overlap): exact multiples, ragged edges, a last tile thinner than the overlap
+GRIDS = [(4096, 3072, 1024, 64), (5000, 3333, 1024, 64), (1994, 1000, 1024, 64), (700, 500, 1024, 64),
+         (1000, 1000, 256, 50), (257, 1025, 256, 17)]
+
+
+def test_tile_cores():
+    """Every pixel of the raster lies in the core of exactly one tile"""
+    try:
+        for width, height, tile_size, overlap in GRIDS:
+            grid = tile_grid(width, height, tile_size, overlap)
+            owners = np.zeros((height, width), dtype=np.uint8)
+            for col, row, x, y, w, h, (x0, y0, x1, y1) in grid:
+                assert 0 < w <= tile_size and 0 < h <= tile_size and x + w <= width and y + h <= height
+                assert x <= x0 < x1 <= x + w and y <= y0 < y1 <= y + h, f"core outside tile {col},{row}"
+                # Pixel centres (i + 0.5) inside the core, as tile_predictions tests them
+                xs = slice(int(np.ceil(x0 - 0.5)), int(np.ceil(x1 - 0.5)))
+                ys = slice(int(np.ceil(y0 - 0.5)), int(np.ceil(y1 - 0.5)))
+                owners[ys, xs] += 1
+            assert owners.min() == 1 and owners.max() == 1, f"{width}x{height}: pixels owned {owners.min()}-{owners.max()} times"
+        print(f"✅ Tile cores partition {len(GRIDS)} rasters")
+        return True
+    except AssertionError as e:
+        print(f"❌ Tile cores: {str(e)}")
+        return False
+
+
+def test_detections_counted_once():
+    """Detections in the overlaps are seen by up to four tiles but kept by one"""
+    rng = random.Random(50)
+    try:
+        for width, height, tile_size, overlap in GRIDS:
+            grid = tile_grid(width, height, tile_size, overlap)
+            # Random centres, plus a dense band around every tile edge where the overlaps are
+            centres = [(rng.uniform(0, width), rng.uniform(0, height)) for _ in range(2000)]
+            for _, _, x, y, w, h, _ in grid:
+                for edge in (x, x + w):
+                    centres += [(min(width - 0.01, max(0, edge + d)), rng.uniform(0, height))
+                                for d in np.arange(-overlap, overlap + 1, 0.5)]
+                for edge in (y, y + h):
+                    centres += [(rng.uniform(0, width), min(height - 0.01, max(0, edge + d)))
+                                for d in np.arange(-overlap, overlap + 1, 0.5)]
+
+            kept = {}
+            for col, row, x, y, w, h, core in grid:
+                tile = RasterTile(col, row, x, y, Image.new('RGB', (w, h)), core)
+                # Inference ran on a downscaled copy, as prepare_upload() does for large tiles
+                inference_w, inference_h = max(1, w // 2), max(1, h // 2)
+                predictions = [{'class': 'weed', 'confidence': 0.9, 'id': n,
+                                'x': (cx - x) * inference_w / w, 'y': (cy - y) * inference_h / h,
+                                'width': 4, 'height': 4}
+                               for n, (cx, cy) in enumerate(centres) if x <= cx < x + w and y <= cy < y + h]
+                for prediction in tile_predictions(tile, predictions, inference_w, inference_h):
+                    kept[prediction['id']] = kept.get(prediction['id'], 0) + 1
+                    cx, cy = centres[prediction['id']]
+                    assert abs(prediction['x'] - cx) < 1e-6 and abs(prediction['y'] - cy) < 1e-6
+
+            counts = [kept.get(n, 0) for n in range(len(centres))]
+            assert min(counts) == 1 and max(counts) == 1, \
+                f"{width}x{height}: {counts.count(0)} lost, {sum(c > 1 for c in counts)} counted twice"
+        print("✅ Every detection kept by exactly one tile")
+        return True
+    except AssertionError as e:
+        print(f"❌ Overlapping detections: {str(e)}")
+        return False
+
+
+def geokey_directory(*keys):
+    """GeoKeyDirectoryTag (34735) holding (key, value) SHORT entries"""
+    directory = [1, 1, 0, len(keys)]
+    for key, value in keys:
+        directory += [key, 0, 1, value]
+    return tuple(directory)
+
+
+def test_georeference_from_tags():
+    try:
+        # UTM 51N, 5 cm pixels, tie point at pixel (0, 0)
+        georef = georeference_from_tags({
+            33550: (0.05, 0.05, 0.0),
+            33922: (0.0, 0.0, 0.0, 280000.0, 1620000.0, 0.0),
+            34735: geokey_directory((1024, 1), (3072, 32651)),
+        })
+        assert georef['crs'] == 'EPSG:32651' and not georef['geographic'] and georef['units_m'] == 1.0
+        assert georef['transform'] == [0.05, 0.0, 280000.0, 0.0, -0.05, 1620000.0], georef['transform']
+        assert abs(ground_sample_distance(georef, 1000, 1000) - 0.05) < 1e-12
+
+        # The tie point may be any pixel: the origin is moved back to the raster's corner
+        georef = georeference_from_tags({
+            33550: (0.5, 0.25, 0.0),
+            33922: (10.0, 20.0, 0.0, 1000.0, 2000.0, 0.0),
+            34735: geokey_directory((3072, 2229), (3076, 9003)),
+        })
+        assert georef['transform'] == [0.5, 0.0, 995.0, 0.0, -0.25, 2005.0], georef['transform']
+        assert georef['crs'] == 'EPSG:2229' and abs(georef['units_m'] - 1200 / 3937) < 1e-12
+
+        # ModelTransformation (row-major 4x4), rotated, in WGS84 degrees
+        matrix = (1e-6, 2e-7, 0.0, 121.0,
+                  2e-7, -1e-6, 0.0, 14.6,
+                  0.0, 0.0, 0.0, 0.0,
+                  0.0, 0.0, 0.0, 1.0)
+        georef = georeference_from_tags({34264: matrix, 34735: geokey_directory((1024, 2), (2048, 4326))})
+        assert georef['crs'] == 'EPSG:4326' and georef['geographic']
+        assert georef['transform'] == [1e-6, 2e-7, 121.0, 2e-7, -1e-6, 14.6], georef['transform']
+
+        # No transform tags: not georeferenced; a transform without GeoKeys has no CRS
+        assert georeference_from_tags({34735: geokey_directory((3072, 32651))}) is None
+        assert georeference_from_tags({33550: (1.0, 1.0, 0.0), 33922: (0, 0, 0, 0, 0, 0)})['crs'] is None
+        print("✅ Georeferencing from GeoTIFF tags")
+        return True
+    except AssertionError as e:
+        print(f"❌ Georeferencing: {str(e)}")
+        return False
+
+
+def write_strip_tiff(path, pixels, rows_per_strip, gap=0):
+    """Uncompressed little-endian TIFF with ``gap`` bytes between consecutive strips"""
+    height, width, samples = pixels.shape
+    strips = [pixels[y:y + rows_per_strip].tobytes() for y in range(0, height, rows_per_strip)]
+    offsets, data = [], b''
+    for strip in strips:
+        offsets.append(8 + len(data))
+        data += strip + b'\0' * gap
+    ifd_offset = 8 + len(data)
+    extra_offset = ifd_offset + 2 + 11 * 12 + 4
+
+    extra = b''
+    def array(kind, values):
+        nonlocal extra
+        fmt, size = {3: ('H', 2), 4: ('I', 4)}[kind]
+        if len(values) * size <= 4:
+            return struct.pack(f'<{len(values)}{fmt}', *values).ljust(4, b'\0')
+        pointer = extra_offset + len(extra)
+        extra += struct.pack(f'<{len(values)}{fmt}', *values)
+        return struct.pack('<I', pointer)
+
+    entries = [
+        (256, 4, [width]), (257, 4, [height]), (258, 3, [8] * samples), (259, 3, [1]),
+        (262, 3, [2 if samples >= 3 else 1]), (273, 4, offsets), (277, 3, [samples]),
+        (278, 4, [rows_per_strip]), (279, 4, [len(strip) for strip in strips]), (284, 3, [1]),
+    ]
+    if samples == 4:
+        entries.append((338, 3, [2]))  # unassociated alpha
+    else:
+        entries.append((339, 3, [1] * samples))  # SampleFormat: unsigned
+    ifd = struct.pack('<H', len(entries))
+    for tag, kind, values in entries:
+        ifd += struct.pack('<HHI', tag, kind, len(values)) + array(kind, values)
+    ifd += struct.pack('<I', 0)
+    with open(path, 'wb') as f:
+        f.write(b'II*\0' + struct.pack('<I', ifd_offset) + data + ifd + extra)
+
+
+def test_memmap_source():
+    rng = np.random.default_rng(50)
+    directory = tempfile.mkdtemp()
+    try:
+        rgba = rng.integers(0, 256, size=(37, 53, 4), dtype=np.uint8)
+        rgba[:, :10, 3] = 0
+        path = os.path.join(directory, 'contiguous.tif')
+        write_strip_tiff(path, rgba, rows_per_strip=5)
+        source = MemmapSource(path)
+        try:
+            assert (source.width, source.height, source.bands) == (53, 37, 4)
+            pixels, mask = source.read(7, 11, 20, 13)
+            assert np.array_equal(pixels, rgba[11:24, 7:27, :3]), "window pixels differ"
+            assert np.array_equal(mask, rgba[11:24, 7:27, 3] > 0), "window mask differs"
+            assert source.georeference() is None
+        finally:
+            source.close()
+
+        grey = rng.integers(0, 256, size=(16, 16, 1), dtype=np.uint8)
+        path = os.path.join(directory, 'grey.tif')
+        write_strip_tiff(path, grey, rows_per_strip=16)
+        source = MemmapSource(path)
+        try:
+            pixels, mask = source.read(0, 0, 16, 16)
+            assert np.array_equal(pixels, np.repeat(grey, 3, axis=2)) and mask.all()
+        finally:
+            source.close()
+
+        path = os.path.join(directory, 'scattered.tif')
+        write_strip_tiff(path, rgba, rows_per_strip=5, gap=3)
+        try:
+            MemmapSource(path).close()
+            raise AssertionError("strips with gaps between them were accepted")
+        except RasterUnsupported as e:
+            assert 'scattered strips' in str(e), str(e)
+        print("✅ Memory-mapped reads, scattered strips rejected")
+        return True
+    except AssertionError as e:
+        print(f"❌ Memory-mapped source: {str(e)}")
+        return False
+    finally:
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    results = [test_tile_cores(), test_detections_counted_once(), test_georeference_from_tags(),
+               test_memmap_source()]
+    print(f"\n{sum(results)}/{len(results)} raster checks passed")
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Backend cold-start time.
+
+Starts fresh Python processes against a scratch data directory and, for
+each, reports how long it takes to
+
+    import     import app.py (which builds the app via create_app)
+    health     answer the first GET /api/health
+    history    answer the first authenticated GET /api/history
+    warm       finish the background warm-up (models, image pool)
+
+The first run starts from an empty directory, so it also creates the schema.
+Later runs show the usual restart of a worker on an existing database.
+
+    python test_startup_time.py [runs]
+"""
+
+import os
+import sys
+import json
+import tempfile
+import subprocess
+import statistics
+
+RUNS = 5
+
+CHILD = r'''
+import json, sqlite3, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+
+client = app.app.test_client()
+client.get('/api/health')
+health = time.perf_counter()
+
+conn = sqlite3.connect(app.DB_PATH)
+conn.execute("INSERT OR IGNORE INTO users (id, username, email, password_hash) VALUES (1, 'startup', 'startup@example.com', '-')")
+conn.commit()
+conn.close()
+with app.app.app_context():
+    token = app.create_access_token(identity='1')
+before = time.perf_counter()
+client.get('/api/history', headers={'Authorization': f'Bearer {token}'})
+history = time.perf_counter()
+
+app.warm_up_done.wait(120)
+warm = time.perf_counter()
+print('RESULT ' + json.dumps({
+    'import': (imported - started) * 1000,
+    'health': (health - imported) * 1000,
+    'history': (history - before) * 1000,
+    'warm': (warm - started) * 1000,
+}))
+'''
+
+
+def run_once(data_dir):
+    env = dict(os.environ, DATA_DIR=data_dir)
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            env=env, capture_output=True, text=True, timeout=300).stdout
+    # The warm-up thread prints too, and its lines can run into ours
+    for line in output.splitlines():
+        if 'RESULT ' in line:
+            return json.loads(line.split('RESULT ', 1)[1])
+    raise RuntimeError(f"Startup run failed:\n{output}")
+
+
+def main(runs=RUNS):
+    columns = ['import', 'health', 'history', 'warm']
+    print(f"{'run':<8}" + ''.join(f"{name + ' ms':>12}" for name in columns))
+    with tempfile.TemporaryDirectory() as data_dir:
+        results = []
+        for i in range(runs):
+            result = run_once(data_dir)
+            results.append(result)
+            label = 'cold' if i == 0 else f"#{i + 1}"
+            print(f"{label:<8}" + ''.join(f"{result[name]:>12.1f}" for name in columns))
+        if len(results) > 1:
+            print(f"{'median':<8}" + ''.join(
+                f"{statistics.median(r[name] for r in results[1:]):>12.1f}" for name in columns))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else RUNS)
@@ -0,0 +1,109 @@
+"""Cached user and token-revocation lookups for JWT-protected routes.
+
+Every authenticated request resolves its JWT identity to a user record and
+checks that the token has not been revoked.  Both answers are cached in
+process so that doing this on every request costs no SQLite round trip in
+the common case.
+
+Changes made through this module invalidate the local cache immediately;
+other gunicorn workers see them once their entries expire
+(``USER_CACHE_TTL`` / ``TOKEN_CACHE_TTL`` seconds).
+"""
+
+import os
+import time
+import sqlite3
+
+from ttl_cache import TTLCache
+
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '4096'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '60'))
+TOKEN_CACHE_TTL = float(os.getenv('TOKEN_CACHE_TTL', '30'))
+
+_db_path = None
+_users = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+_revoked = TTLCache(maxsize=USER_CACHE_SIZE * 4, ttl=TOKEN_CACHE_TTL)
+
+
+def init_user_cache(db_path):
+    global _db_path
+    _db_path = db_path
+
+
+def _connect():
+    conn = sqlite3.connect(_db_path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _load_user(user_id):
+    conn = _connect()
+    try:
+        row = conn.execute(
+            'SELECT id, username, email, created_at, tokens_valid_after FROM users WHERE id = ?',
+            (user_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+    return dict(row) if row else None
+
+
+def get_user(identity):
+    """User record for a JWT identity, or None if the account no longer exists."""
+    try:
+        user_id = int(identity)
+    except (TypeError, ValueError):
+        return None
+    return _users.get_or_load(user_id, _load_user)
+
+
+def invalidate_user(user_id):
+    _users.invalidate(int(user_id))
+
+
+def _load_revoked(jti):
+    conn = _connect()
+    try:
+        row = conn.execute('SELECT 1 FROM revoked_tokens WHERE jti = ?', (jti,)).fetchone()
+    finally:
+        conn.close()
+    return row is not None
+
+
+def is_token_revoked(jwt_payload):
+    """True if the token's user is gone, all of their tokens were revoked, or this jti was."""
+    user = get_user(jwt_payload.get('sub'))
+    if user is None:
+        return True
+    valid_after = user.get('tokens_valid_after')
+    if valid_after and jwt_payload.get('iat', 0) < valid_after:
+        return True
+    return _revoked.get_or_load(jwt_payload['jti'], _load_revoked)
+
+
+def revoke_token(jwt_payload):
+    """Revoke a single token (logout)."""
+    conn = _connect()
+    try:
+        conn.execute(
+            'INSERT OR IGNORE INTO revoked_tokens (jti, user_id, expires_at) VALUES (?, ?, ?)',
+            (jwt_payload['jti'], int(jwt_payload['sub']), jwt_payload.get('exp'))
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    # Revocations are permanent, so the positive answer can be cached for the token's lifetime
+    remaining = max(1.0, jwt_payload.get('exp', time.time()) - time.time())
+    _revoked.set(jwt_payload['jti'], True, ttl=remaining)
+
+
+def revoke_all_tokens(user_id):
+    """Revoke every token issued to a user up to now (logout everywhere)."""
+    conn = _connect()
+    try:
+        # iat has one-second resolution; round up so tokens from this second are covered
+        conn.execute('UPDATE users SET tokens_valid_after = ? WHERE id = ?', (int(time.time()) + 1, int(user_id)))
+        conn.commit()
+    finally:
+        conn.close()
+    invalidate_user(user_id)
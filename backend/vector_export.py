@@ -0,0 +1,174 @@
+"""Predictions of a stored analysis as vector overlays (GeoJSON or SVG).
+
+Map and canvas views draw the polygons themselves instead of downloading a
+baked-in annotated image.  Both formats are generated one prediction at a
+time from the stored inference result, so they can be streamed (and
+compressed, see compression.py) as they are written.
+
+Predictions are in the pixels of the image sent to inference.  GeoJSON
+comes in one of two coordinate systems:
+
+* ``pixel``: pixels of the original photo, origin top-left, y down.
+* ``geo``: WGS84 longitude/latitude.  The photo is taken to be a nadir shot
+  centred on the record's position, with the stored ground sample distance
+  and the drone's flight yaw (north-up when unknown).  At field scale an
+  equirectangular projection around the centre is exact enough.
+
+SVG uses the inference pixels as its viewBox and the original photo's size
+as its width/height, so it lays over the original image.  Its colors, line
+widths and labels match annotate_image.
+"""
+
+import json
+import math
+from xml.sax.saxutils import escape, quoteattr
+
+from class_styles import class_category, class_colors
+
+COORDINATE_SYSTEMS = ('pixel', 'geo')
+
+# Same as annotate_image: fill alpha, outline width, label padding
+FILL_ALPHA = 80
+OUTLINE_WIDTH = 4
+LABEL_PADDING = 6
+
+
+def _hex(color):
+    return '#%02x%02x%02x' % tuple(color)
+
+
+def prediction_ring(prediction, width, height):
+    """Closed outline of a prediction in inference pixels: its polygon, or its box"""
+    points = prediction.get('points') or []
+    if len(points) >= 3:
+        ring = [(max(0, min(p['x'], width - 1)), max(0, min(p['y'], height - 1))) for p in points]
+    else:
+        x, y = prediction.get('x', 0), prediction.get('y', 0)
+        w, h = prediction.get('width', 0), prediction.get('height', 0)
+        if w <= 0 or h <= 0:
+            return None
+        left, top = max(0, x - w / 2), max(0, y - h / 2)
+        right, bottom = min(width, x + w / 2), min(height, y + h / 2)
+        ring = [(left, top), (right, top), (right, bottom), (left, bottom)]
+    return ring + [ring[0]]
+
+
+def pixel_transform(scale):
+    """Inference pixels -> original-photo pixels"""
+    def transform(ring):
+        return [[round(x * scale, 2), round(y * scale, 2)] for x, y in ring]
+    return transform
+
+
+def geo_transform(latitude, longitude, gsd_m, original_width, original_height, yaw_deg=0.0, scale=1.0):
+    """Inference pixels -> [lng, lat] for a nadir photo centred on (latitude, longitude)"""
+    from geometry import MEAN_EARTH_RADIUS
+
+    meters_per_pixel = gsd_m * scale
+    center_x, center_y = original_width / 2 / scale, original_height / 2 / scale
+    sin_yaw, cos_yaw = math.sin(math.radians(yaw_deg)), math.cos(math.radians(yaw_deg))
+    meters_per_degree_lat = math.radians(1) * MEAN_EARTH_RADIUS
+    meters_per_degree_lng = meters_per_degree_lat * math.cos(math.radians(latitude))
+
+    def transform(ring):
+        coordinates = []
+        for x, y in ring:
+            # Image right/up in meters, rotated so that "up" points along the flight yaw
+            right = (x - center_x) * meters_per_pixel
+            up = (center_y - y) * meters_per_pixel
+            east = right * cos_yaw + up * sin_yaw
+            north = up * cos_yaw - right * sin_yaw
+            coordinates.append([round(longitude + east / meters_per_degree_lng, 8),
+                                round(latitude + north / meters_per_degree_lat, 8)])
+        # RFC 7946: exterior rings are counterclockwise
+        area = sum(a[0] * b[1] - b[0] * a[1] for a, b in zip(coordinates, coordinates[1:]))
+        return coordinates[::-1] if area < 0 else coordinates
+    return transform
+
+
+def prediction_properties(prediction):
+    fill, outline = class_colors(prediction.get('class', 'Unknown'))
+    properties = {
+        'class': prediction.get('class', 'Unknown'),
+        'category': class_category(prediction.get('class')),
+        'confidence': prediction.get('confidence', 0),
+        'detection_id': prediction.get('detection_id'),
+        # simplestyle-spec names, understood by most map viewers
+        'fill': _hex(fill),
+        'fill-opacity': round(FILL_ALPHA / 255, 3),
+        'stroke': _hex(outline),
+        'stroke-width': OUTLINE_WIDTH,
+    }
+    if 'area_m2' in prediction:
+        properties['area_m2'] = prediction['area_m2']
+    return properties
+
+
+def geojson_chunks(result, transform, properties=None):
+    """A FeatureCollection, one feature per chunk"""
+    image = result.get('image') or {}
+    width, height = image.get('width') or float('inf'), image.get('height') or float('inf')
+    yield '{"type":"FeatureCollection"'
+    if properties:
+        yield ',"properties":' + json.dumps(properties)
+    yield ',"features":['
+    separator = ''
+    for prediction in result.get('predictions') or []:
+        ring = prediction_ring(prediction, width, height)
+        if ring is None:
+            continue
+        feature = {
+            'type': 'Feature',
+            'geometry': {'type': 'Polygon', 'coordinates': [transform(ring)]},
+            'properties': prediction_properties(prediction),
+        }
+        yield separator + json.dumps(feature, separators=(',', ':'))
+        separator = ','
+    yield ']}'
+
+
+def svg_chunks(result, original_width=None, original_height=None):
+    """An SVG document, one prediction per chunk"""
+    from image_processing import get_renderer
+
+    image = result.get('image') or {}
+    width, height = image.get('width'), image.get('height')
+    if not width or not height:
+        raise ValueError('Stored result has no image size')
+    font_size = max(16, min(32, width // 50))
+    font = get_renderer().font(font_size)
+    ascent = font.getmetrics()[0] if hasattr(font, 'getmetrics') else 0
+
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" '
+           f'width="{original_width or width}" height="{original_height or height}" '
+           'preserveAspectRatio="none">\n'
+           f'<g font-family="sans-serif" font-size="{font_size}" stroke-linejoin="round">\n')
+    for prediction in result.get('predictions') or []:
+        ring = prediction_ring(prediction, width, height)
+        if ring is None:
+            continue
+        class_name = prediction.get('class', 'Unknown')
+        fill, outline = class_colors(class_name)
+        points = ' '.join(f'{x:g},{y:g}' for x, y in ring[:-1])
+        has_polygon = len(prediction.get('points') or []) >= 3
+        parts = [f'<g class={quoteattr(class_category(class_name))}>',
+                 f'<polygon points="{points}" fill="{_hex(fill) if has_polygon else "none"}" '
+                 f'fill-opacity="{FILL_ALPHA / 255:.3f}" stroke="{_hex(outline)}" '
+                 f'stroke-width="{OUTLINE_WIDTH if has_polygon else 3}"/>']
+        if has_polygon:
+            # Label box on the vertex average, clamped inside the image, as in annotate_image
+            text = f"{class_name} {prediction.get('confidence', 0):.0%}"
+            left, top, right, bottom = font.getbbox(text)
+            label_width, label_height = right - left, bottom - top
+            center_x = sum(x for x, _ in ring[:-1]) // (len(ring) - 1)
+            center_y = sum(y for _, y in ring[:-1]) // (len(ring) - 1)
+            label_x = max(5, min(center_x - label_width // 2, width - label_width - 5))
+            label_y = max(5, min(center_y - label_height // 2, height - label_height - 5))
+            parts.append(f'<rect x="{label_x - LABEL_PADDING:g}" y="{label_y - LABEL_PADDING:g}" '
+                         f'width="{label_width + 2 * LABEL_PADDING}" height="{label_height + 2 * LABEL_PADDING}" '
+                         f'fill="{_hex(fill)}" stroke="#000000" stroke-width="2"/>')
+            parts.append(f'<text x="{label_x:g}" y="{label_y + ascent:g}" fill="#000000">{escape(text)}</text>')
+        parts.append('</g>\n')
+        yield ''.join(parts)
+    yield '</g>\n</svg>\n'
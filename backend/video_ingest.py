@@ -0,0 +1,149 @@
+"""Video ingestion: sample still frames from a flight video for analysis.
+
+Frames are decoded one at a time as a stream (PyAV, ``pip install av``), so
+memory does not grow with the length of the video.  A frame is sampled
+when
+
+* ``interval_s`` seconds have passed since the last sampled frame, or
+* its scene-change score reaches ``scene_threshold``: the mean absolute
+  difference, from 0 to 1, between small greyscale thumbnails of this frame
+  and the last sampled one.  A fast pan is sampled more densely than a
+  hover.
+
+A sampled frame whose dHash is within ``hash_distance`` bits of a frame
+already kept is a near-duplicate and is dropped.  Survivors go to inference
+with at most ``VIDEO_INFERENCE_CONCURRENCY`` frames in flight.  Decoding
+waits for a free slot, so frames never pile up in memory.
+"""
+
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from perceptual_hash import HASH_SIZE, dhash_pixels, hamming
+
+VIDEO_EXTENSIONS = {'mp4', 'mov', 'm4v', 'avi', 'mkv', 'webm'}
+VIDEO_SAMPLE_SECONDS = float(os.getenv('VIDEO_SAMPLE_SECONDS', '2'))
+VIDEO_SCENE_THRESHOLD = float(os.getenv('VIDEO_SCENE_THRESHOLD', '0.25'))
+VIDEO_HASH_DISTANCE = int(os.getenv('VIDEO_HASH_DISTANCE', '6'))
+VIDEO_MAX_FRAMES = int(os.getenv('VIDEO_MAX_FRAMES', '300'))
+VIDEO_INFERENCE_CONCURRENCY = int(os.getenv('VIDEO_INFERENCE_CONCURRENCY', '4'))
+# Videos ingested at once per worker; more get 429
+VIDEO_MAX_ACTIVE = int(os.getenv('VIDEO_MAX_ACTIVE', '2'))
+
+THUMB_WIDTH = 64
+
+SampledFrame = namedtuple('SampledFrame', 'index time_s image dhash scene_score')
+
+
+def is_video(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in VIDEO_EXTENSIONS
+
+
+def video_support():
+    """True when PyAV is installed"""
+    try:
+        import av  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def ensure_video_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS video_ingests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            job_id TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            status TEXT NOT NULL,
+            duration_s REAL,
+            frames_decoded INTEGER NOT NULL DEFAULT 0,
+            frames_sampled INTEGER NOT NULL DEFAULT 0,
+            frames_duplicate INTEGER NOT NULL DEFAULT 0,
+            frames_analyzed INTEGER NOT NULL DEFAULT 0,
+            frames_failed INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            source_file TEXT,
+            worker INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_video_ingests_user ON video_ingests (user_id, id)')
+
+
+def sample_frames(path, stats, interval_s=VIDEO_SAMPLE_SECONDS, scene_threshold=VIDEO_SCENE_THRESHOLD,
+                  hash_distance=VIDEO_HASH_DISTANCE, max_frames=VIDEO_MAX_FRAMES, keyframes_only=False):
+    """Yield SampledFrame for each kept frame of a video, decoding as it goes.
+
+    ``stats`` is updated in place: duration_s, frames_decoded,
+    frames_sampled, frames_duplicate and truncated (max_frames reached).
+    With ``keyframes_only`` the decoder skips everything but the codec's
+    keyframes, which is much faster when the interval exceeds the GOP.
+    """
+    import av
+
+    stats.update(duration_s=None, frames_decoded=0, frames_sampled=0, frames_duplicate=0, truncated=False)
+    with av.open(path) as container:
+        stream = container.streams.video[0]
+        stream.thread_type = 'AUTO'
+        if keyframes_only:
+            stream.codec_context.skip_frame = 'NONKEY'
+        if stream.duration and stream.time_base:
+            stats['duration_s'] = float(stream.duration * stream.time_base)
+        elif container.duration:
+            stats['duration_s'] = container.duration / av.time_base
+        frame_rate = float(stream.average_rate or 30)
+        thumb_height = max(HASH_SIZE, round(THUMB_WIDTH * stream.height / stream.width)) if stream.width else 36
+
+        kept_hashes = []
+        last_time, last_thumb = None, None
+        for index, frame in enumerate(container.decode(stream)):
+            stats['frames_decoded'] += 1
+            time_s = float(frame.time) if frame.time is not None else index / frame_rate
+            thumb = frame.reformat(width=THUMB_WIDTH, height=thumb_height, format='gray').to_ndarray()
+            thumb = thumb[:thumb_height, :THUMB_WIDTH].astype(np.int16)
+
+            scene_score = float(np.abs(thumb - last_thumb).mean() / 255) if last_thumb is not None else 1.0
+            due = last_time is None or time_s - last_time >= interval_s
+            if not due and not (scene_threshold and scene_score >= scene_threshold):
+                continue
+            last_time = time_s
+
+            small = Image.fromarray(thumb.astype(np.uint8)).resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX)
+            frame_hash = dhash_pixels(np.asarray(small))
+            if any(hamming(frame_hash, kept) <= hash_distance for kept in kept_hashes):
+                stats['frames_duplicate'] += 1
+                continue
+            if len(kept_hashes) >= max_frames:
+                stats['truncated'] = True
+                break
+
+            kept_hashes.append(frame_hash)
+            last_thumb = thumb
+            stats['frames_sampled'] += 1
+            yield SampledFrame(index, round(time_s, 3), frame.to_image(), frame_hash, round(scene_score, 4))
+
+
+def analyze_bounded(frames, analyze_frame, concurrency=VIDEO_INFERENCE_CONCURRENCY):
+    """analyze_frame(frame) for every frame, at most ``concurrency`` at a time.
+
+    Pulls the next frame from the iterator only when a slot is free, so
+    a lazy ``frames`` (sample_frames) holds at most ``concurrency`` decoded
+    images.  Returns the results in frame order.
+    """
+    slots = threading.BoundedSemaphore(concurrency)
+    futures = []
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='video-frame') as pool:
+        for frame in frames:
+            slots.acquire()
+            future = pool.submit(analyze_frame, frame)
+            future.add_done_callback(lambda _: slots.release())
+            futures.append(future)
+            del frame
+    return [future.result() for future in futures]
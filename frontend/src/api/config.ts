@@ -40,4 +40,68 @@ api.interceptors.response.use(
   }
 );
 
+// Server-Sent Events for the logged-in user. EventSource cannot send headers, so each connection
+// uses a short-lived stream token (POST /api/events/token) in the URL instead of the login token.
+// The browser would reconnect with the same, by then expired, URL; this reconnects with a new token.
+export class EventStream {
+  onopen: (() => void) | null = null;
+  onerror: (() => void) | null = null;
+  private source: EventSource | null = null;
+  private listeners: [string, (e: MessageEvent) => void][] = [];
+  private lastEventId = '';
+  private retry: ReturnType<typeof setTimeout> | null = null;
+  private closed = false;
+
+  constructor() {
+    this.connect();
+  }
+
+  addEventListener(type: string, listener: (e: MessageEvent) => void) {
+    const tracked = (e: MessageEvent) => {
+      if (e.lastEventId) this.lastEventId = e.lastEventId;
+      listener(e);
+    };
+    this.listeners.push([type, tracked]);
+    this.source?.addEventListener(type, tracked);
+  }
+
+  close() {
+    this.closed = true;
+    if (this.retry !== null) clearTimeout(this.retry);
+    this.source?.close();
+    this.source = null;
+  }
+
+  private async connect() {
+    try {
+      const res = await api.post('/api/events/token');
+      if (this.closed) return;
+      const resume = this.lastEventId ? `&last_event_id=${encodeURIComponent(this.lastEventId)}` : '';
+      const source = new EventSource(`${API_BASE_URL}/api/events?token=${encodeURIComponent(res.data.token)}${resume}`);
+      this.listeners.forEach(([type, listener]) => source.addEventListener(type, listener));
+      source.onopen = () => this.onopen?.();
+      source.onerror = () => {
+        source.close();
+        this.source = null;
+        this.reconnect();
+      };
+      this.source = source;
+    } catch {
+      this.reconnect();
+    }
+  }
+
+  private reconnect() {
+    if (this.closed) return;
+    this.onerror?.();
+    this.retry = setTimeout(() => this.connect(), 3000);
+  }
+}
+
+export const openEventStream = (): EventStream | null => {
+  const token = localStorage.getItem('access_token');
+  if (!token || typeof EventSource === 'undefined') return null;
+  return new EventStream();
+};
+
 export default api;
@@ -87,6 +87,11 @@ export const AuthProvider = ({ children }: AuthProviderProps) => {
   };
 
   const logout = () => {
+    // Revoke the token server-side too; the local session ends either way
+    const token = localStorage.getItem('access_token');
+    if (token) {
+      api.post('/api/logout', {}, { headers: { Authorization: `Bearer ${token}` } }).catch(() => {});
+    }
     localStorage.removeItem('access_token');
     localStorage.removeItem('user');
       // Token removal is handled automatically by api interceptor
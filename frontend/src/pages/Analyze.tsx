@@ -1,11 +1,17 @@
 import React, { useState, useRef } from 'react';
-import api from '../api/config';
+import api, { openEventStream } from '../api/config';
 
 interface AnalysisResult {
   record_id: number;
   analysis_result: any;
   original_image_url: string;
   annotated_image_url: string | null;
+  annotation?: {
+    format: 'jpeg' | 'webp' | 'overlay';
+    quality: number | null;
+    bytes: number;
+    encode_ms: number;
+  } | null;
   metadata: {
     drone_name: string;
     date_time: string;
@@ -34,6 +40,8 @@ const Analyze: React.FC = () => {
   const [isViewerOpen, setIsViewerOpen] = useState(false);
   const [harvestReadiness, setHarvestReadiness] = useState<{ percent: number; basis: string; recommendations: string[] }>({ percent: 0, basis: '', recommendations: [] });
   const fileInputRef = useRef<HTMLInputElement | null>(null);
+  // Overlay results are a transparent PNG of the drawings, shown on top of the original photo
+  const isOverlay = analysisResult?.annotation?.format === 'overlay' && !!analysisResult.annotated_image_url;
 
   const handleChangeImageClick = () => {
     if (fileInputRef.current) {
@@ -198,9 +206,9 @@ const Analyze: React.FC = () => {
         return;
       }
       // Check file type
-      const allowedTypes = ['image/png', 'image/jpeg', 'image/jpg', 'image/gif'];
+      const allowedTypes = ['image/png', 'image/jpeg', 'image/jpg', 'image/gif', 'image/tiff'];
       if (!allowedTypes.includes(file.type)) {
-        setError('Only PNG, JPG, JPEG, GIF files are allowed');
+        setError('Only PNG, JPG, JPEG, GIF, TIFF files are allowed');
         setSelectedFile(null);
         setImagePreview(null);
         return;
@@ -246,6 +254,23 @@ const Analyze: React.FC = () => {
     setLoadingMessage('Preparing image for analysis...');
     setError(null);
 
+    // Follow this upload's progress over the event stream
+    const jobId = `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+    const events = openEventStream();
+    const progress: Record<string, string> = {
+      'analysis.queued': 'Image uploaded, preparing for analysis...',
+      'analysis.resized': '⚡ Roboflow AI is analyzing your crop field...',
+      'analysis.inferred': 'Drawing detections on the image...',
+      'analysis.annotated': 'Saving results...',
+    };
+    Object.entries(progress).forEach(([type, message]) => {
+      events?.addEventListener(type, (e: MessageEvent) => {
+        try {
+          if (JSON.parse(e.data).job_id === jobId) setLoadingMessage(message);
+        } catch {}
+      });
+    });
+
     try {
       const formDataToSend = new FormData();
       formDataToSend.append('image', selectedFile);
@@ -257,9 +282,9 @@ const Analyze: React.FC = () => {
       formDataToSend.append('flight_time', formData.flight_time);
       formDataToSend.append('latitude', formData.latitude);
       formDataToSend.append('longitude', formData.longitude);
+      formDataToSend.append('job_id', jobId);
 
       setLoadingMessage('Uploading image and processing with AI model...');
-      setLoadingMessage('⚡ Roboflow AI is analyzing your crop field...');
       
       const response = await api.post('/api/analyze', formDataToSend, {
         headers: {
@@ -289,6 +314,7 @@ const Analyze: React.FC = () => {
       
       setError(errorMessage);
     } finally {
+      events?.close();
       setIsLoading(false);
       setLoadingMessage('');
     }
@@ -310,15 +336,35 @@ const Analyze: React.FC = () => {
       const baseUrl = String((api.defaults.baseURL || '')).replace(/\/$/, '');
       const url = `${baseUrl}${imagePath}`;
 
-      const response = await fetch(url);
-      if (!response.ok) {
-        throw new Error(`Download failed with status ${response.status}`);
-      }
+      const fetchBlob = async (blobUrl: string) => {
+        const response = await fetch(blobUrl);
+        if (!response.ok) {
+          throw new Error(`Download failed with status ${response.status}`);
+        }
+        return response.blob();
+      };
 
-      const blob = await response.blob();
+      let blob = await fetchBlob(url);
+      let filename = imagePath.split('/').pop() || 'analysis-image.jpg';
+      if (isOverlay) {
+        // Flatten the overlay onto the original so the download matches what is shown
+        const photo = await createImageBitmap(await fetchBlob(`${baseUrl}${analysisResult.original_image_url}`));
+        const overlay = await createImageBitmap(blob);
+        const canvas = document.createElement('canvas');
+        canvas.width = photo.width;
+        canvas.height = photo.height;
+        const context = canvas.getContext('2d');
+        if (!context) {
+          throw new Error('Canvas is not available');
+        }
+        context.drawImage(photo, 0, 0);
+        context.drawImage(overlay, 0, 0, photo.width, photo.height);
+        blob = await new Promise<Blob>((resolve, reject) =>
+          canvas.toBlob(result => (result ? resolve(result) : reject(new Error('Encoding failed'))), 'image/jpeg', 0.9));
+        filename = filename.replace(/\.png$/, '.jpg');
+      }
       const blobUrl = window.URL.createObjectURL(blob);
       const link = document.createElement('a');
-      const filename = imagePath.split('/').pop() || 'analysis-image.jpg';
 
       link.href = blobUrl;
       link.download = filename;
@@ -539,7 +585,7 @@ const Analyze: React.FC = () => {
                           <p className="pl-1">or drag and drop</p>
                         </div>
                         <p className="text-xs text-gray-500">
-                          PNG, JPG, JPEG, GIF up to 16MB
+                          PNG, JPG, JPEG, GIF, TIFF up to 16MB
                         </p>
                       </div>
                     </label>
@@ -696,12 +742,19 @@ const Analyze: React.FC = () => {
                       <div className="flex justify-center">
                         <div className="relative image-frame soft-hover max-w-7xl w-full mx-auto animate-fade-in">
                           <img
-                            src={`${String((api.defaults.baseURL || '')).replace(/\/$/, '')}${analysisResult.annotated_image_url || analysisResult.original_image_url}`}
+                            src={`${String((api.defaults.baseURL || '')).replace(/\/$/, '')}${isOverlay ? analysisResult.original_image_url : analysisResult.annotated_image_url || analysisResult.original_image_url}`}
                             alt="AI analysis result with instance segmentation polygons"
                             className="w-full h-auto object-contain cursor-zoom-in"
                             style={{ maxHeight: '80vh' }}
                             onClick={() => setIsViewerOpen(true)}
                           />
+                          {isOverlay && (
+                            <img
+                              src={`${String((api.defaults.baseURL || '')).replace(/\/$/, '')}${analysisResult.annotated_image_url}`}
+                              alt=""
+                              className="absolute inset-0 w-full h-full object-contain pointer-events-none"
+                            />
+                          )}
                           <div className="absolute bottom-3 right-3 flex gap-2">
                             <button
                               type="button"
@@ -795,11 +848,20 @@ const Analyze: React.FC = () => {
             >
               Close
             </button>
-            <img
-              src={`${String((api.defaults.baseURL || '')).replace(/\/$/, '')}${analysisResult.annotated_image_url || analysisResult.original_image_url}`}
-              alt="AI analysis result fullscreen"
-              className="max-w-full max-h-[85vh] object-contain mx-auto"
-            />
+            <div className="relative w-fit mx-auto">
+              <img
+                src={`${String((api.defaults.baseURL || '')).replace(/\/$/, '')}${isOverlay ? analysisResult.original_image_url : analysisResult.annotated_image_url || analysisResult.original_image_url}`}
+                alt="AI analysis result fullscreen"
+                className="max-w-full max-h-[85vh] object-contain mx-auto"
+              />
+              {isOverlay && (
+                <img
+                  src={`${String((api.defaults.baseURL || '')).replace(/\/$/, '')}${analysisResult.annotated_image_url}`}
+                  alt=""
+                  className="absolute inset-0 w-full h-full object-contain pointer-events-none"
+                />
+              )}
+            </div>
           </div>
         </div>
       )}
@@ -1,6 +1,6 @@
 import React, { useEffect, useMemo, useState } from 'react';
 import { Link } from 'react-router-dom';
-import api from '../api/config';
+import api, { openEventStream } from '../api/config';
 
 type HistoryItem = {
   id: number;
@@ -86,6 +86,7 @@ const Dashboard: React.FC = () => {
   const [items, setItems] = useState<HistoryItem[]>([]);
   const [loading, setLoading] = useState<boolean>(false);
   const [error, setError] = useState<string | null>(null);
+  const [live, setLive] = useState<boolean>(false);
 
   const fetchHistory = async () => {
     try {
@@ -102,8 +103,37 @@ const Dashboard: React.FC = () => {
 
   useEffect(() => {
     fetchHistory();
-    const id = setInterval(fetchHistory, 10000);
-    return () => clearInterval(id);
+    // Refresh when the server reports a new record; poll every 10s while the stream is unavailable
+    let pollId: ReturnType<typeof setInterval> | null = null;
+    const startPolling = () => {
+      setLive(false);
+      if (pollId === null) pollId = setInterval(fetchHistory, 10000);
+    };
+    const stopPolling = () => {
+      setLive(true);
+      if (pollId !== null) {
+        clearInterval(pollId);
+        pollId = null;
+      }
+    };
+
+    const events = openEventStream();
+    if (!events) {
+      startPolling();
+    } else {
+      events.addEventListener('analysis.stored', fetchHistory);
+      events.addEventListener('field_estimation.stored', fetchHistory);
+      events.onopen = () => {
+        if (pollId !== null) fetchHistory(); // reconnected: catch up on anything stored meanwhile
+        stopPolling();
+      };
+      // Fires on every drop; the stream reconnects on its own with a fresh token
+      events.onerror = startPolling;
+    }
+    return () => {
+      events?.close();
+      if (pollId !== null) clearInterval(pollId);
+    };
   }, []);
 
   const avgReadiness = useMemo(() => {
@@ -135,8 +165,10 @@ const Dashboard: React.FC = () => {
         </div>
         <div className="card-gradient">
           <div className="text-gray-600 text-sm">Auto-refresh</div>
-          <div className="text-2xl font-bold text-gray-900 mt-1">10s</div>
-          <p className="text-gray-600 mt-2 text-sm">Polling /api/history every 10 seconds</p>
+          <div className="text-2xl font-bold text-gray-900 mt-1">{live ? 'Live' : '10s'}</div>
+          <p className="text-gray-600 mt-2 text-sm">
+            {live ? 'Updates as soon as a new record is stored' : 'Polling /api/history every 10 seconds'}
+          </p>
         </div>
       </div>
 